@@ -1,4 +1,6 @@
-from controllers import app
+from controllers import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
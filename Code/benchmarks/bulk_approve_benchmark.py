@@ -0,0 +1,92 @@
+"""Time approving a queue of book requests: one request per page load against the bulk action.
+
+Seeds a scratch SQLite database with --requests pending requests (one book per
+user), approves them through the admin views and checks the resulting loans.
+Run from the Code folder:  python benchmarks/bulk_approve_benchmark.py --requests 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import text
+from controllers import create_app, db, bcrypt
+from models import BookRequest, IssuedBook
+
+app = create_app()
+
+
+def seed(requests):
+    db.drop_all()
+    db.create_all()
+    password = bcrypt.generate_password_hash('benchmark', 4).decode('utf-8')
+    with db.engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (user_id, username, email, password, is_admin, create_date) "
+                                "VALUES (1, 'admin', 'admin@example.com', :password, 1, CURRENT_TIMESTAMP)"),
+                           {'password': password})
+        connection.execute(text("INSERT INTO user (user_id, username, email, password, is_admin, create_date) "
+                                "VALUES (:id, 'u' || :id, 'u' || :id || '@example.com', 'x', 0, CURRENT_TIMESTAMP)"),
+                           [{'id': i} for i in range(2, requests + 2)])
+        connection.execute(text("INSERT INTO section (section_id, name, date_created, description) "
+                                "VALUES (1, 'Bench', CURRENT_TIMESTAMP, 'seed')"))
+        connection.execute(text("INSERT INTO book (book_id, name, description, author, file_name, section_id) "
+                                "VALUES (1, 'Book', 'seed', 'Author', 'seed.pdf', 1)"))
+        connection.execute(text("INSERT INTO book_request (user_id, book_id, request_date, return_date, status) "
+                                "VALUES (:id, 1, CURRENT_TIMESTAMP, '2030-01-01 00:00:00', 1)"),
+                           [{'id': i} for i in range(2, requests + 2)])
+
+
+def admin_client():
+    client = app.test_client()
+    with app.app_context():
+        client.post('/admin/login', data={'email': 'admin@example.com', 'password': 'benchmark'})
+    return client
+
+
+def per_request(client):
+    with app.app_context():
+        ids = db.session.scalars(db.select(BookRequest.request_id)).all()
+    for request_id in ids:
+        with app.app_context():
+            assert client.get(f'/admin/requests/{request_id}/approve').status_code == 302
+    return len(ids)
+
+
+def bulk(client):
+    with app.app_context():
+        # No filter: every pending request, which the form makes you confirm.
+        data = {'scope': 'filter', 'section': 0, 'everything': 'y', 'approve': 'Approve'}
+        response = client.post('/admin/requests/bulk', data=data, headers={'Accept': 'application/json'})
+    return response.get_json()['approved']
+
+
+def run(name, requests, approve):
+    with app.app_context():
+        seed(requests)
+    client = admin_client()
+    started = time.perf_counter()
+    approved = approve(client)
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+        loans, left = IssuedBook.query.count(), BookRequest.query.count()
+    print(f"{name:12} {approved} requests: {elapsed:8.2f}s  ({loans} loans, {left} requests left)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['PASSWORD_HASH_WORKERS'] = 0
+    app.config['LOAN_EXPIRY_INTERVAL'] = 10 ** 9
+    run('per request', args.requests, per_request)
+    run('bulk', args.requests, bulk)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Time deleting a large section: the old per-row cascade against the bulk statements.
+
+Run from the Code folder:  python benchmarks/delete_benchmark.py --books 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, text
+from controllers import db
+from controllers.catalog import cascade_delete_statements
+from models import Book
+
+DEPENDENTS = ('rating', 'issued_book', 'book_request', 'book_rating_stats')
+
+
+def seed(engine, books):
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (user_id, username, email, password, is_admin, create_date) "
+                                "VALUES (1, 'bench', 'bench@example.com', 'x', 0, CURRENT_TIMESTAMP)"))
+        connection.execute(text("INSERT INTO section (section_id, name, date_created, description) "
+                                "VALUES (1, 'Bench', CURRENT_TIMESTAMP, 'seed')"))
+        ids = range(1, books + 1)
+        connection.execute(text("INSERT INTO book (book_id, name, description, author, file_name, section_id) "
+                                "VALUES (:id, 'Book', 'seed', 'Author', 'seed.pdf', 1)"), [{'id': i} for i in ids])
+        now = "'2030-01-01 00:00:00'"
+        connection.execute(text("INSERT INTO rating (user_id, book_id, rating, feedback, date_rated) "
+                                f"VALUES (1, :id, 4, 'ok', {now})"), [{'id': i} for i in ids])
+        connection.execute(text("INSERT INTO issued_book (user_id, book_id, request_date, return_date) "
+                                f"VALUES (1, :id, {now}, {now})"), [{'id': i} for i in ids])
+        connection.execute(text("INSERT INTO book_request (user_id, book_id, request_date, return_date, status) "
+                                f"VALUES (1, :id, {now}, {now}, 1)"), [{'id': i} for i in ids])
+        connection.execute(text("INSERT INTO book_rating_stats (book_id, rating_count, rating_sum, avg_rating, "
+                                "stars_1, stars_2, stars_3, stars_4, stars_5) VALUES (:id, 1, 4, 4.0, 0, 0, 0, 1, 0)"),
+                           [{'id': i} for i in ids])
+
+
+def per_row_delete(connection):
+    # What delete_section used to do: three SELECTs per book, then one DELETE per row.
+    statements = 0
+    for (book_id,) in connection.execute(text("SELECT book_id FROM book WHERE section_id = 1")).fetchall():
+        for table, key in (('rating', 'rating_id'), ('issued_book', 'issued_id'), ('book_request', 'request_id')):
+            rows = connection.execute(text(f"SELECT {key} FROM {table} WHERE book_id = :id"), {'id': book_id}).fetchall()
+            statements += 1
+            for (row_id,) in rows:
+                connection.execute(text(f"DELETE FROM {table} WHERE {key} = :id"), {'id': row_id})
+                statements += 1
+        connection.execute(text("DELETE FROM book_rating_stats WHERE book_id = :id"), {'id': book_id})
+        connection.execute(text("DELETE FROM book WHERE book_id = :id"), {'id': book_id})
+        statements += 2
+    return statements
+
+
+def bulk_delete(connection):
+    statements = cascade_delete_statements(select(Book.book_id).where(Book.section_id == 1).scalar_subquery())
+    for statement in statements:
+        connection.execute(statement)
+    return len(statements)
+
+
+def run(name, books, delete):
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    db.metadata.create_all(engine)
+    seed(engine, books)
+    with engine.begin() as connection:
+        started = time.perf_counter()
+        statements = delete(connection)
+        elapsed = time.perf_counter() - started
+        left = sum(connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar() for table in DEPENDENTS + ('book',))
+    print(f"{name:8} {books} books: {elapsed * 1000:9.1f}ms, {statements} statements, {left} rows left")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=10000)
+    args = parser.parse_args()
+    run('per-row', args.books, per_row_delete)
+    run('bulk', args.books, bulk_delete)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Password checks per second with inline bcrypt against the hashing process pool.
+
+Each thread stands in for a web worker handling logins back to back.
+Run from the Code folder:  python benchmarks/login_benchmark.py --threads 8 --rounds 12
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers import create_app, bcrypt
+from controllers import passwords
+
+
+def logins_per_second(check, threads, logins):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        assert all(pool.map(lambda _: check(), range(logins)))
+    return logins / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    password_hash = bcrypt.generate_password_hash('correct horse', args.rounds).decode('utf-8')
+    inline = logins_per_second(lambda: bcrypt.check_password_hash(password_hash, 'correct horse'),
+                               args.threads, args.logins)
+
+    app = create_app({'PASSWORD_HASH_WORKERS': args.workers})
+
+    def pooled_check(password='correct horse'):
+        with app.app_context():
+            return passwords._run(passwords._check, password_hash, password)
+
+    pooled_check('warm up')
+    pooled = logins_per_second(pooled_check, args.threads, args.logins)
+
+    print(f"cost {args.rounds}, {args.threads} request threads, {args.workers} hash workers")
+    print(f"inline: {inline:7.1f} logins/sec")
+    print(f"pool:   {pooled:7.1f} logins/sec")
+
+
+if __name__ == '__main__':
+    main()
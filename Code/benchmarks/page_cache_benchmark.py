@@ -0,0 +1,76 @@
+"""Requests/sec for catalog pages with the page cache off and on.
+
+Seeds a scratch SQLite database and drives the real views through the
+Flask test client. Run from the Code folder:
+    python benchmarks/page_cache_benchmark.py --books 2000 --requests 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from controllers import create_app, db, bcrypt
+from models import User, Section, Book
+
+app = create_app()
+
+PAGES = {'user': ['/', '/sections', '/section/1'], 'admin': ['/admin', '/admin/books']}
+
+
+def seed(books):
+    db.create_all()
+    password = bcrypt.generate_password_hash('benchmark', 4).decode('utf-8')
+    db.session.add_all([
+        User(username='reader', email='reader@example.com', password=password),
+        User(username='admin', email='admin@example.com', password=password, is_admin=True),
+    ])
+    db.session.add_all(Section(name=f'Section {i}', description='Seeded section') for i in range(1, 51))
+    db.session.flush()
+    db.session.add_all(Book(name=f'Book {i}', description='Seeded description ' * 10, author='Author',
+                            file_name='seed.pdf', section_id=i % 50 + 1) for i in range(books))
+    db.session.commit()
+
+
+def login(email, endpoint):
+    client = app.test_client()
+    with app.app_context():
+        client.post(endpoint, data={'email': email, 'password': 'benchmark'})
+    return client
+
+
+def requests_per_second(client, path, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        # A fresh app context per request, as a real server would have.
+        with app.app_context():
+            assert client.get(path).status_code == 200
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['PASSWORD_HASH_WORKERS'] = 0
+    with app.app_context():
+        seed(args.books)
+    clients = {'user': login('reader@example.com', '/login'), 'admin': login('admin@example.com', '/admin/login')}
+
+    for role, paths in PAGES.items():
+        for path in paths:
+            app.config['PAGE_CACHE_ENABLED'] = False
+            uncached = requests_per_second(clients[role], path, args.requests)
+            app.config['PAGE_CACHE_ENABLED'] = True
+            cached = requests_per_second(clients[role], path, args.requests)
+            print(f"{path:14} uncached {uncached:8.1f} req/s   cached {cached:8.1f} req/s")
+
+
+if __name__ == '__main__':
+    main()
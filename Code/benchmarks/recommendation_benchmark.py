@@ -0,0 +1,81 @@
+"""Time rebuilding the "readers also liked" table from a large Rating table.
+
+Seeds a scratch SQLite database with random ratings (popular books get more
+of them) and reports each stage of refresh_recommendations. Run from the
+Code folder:  python benchmarks/recommendation_benchmark.py --ratings 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import numpy as np
+from sqlalchemy import text
+from controllers import create_app, db
+from controllers.recommendations import refresh_recommendations
+from controllers.similarity import load_rating_matrix, top_neighbours
+
+app = create_app()
+
+
+def seed(users, books, ratings, rng):
+    db.create_all()
+    with db.engine.begin() as connection:
+        connection.execute(text("INSERT INTO section (section_id, name, date_created, description) "
+                                "VALUES (1, 'Bench', CURRENT_TIMESTAMP, 'seed')"))
+        connection.execute(text("INSERT INTO book (book_id, name, description, author, file_name, section_id) "
+                                "VALUES (:id, 'Book', 'seed', 'Author', 'seed.pdf', 1)"),
+                           [{'id': i} for i in range(1, books + 1)])
+        connection.execute(text("INSERT INTO user (user_id, username, email, password, is_admin, create_date) "
+                                "VALUES (:id, 'u' || :id, 'u' || :id || '@example.com', 'x', 0, CURRENT_TIMESTAMP)"),
+                           [{'id': i} for i in range(1, users + 1)])
+        # Zipf-like book popularity; duplicates of a (user, book) pair are dropped.
+        popularity = 1 / np.arange(1, books + 1) ** 0.8
+        pairs = np.stack([rng.integers(1, users + 1, ratings * 11 // 10),
+                          rng.choice(np.arange(1, books + 1), ratings * 11 // 10, p=popularity / popularity.sum())], 1)
+        pairs = np.unique(pairs, axis=0)[:ratings]
+        stars = rng.integers(1, 6, len(pairs))
+        connection.execute(text("INSERT INTO rating (user_id, book_id, rating, date_rated) "
+                                "VALUES (:user, :book, :stars, CURRENT_TIMESTAMP)"),
+                           [{'user': int(user), 'book': int(book), 'stars': int(star)}
+                            for (user, book), star in zip(pairs, stars)])
+    return len(pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--books', type=int, default=10_000)
+    parser.add_argument('--neighbours', type=int, default=10)
+    parser.add_argument('--batch-pairs', type=int, default=4_000_000)
+    args = parser.parse_args()
+
+    app.config['RECOMMENDATION_NEIGHBOURS'] = args.neighbours
+    app.config['RECOMMENDATION_BATCH_PAIRS'] = args.batch_pairs
+    with app.app_context():
+        started = time.perf_counter()
+        ratings = seed(args.users, args.books, args.ratings, np.random.default_rng(42))
+        print(f"seeded {ratings} ratings of {args.books} books by {args.users} users in "
+              f"{time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        matrix, _ = load_rating_matrix()
+        loaded = time.perf_counter()
+        neighbours = sum(1 for _ in top_neighbours(matrix, args.neighbours, args.batch_pairs))
+        computed = time.perf_counter()
+        print(f"load + matrix build  {loaded - started:7.2f}s")
+        print(f"similarity + top-{args.neighbours:<3} {computed - loaded:7.2f}s  "
+              f"({int(matrix.book_pairs.sum())} co-rating pairs, {neighbours} neighbours)")
+
+        started = time.perf_counter()
+        refresh_recommendations()
+        print(f"full refresh         {time.perf_counter() - started:7.2f}s  (including the table rewrite)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Compare full-text search against the old LIKE scan on a synthetic catalog.
+
+Run from the Code folder:  python benchmarks/search_benchmark.py --books 100000
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from controllers import db
+from controllers.search import BOOK_SEARCH_SQL, create_search_index, rebuild_search_index, match_expression
+
+SYLLABLES = 'ka lo mi ra te su no vi el an or ul phi gan dre mos tar'.split()
+
+
+def vocabulary(rng, size):
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def sentence(rng, words, cum_weights, length):
+    # Zipf-like word frequencies, roughly what real titles and blurbs look like.
+    return ' '.join(rng.choices(words, cum_weights=cum_weights, k=length))
+
+
+def seed(connection, books, words, rng):
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    connection.execute(text("INSERT INTO section (section_id, name, date_created, description) "
+                            "VALUES (1, 'General', CURRENT_TIMESTAMP, 'seed')"))
+    rows = [{'name': sentence(rng, words, weights, 3),
+             'description': sentence(rng, words, weights, 60),
+             'author': sentence(rng, words, weights, 2)}
+            for _ in range(books)]
+    connection.execute(text("INSERT INTO book (name, description, author, file_name, section_id) "
+                            "VALUES (:name, :description, :author, 'seed.pdf', 1)"), rows)
+
+
+def timed(connection, statement, params, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        connection.execute(statement, params).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = vocabulary(rng, 20000)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        seed(connection, args.books, words, rng)
+        started = time.perf_counter()
+        create_search_index(connection)
+        rebuild_search_index(connection)
+        print(f"indexed {args.books} books in {time.perf_counter() - started:.2f}s")
+
+    # The LIKE query is what /search used to run: an unranked scan of every row.
+    like_sql = text("SELECT book_id FROM book WHERE name LIKE :q OR description LIKE :q OR author LIKE :q")
+    with engine.connect() as connection:
+        for query in (words[5000], words[500], words[10][:3], f'{words[200]} {words[3000]}'):
+            fts = timed(connection, BOOK_SEARCH_SQL,
+                        {'match': match_expression(query), 'limit': 21, 'offset': 0}, args.runs)
+            like = timed(connection, like_sql, {'q': f'%{query}%'}, args.runs)
+            print(f"{query!r:16} fts p50 {fts[0]:7.2f}ms p95 {fts[1]:7.2f}ms | "
+                  f"like p50 {like[0]:7.2f}ms p95 {like[1]:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
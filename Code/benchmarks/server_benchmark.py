@@ -0,0 +1,101 @@
+"""Requests/sec of the catalog pages under gunicorn with 1, 2, 4 and 8 workers.
+
+Seeds a scratch SQLite database, starts `gunicorn -c gunicorn.conf.py wsgi:app`
+for each worker count and has logged-in readers browse it from client threads.
+Needs gunicorn (pip install gunicorn). Run from the Code folder:
+    python benchmarks/server_benchmark.py --workers 1 2 4 8 --duration 10
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from argparse import Namespace
+
+from workflow_benchmark import CODE_DIR, PASSWORD, HttpClient, app, seed
+
+PAGES = ['/', '/sections', '/section/{section}', '/search?q={word}']
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_gunicorn(workers, threads, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), WEB_THREADS=str(threads), BIND=f'127.0.0.1:{port}',
+               FLASK_SECRET_KEY='benchmark', FLASK_WTF_CSRF_ENABLED='false', FLASK_LOGIN_ATTEMPTS='1000000000',
+               FLASK_PASSWORD_HASH_WORKERS='0', BCRYPT_LOG_ROUNDS='4')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=CODE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    probe = HttpClient(base_url)
+    for _ in range(300):
+        try:
+            if probe.request('GET', '/readyz') == 200:
+                return server, base_url
+        except OSError:
+            pass
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('gunicorn did not become ready')
+
+
+def requests_per_second(base_url, clients, duration, sections, words):
+    readers = []
+    for i in range(clients):
+        reader = HttpClient(base_url)
+        assert reader.request('POST', '/login', {'email': f'bench{i}@example.com', 'password': PASSWORD}) == 302
+        readers.append(reader)
+    done = [0] * clients
+    deadline = time.perf_counter() + duration
+
+    def browse(index):
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            path = rng.choice(PAGES).format(section=rng.randint(1, sections),
+                                            word=urllib.parse.quote(rng.choice(words[:200])))
+            assert readers[index].request('GET', path) == 200
+            done[index] += 1
+
+    threads = [threading.Thread(target=browse, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(done) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker.')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--books', type=int, default=5000)
+    args = parser.parse_args()
+
+    seed_args = Namespace(users=200, clients=args.clients, sections=50, books=args.books, ratings=2000, loans=500,
+                          bcrypt_rounds=4)
+    with app.app_context():
+        words = seed(seed_args, random.Random(42))
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} client threads, {args.threads} thread(s) per worker")
+    for workers in args.workers:
+        server, base_url = start_gunicorn(workers, args.threads, free_port())
+        try:
+            rps = requests_per_second(base_url, args.clients, args.duration, seed_args.sections, words)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{workers} workers: {rps:8.1f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Start-up time and memory of a fresh interpreter building the app.
+
+Each run is a new process, as for a server worker or a `flask` CLI call.
+The matplotlib row shows what importing pyplot at start-up used to add.
+Run from the Code folder:  python benchmarks/startup_benchmark.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+{body}
+print(json.dumps({{'seconds': time.perf_counter() - started,
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'matplotlib': 'matplotlib' in sys.modules}}))
+"""
+
+CASES = {
+    'create_app': 'from controllers import create_app\napp = create_app()',
+    'create_app + pyplot': 'from controllers import create_app\napp = create_app()\nimport matplotlib.pyplot',
+}
+
+
+def run(body, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(body=body)], cwd=CODE_DIR, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, body in CASES.items():
+        samples = run(body, args.runs)
+        seconds = statistics.median(sample['seconds'] for sample in samples) * 1000
+        rss = statistics.median(sample['max_rss_mb'] for sample in samples)
+        print(f"{name:22} {seconds:7.1f}ms  {rss:6.1f}MB max RSS  matplotlib loaded: {samples[0]['matplotlib']}")
+
+
+if __name__ == '__main__':
+    main()
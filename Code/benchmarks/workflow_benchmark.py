@@ -0,0 +1,301 @@
+"""Latency percentiles and throughput for the main library workflows.
+
+Seeds a synthetic library into a scratch SQLite database, then drives the real
+routes (login, home, search, request/approve, rating, statistics) through the
+Flask test client or, with --server, over HTTP against a local WSGI server.
+Results are written as JSON; pass an earlier file to --compare to see what a
+change did. Run from the Code folder:
+    python benchmarks/workflow_benchmark.py --books 5000 --iterations 200
+    python benchmarks/workflow_benchmark.py --compare benchmarks/results/<commit>.json
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE_DIR)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import insert
+from controllers import create_app, db, bcrypt
+from controllers.search import create_search_index, rebuild_search_index
+from controllers.ratings import reconcile_rating_stats
+from controllers.statistics import reconcile_statistics
+from models import User, Section, Book, Rating, IssuedBook, BookRequest
+
+app = create_app()
+
+SYLLABLES = 'ka lo mi ra te su no vi el an or ul phi gan dre mos tar'.split()
+PASSWORD = 'benchmark'
+
+
+def vocabulary(rng, size):
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def seed(args, rng):
+    # Seeded readers get the ratings and loans; the `bench` readers that drive
+    # the workflows start clean, so every request they make is a valid one.
+    db.create_all()
+    words = vocabulary(rng, 5000)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    def text(length):
+        return ' '.join(rng.choices(words, cum_weights=weights, k=length))
+
+    password = bcrypt.generate_password_hash(PASSWORD, args.bcrypt_rounds).decode('utf-8')
+    users = [{'username': f'reader{i}', 'email': f'reader{i}@example.com', 'password': password, 'is_admin': False}
+             for i in range(args.users)]
+    users += [{'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password': password, 'is_admin': False}
+              for i in range(args.clients)]
+    users.append({'username': 'admin', 'email': 'admin@example.com', 'password': password, 'is_admin': True})
+    db.session.execute(insert(User), users)
+    db.session.execute(insert(Section), [{'name': text(2), 'description': text(12), 'date_created': datetime.now()}
+                                         for _ in range(args.sections)])
+    db.session.execute(insert(Book), [{'name': text(3), 'description': text(60), 'author': text(2),
+                                       'file_name': 'seed.pdf', 'section_id': rng.randint(1, args.sections)}
+                                      for _ in range(args.books)])
+
+    pairs = set()
+    while len(pairs) < min(args.ratings + args.loans, args.users * args.books):
+        pairs.add((rng.randint(1, args.users), rng.randint(1, args.books)))
+    pairs = sorted(pairs)
+    rng.shuffle(pairs)
+    now = datetime.now()
+    # A small catalog may not have enough pairs for both; ratings come first.
+    # The counts are clamped so the report and the results file show what
+    # was seeded, and an empty list is skipped since it would insert one row
+    # of defaults.
+    rated, loaned = pairs[:args.ratings], pairs[args.ratings:]
+    args.ratings, args.loans = len(rated), len(loaned)
+    if rated:
+        db.session.execute(insert(Rating), [{'user_id': user_id, 'book_id': book_id, 'rating': rng.randint(1, 5),
+                                             'feedback': text(8), 'date_rated': now}
+                                            for user_id, book_id in rated])
+    if loaned:
+        db.session.execute(insert(IssuedBook), [{'user_id': user_id, 'book_id': book_id, 'request_date': now,
+                                                 'return_date': now + timedelta(days=rng.randint(1, 14))}
+                                                for user_id, book_id in loaned])
+    db.session.commit()
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+        rebuild_search_index(connection)
+    reconcile_rating_stats()
+    reconcile_statistics()
+    return words
+
+
+class TestClient:
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        # A fresh app context per request, as a real server would have.
+        with app.app_context():
+            return self.client.open(path, method=method, data=data).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method)) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def start_server():
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def workflows(args, rng, words, readers, admin, make_client):
+    # Each workflow is a list of (client, method, path, form data) requests.
+    # Books are taken from a shuffled list so every request/rating is for a
+    # book that reader has not touched yet.
+    n = args.iterations
+    books = rng.sample(range(1, args.books + 1), min(n, args.books))
+    return_date = (date.today() + timedelta(days=7)).isoformat()
+    reader = lambda i: readers[i % len(readers)]
+    return {
+        # Fresh clients: a reader that is already logged in is just redirected.
+        'login': [(make_client(), 'POST', '/login', {'email': f'bench{i % len(readers)}@example.com', 'password': PASSWORD})
+                  for i in range(n)],
+        'home': [(reader(i), 'GET', '/', None) for i in range(n)],
+        'search_result': [(reader(i), 'GET', '/search?' + urllib.parse.urlencode({'q': rng.choice(words[:500])}), None)
+                          for i in range(n)],
+        'request_book': [(reader(i), 'POST', f'/request_book/{books[i % len(books)]}', {'return_date': return_date})
+                         for i in range(n)],
+        'approve_request': lambda: [(admin, 'GET', f'/admin/requests/{request_id}/approve', None)
+                                    for request_id, in db.session.query(BookRequest.request_id).limit(n)],
+        'rate_book': [(reader(i), 'POST', f'/rate_book/{books[i % len(books)]}',
+                       {'rating': rng.randint(1, 5), 'feedback': 'benchmark rating'}) for i in range(n)],
+        'admin_statistics': [(admin, 'GET', '/admin/statistics', None) for _ in range(n)],
+    }
+
+
+def run_workflow(requests, concurrency):
+    # Requests of one client stay on one thread, so a client's cookies are
+    # never shared between threads.
+    lane_of, lanes = {}, {}
+    for request in requests:
+        lane_index = lane_of.setdefault(request[0], len(lane_of) % concurrency)
+        lanes.setdefault(lane_index, []).append(request)
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def lane(lane_requests):
+        nonlocal errors
+        for client, method, path, data in lane_requests:
+            started = time.perf_counter()
+            status = client.request(method, path, data)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += status >= 400
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lane, lanes.values()))
+    wall = time.perf_counter() - started
+    return summarize(latencies, errors, wall)
+
+
+def summarize(latencies, errors, wall):
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'throughput_rps': round(len(latencies) / wall, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CODE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\ncompared with {baseline['commit']} ({baseline_path})")
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if not before or not before.get('requests') or not result.get('requests'):
+            continue
+        p95 = (result['p95_ms'] / before['p95_ms'] - 1) * 100 if before['p95_ms'] else 0
+        rps = (result['throughput_rps'] / before['throughput_rps'] - 1) * 100
+        print(f"{name:18} p95 {before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f}ms ({p95:+6.1f}%)  "
+              f"rps {before['throughput_rps']:8.1f} -> {result['throughput_rps']:8.1f} ({rps:+6.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sections', type=int, default=50)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--ratings', type=int, default=20000)
+    parser.add_argument('--loans', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=20, help='Logged-in readers driving the workflows.')
+    parser.add_argument('--iterations', type=int, default=200, help='Requests per workflow.')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help='Cost of the seeded password hashes.')
+    parser.add_argument('--server', action='store_true', help='Go over HTTP to a local server instead of the test client.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>.json.')
+    parser.add_argument('--compare', metavar='BASELINE', help='Earlier results file to compare against.')
+    args = parser.parse_args()
+
+    app.config.update(WTF_CSRF_ENABLED=False, PASSWORD_HASH_WORKERS=0, BCRYPT_LOG_ROUNDS=args.bcrypt_rounds,
+                      MAX_ACTIVE_BOOKS=args.iterations + 5, LOGIN_ATTEMPTS=10 ** 9, QUERY_GUARD_ENABLED=False)
+    app.app_context().push()
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    words = seed(args, rng)
+    print(f"seeded {args.users} users, {args.books} books, {args.ratings} ratings, {args.loans} loans "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    server = None
+    if args.server:
+        server, base_url = start_server()
+        make_client = lambda: HttpClient(base_url)
+    else:
+        make_client = TestClient
+    readers = [make_client() for _ in range(args.clients)]
+    admin = make_client()
+    for i, reader in enumerate(readers):
+        assert reader.request('POST', '/login', {'email': f'bench{i}@example.com', 'password': PASSWORD}) == 302
+    assert admin.request('POST', '/admin/login', {'email': 'admin@example.com', 'password': PASSWORD}) == 302
+
+    results = {}
+    for name, requests in workflows(args, rng, words, readers, admin, make_client).items():
+        if callable(requests):
+            # Built once the earlier workflows have created the rows it needs.
+            requests = requests()
+        results[name] = run_workflow(requests, args.concurrency)
+        result = results[name]
+        if result['requests']:
+            print(f"{name:18} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+                  f"p99 {result['p99_ms']:8.2f}ms  {result['throughput_rps']:8.1f} req/s  {result['errors']} errors")
+    if server:
+        server.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'mode': 'server' if args.server else 'test_client',
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+    output = args.output or os.path.join(CODE_DIR, 'benchmarks', 'results', f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
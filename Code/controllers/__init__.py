@@ -1,24 +1,49 @@
 import os
-from flask import Flask, url_for
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
+from controllers.database import database_uri, engine_options
 
 
-app = Flask(__name__,template_folder='../templates',  static_folder='../static')
-current_dir = os.path.dirname(os.path.abspath(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
-db = SQLAlchemy(app)
-app.app_context().push()
-bcrypt = Bcrypt(app)
-migrate = Migrate(app, db)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+db = SQLAlchemy()
+bcrypt = Bcrypt()
+migrate = Migrate()
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
 
 
-SECRET_KEY = os.urandom(32)
-app.config['SECRET_KEY'] = SECRET_KEY
-from controllers import auth, forms, general, admin, utils
-from models import User
\ No newline at end of file
+def create_app(config=None):
+    # Building the app opens no connections and starts no threads or pools,
+    # so it can be created once in a preforking server's master and shared
+    # copy-on-write by every worker.
+    app = Flask(__name__, template_folder='../templates', static_folder='../static')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['SECRET_KEY'] = os.urandom(32)
+    # FLASK_* environment variables override the defaults, e.g.
+    # FLASK_SECRET_KEY, which every worker of a server must share.
+    app.config.from_prefixed_env()
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    db.init_app(app)
+    bcrypt.init_app(app)
+    migrate.init_app(app, db)
+    login_manager.init_app(app)
+
+    import models
+    from controllers import (auth, general, admin, utils, loans, search, ratings, identity, page_cache, pagination,
+                             charts, passwords, statistics, query_guard, importer, metrics, health, access,
+                             recommendations, pdf_processing, api, schema, versions)
+    # Settings, per-app state, request hooks and CLI commands. The schema
+    # check comes first, so it runs before the other before_request hooks.
+    for module in (schema, query_guard, versions, pagination, passwords, identity, access, page_cache, search,
+                   ratings, charts, loans, recommendations, importer, utils):
+        module.init_app(app)
+    # The blueprints serving routes.
+    for module in (auth, general, admin, statistics, metrics, health, pdf_processing, api):
+        app.register_blueprint(module.bp)
+    return app
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.local import LocalProxy
+from sqlalchemy import select
+from controllers import db
+from controllers.versions import bump_version, cache_version
+from models import IssuedBook
+
+
+def init_app(app):
+    app.config.setdefault('ACCESS_CACHE_TTL', 300)
+    app.config.setdefault('ACCESS_CACHE_SIZE', 10000)
+    # Optional shared cache with the same redis-py style interface as
+    # IDENTITY_CACHE_BACKEND, so workers reuse each other's lookups.
+    app.config.setdefault('ACCESS_CACHE_BACKEND', None)
+    app.config.setdefault('BOOK_TOKEN_MAX_AGE', 300)
+    app.extensions['access_cache'] = AccessCache()
+
+
+def load_access(user_id):
+    # Returns the ids of the user's current loans and for how many seconds
+    # that stays true: a loan drops out at its return date even before
+    # expire_loans has deleted it.
+    now = datetime.now()
+    rows = db.session.execute(select(IssuedBook.book_id, IssuedBook.return_date).filter_by(user_id=user_id)).all()
+    books = frozenset(book_id for book_id, return_date in rows if return_date is None or return_date >= now)
+    ttl = current_app.config['ACCESS_CACHE_TTL']
+    for book_id, return_date in rows:
+        if return_date is not None and return_date >= now:
+            ttl = min(ttl, (return_date - now).total_seconds())
+    return books, ttl
+
+
+class AccessCache:
+    # Per-user set of issued book ids, so permission checks on book pages and
+    # PDF range requests don't query IssuedBook every time. Entries, local and
+    # in the backend, are tagged with the access version, which any change to
+    # any loan bumps in the database, so every process drops them within
+    # CACHE_VERSION_INTERVAL seconds.
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _backend(self):
+        return current_app.config['ACCESS_CACHE_BACKEND']
+
+    def _key(self, user_id, version):
+        return f'access:{version}:{user_id}'
+
+    def books(self, user_id):
+        now = time.monotonic()
+        # Read before the loans, so a set read before a change is never
+        # tagged with the version that follows it.
+        version = cache_version('access')
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now and entry[2] == version:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return entry[0]
+        backend = self._backend()
+        raw = backend.get(self._key(user_id, version)) if backend is not None else None
+        if raw is not None:
+            books, expires_at = json.loads(raw)
+            books, ttl = frozenset(books), expires_at - time.time()
+        else:
+            books, ttl = load_access(user_id)
+            if backend is not None and ttl >= 1:
+                backend.set(self._key(user_id, version), json.dumps([sorted(books), time.time() + ttl]), ex=int(ttl))
+        with self._lock:
+            self.stats['misses'] += 1
+            if ttl > 0:
+                self._entries[user_id] = (books, now + ttl, version)
+                while len(self._entries) > current_app.config['ACCESS_CACHE_SIZE']:
+                    self._entries.popitem(last=False)
+        return books
+
+    def invalidate(self):
+        # Call after committing a change to loans. Loans change far less often
+        # than permissions are checked, so every user's set is dropped rather
+        # than tracking a version per user.
+        with self._lock:
+            self._entries.clear()
+            self.stats['invalidations'] += 1
+        bump_version('access')
+
+
+access_cache = LocalProxy(lambda: current_app.extensions['access_cache'])
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='book-access')
+
+
+def book_token(user_id, book):
+    # Short-lived proof that `user_id` may read `book`, checked without the
+    # database. It carries the file name so the PDF can be served directly.
+    return _serializer().dumps([user_id, book.book_id, book.file_name])
+
+
+def verify_book_token(token, user_id, book_id):
+    # Returns the book's file name, or None if the token is not valid for this
+    # user and book (or is older than BOOK_TOKEN_MAX_AGE).
+    try:
+        token_user_id, token_book_id, file_name = _serializer().loads(
+            token, max_age=current_app.config['BOOK_TOKEN_MAX_AGE'])
+    except (BadSignature, ValueError):
+        return None
+    if token_user_id != user_id or token_book_id != book_id:
+        return None
+    return file_name
@@ -1,79 +1,67 @@
-from flask import render_template, flash, redirect, url_for, request
-from controllers import app, db
-from controllers.forms import NewSectionForm, UpdateSectionForm, NewBookForm, UpdateBookForm, SearchForm
+from flask import render_template, flash, redirect, url_for, request, jsonify, Blueprint
+from controllers import db
+from controllers.forms import NewSectionForm, UpdateSectionForm, NewBookForm, UpdateBookForm, SearchForm, BulkRequestForm
 from models import *
 from controllers.utils import admin_required
-from controllers.utils import save_pdf_file, delete_pdf_file
-from sqlalchemy import func, or_
-from matplotlib import pyplot as plt
-
-@app.route('/admin')
+from controllers.utils import save_pdf_file, queue_pdf_deletion
+from controllers.search import search_books, search_sections
+from controllers.pagination import keyset_paginate
+from controllers.charts import average_ratings_chart, chart_response, rendering_response
+from controllers.catalog import delete_books, delete_section_books
+from controllers.page_cache import cached_page, bump_catalog_version
+from controllers.statistics import adjust_counter, record_event, counters
+from controllers.access import access_cache
+from controllers.pdf_processing import queue_pdf_processing
+from controllers.loans import request_filter, approve_requests, reject_requests
+from sqlalchemy.orm import raiseload
+
+bp = Blueprint('admin', __name__, cli_group=None)
+
+@bp.route('/admin')
 @admin_required
+@cached_page
 def admin():
-    books = Book.query.all()
-    sections = Section.query.all()
-    requests = BookRequest.query.all()
-
-    return render_template('admin.html', title='Admin', requests=requests, books=books, sections=sections)
-
+    page = keyset_paginate(Section.query.options(raiseload('*')), Section.section_id)
+    return render_template('admin.html', title='Admin', sections=page.items, page=page)
 
-@app.before_request
-def before_request():
-    revoke_issued_books()
 
-def revoke_issued_books():
-    issued_books = IssuedBook.query.all()
-    for issued_book in issued_books:
-        if issued_book.return_date < datetime.now():
-            db.session.delete(issued_book)
-            db.session.commit()
-            flash('Issued book revoked successfully', 'success')
-
-@app.route('/sections/new', methods=['GET', 'POST'])
+@bp.route('/sections/new', methods=['GET', 'POST'])
 @admin_required
 def new_section():
     form = NewSectionForm()
     if form.validate_on_submit():
         section = Section(name=form.section_name.data,description=form.description.data)
         db.session.add(section)
+        adjust_counter('sections')
         db.session.commit()
+        bump_catalog_version()
         flash('Section created successfully', 'success')
 
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
     
     return render_template('new_section.html', form=form, title="New Section")
 
-@app.route('/sections/<int:section_id>/delete', methods=['GET', 'POST'])
+@bp.route('/sections/<int:section_id>/delete', methods=['GET', 'POST'])
 @admin_required
 def delete_section(section_id):
 
     section = Section.query.get(section_id)
-    books = Book.query.filter_by(section_id=section_id).all()
-    
+
     if not section:
         flash('Section not found', 'danger')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
     else:
-        for book in books:
-            rating = Rating.query.filter_by(book_id=book.book_id).all()
-            issued_books = IssuedBook.query.filter_by(book_id=book.book_id).all()
-            book_requests = BookRequest.query.filter_by(book_id=book.book_id).all()
-            for rate in rating:
-                db.session.delete(rate)
-            for issued_book in issued_books:
-                db.session.delete(issued_book)
-            for book_request in book_requests:
-                db.session.delete(book_request)
-            delete_pdf_file(book.file_name)
-            db.session.delete(book)
-        db.session.delete(section)
+        file_names = delete_section_books(section_id)
         db.session.commit()
+        access_cache.invalidate()
+        bump_catalog_version()
+        queue_pdf_deletion(file_names)
         flash('Section deleted successfully', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
     
 
 
-@app.route('/sections/<int:section_id>/update', methods=['GET', 'POST'])
+@bp.route('/sections/<int:section_id>/update', methods=['GET', 'POST'])
 @admin_required
 def update_section(section_id):
     section = Section.query.get(section_id)
@@ -83,8 +71,9 @@ def update_section(section_id):
             section.name = form.section_name.data
             section.description = form.description.data
             db.session.commit()
+            bump_catalog_version()
             flash('Section updated successfully', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('admin.admin'))
         
         elif request.method == 'GET':
             form.section_name.data = section.name
@@ -93,48 +82,41 @@ def update_section(section_id):
         return render_template('update_section.html',section=section ,form=form, title="Update Section")
     else:
         flash('Section not found', 'danger')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
     
 
     
 
-@app.route('/sections/<int:section_id>/books', methods=['GET', 'POST'])
+@bp.route('/sections/<int:section_id>/books', methods=['GET', 'POST'])
 @admin_required
+@cached_page
 def section_books(section_id):
     section = Section.query.get(section_id)
     if not section:
         flash('Section not found', 'danger')
-        return redirect(url_for('admin'))
-
-    books_with_ratings_and_feedback = db.session.query(
-        Book,
-        func.avg(Rating.rating).label('avg_rating'),
-        func.group_concat(Rating.feedback).label('feedback_list')
-    ).filter(Book.section_id == section_id) \
-     .outerjoin(Rating, Book.book_id == Rating.book_id) \
-     .group_by(Book.book_id) \
-     .all()
-
-    books = [{
-        'book': book,
-        'avg_rating': avg_rating,
-        'feedback_list': (feedback_list or '').split(',')
-    } for book, avg_rating, feedback_list in books_with_ratings_and_feedback]
+        return redirect(url_for('admin.admin'))
 
-    return render_template('admin_section_books.html', books=books, section=section, title="Section Books")
+    books_with_stats = db.session.query(Book, BookRatingStats.avg_rating)\
+        .options(raiseload('*'))\
+        .filter(Book.section_id == section_id)\
+        .outerjoin(BookRatingStats, Book.book_id == BookRatingStats.book_id)
+    page = keyset_paginate(books_with_stats, Book.book_id, cursor=lambda row: row[0].book_id)
+    books = books_with_feedback(page.items)
 
+    return render_template('admin_section_books.html', books=books, page=page, section=section, title="Section Books")
 
 
-@app.route('/book/new', methods=['GET', 'POST'])
+
+@bp.route('/book/new', methods=['GET', 'POST'])
 @admin_required
 def new_book():
     form = NewBookForm()
-    section = Section.query.all()
-    if len(section) == 0:
+    sections = Section.query.options(raiseload('*')).all()
+    if len(sections) == 0:
         flash('Please create a section first', 'danger')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
 
-    form.section.choices = [(section.section_id, section.name) for section in Section.query.all()]
+    form.section.choices = [(section.section_id, section.name) for section in sections]
 
 
     if form.validate_on_submit():
@@ -144,45 +126,42 @@ def new_book():
         book = Book(name=form.name.data, description=form.description.data, author=form.author.data, file_name=file_name, section_id=section_id)
 
         db.session.add(book)
+        adjust_counter('books')
         db.session.commit()
+        bump_catalog_version()
+        queue_pdf_processing(file_name)
         flash('Book created successfully', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
 
-    return render_template('new_book.html', form=form, title="New Book",section=Section.query.all())
+    return render_template('new_book.html', form=form, title="New Book")
 
 
-@app.route('/book/<int:book_id>/delete', methods=['GET', 'POST'])
+@bp.route('/book/<int:book_id>/delete', methods=['GET', 'POST'])
 @admin_required
 def delete_book(book_id):
     book = Book.query.get(book_id)
     if book:
-        rating = Rating.query.filter_by(book_id=book_id).all()
-        issued_books = IssuedBook.query.filter_by(book_id=book_id).all()
-        book_requests = BookRequest.query.filter_by(book_id=book_id).all()
-        for rate in rating:
-            db.session.delete(rate)
-        for issued_book in issued_books:
-            db.session.delete(issued_book)
-        for book_request in book_requests:
-            db.session.delete(book_request)
-        delete_pdf_file(book.file_name)
-        db.session.delete(book)
+        file_name = book.file_name
+        delete_books([book_id])
         db.session.commit()
+        access_cache.invalidate()
+        bump_catalog_version()
+        queue_pdf_deletion([file_name])
         flash('Book deleted successfully', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
     else:
         flash('Book not found', 'danger')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
 
 
     
-@app.route('/book/<int:book_id>/update', methods=['GET', 'POST'])
+@bp.route('/book/<int:book_id>/update', methods=['GET', 'POST'])
 @admin_required
 def update_book(book_id):
     book = Book.query.get(book_id)
     if book:
         form = UpdateBookForm(obj=book)
-        form.section.choices = [(section.section_id, section.name) for section in Section.query.all()]
+        form.section.choices = [(section.section_id, section.name) for section in Section.query.options(raiseload('*'))]
 
         if form.validate_on_submit():
             book.name = form.name.data
@@ -190,17 +169,19 @@ def update_book(book_id):
             book.author = form.author.data
             book.section_id = form.section.data
 
+            old_file_name = None
             if form.file_name.data is not None:
-                
-                if book.file_name:
-                    delete_pdf_file(book.file_name)
-
+                old_file_name = book.file_name
                 file_name = save_pdf_file(form.file_name.data)
                 book.file_name = file_name
 
             db.session.commit()
+            bump_catalog_version()
+            if old_file_name:
+                queue_pdf_deletion([old_file_name])
+                queue_pdf_processing(file_name)
             flash('Book updated successfully', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('admin.admin'))
 
         elif request.method == 'GET':
             form.name.data = book.name
@@ -208,138 +189,181 @@ def update_book(book_id):
             form.author.data = book.author
             form.section.data = book.section_id
 
-        return render_template('update_book.html', book=book, form=form, title="Update Book", sections=Section.query.all())
+        return render_template('update_book.html', book=book, form=form, title="Update Book")
 
     else:
         flash('Book not found', 'danger')
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
 
 
-@app.route("/admin/books")
-@admin_required
-def admin_books():
-    books_with_ratings_and_feedback = db.session.query(Book,func.avg(Rating.rating).label('avg_rating'),
-        func.group_concat(Rating.feedback).label('feedback_list')
-    ).outerjoin(Rating, Book.book_id == Rating.book_id) \
-     .group_by(Book.book_id) \
-     .all()
-
-    
-    books = [{
+def books_with_feedback(rows):
+    # Feedback is only fetched for the books on the current page.
+    feedback = {}
+    book_ids = [book.book_id for book, _ in rows]
+    for book_id, text in db.session.query(Rating.book_id, Rating.feedback).filter(Rating.book_id.in_(book_ids)):
+        if text:
+            feedback.setdefault(book_id, []).append(text)
+    return [{
         'book': book,
         'avg_rating': avg_rating,
-        'feedback_list': (feedback_list or '').split(',') 
-    } for book, avg_rating, feedback_list in books_with_ratings_and_feedback]
+        'feedback_list': feedback.get(book.book_id, [])
+    } for book, avg_rating in rows]
 
-    return render_template('admin_books.html', title='Books', books=books)
 
+@bp.route("/admin/books")
+@admin_required
+@cached_page
+def admin_books():
+    books_with_stats = db.session.query(Book, BookRatingStats.avg_rating)\
+        .options(raiseload('*'))\
+        .outerjoin(BookRatingStats, Book.book_id == BookRatingStats.book_id)
+    page = keyset_paginate(books_with_stats, Book.book_id, cursor=lambda row: row[0].book_id)
+    books = books_with_feedback(page.items)
 
-@app.route("/admin/requests")
+    return render_template('admin_books.html', title='Books', books=books, page=page)
+
+
+@bp.route("/admin/requests")
 @admin_required
 def admin_requests():
     requests = db.session.query(BookRequest, User.username, Book.name)\
         .join(User, BookRequest.user_id == User.user_id)\
-        .join(Book, BookRequest.book_id == Book.book_id)\
-        .all()
-    
-    
+        .join(Book, BookRequest.book_id == Book.book_id)
+    requests_page = keyset_paginate(requests, BookRequest.request_id, cursor=lambda row: row[0].request_id)
+
     issued_books = db.session.query(IssuedBook, User.username, Book.name)\
         .join(User, IssuedBook.user_id == User.user_id)\
-        .join(Book, IssuedBook.book_id == Book.book_id)\
-        .all()
-    return render_template('admin_requests.html', title='Requests', requests=requests, issued_books=issued_books)
+        .join(Book, IssuedBook.book_id == Book.book_id)
+    issued_page = keyset_paginate(issued_books, IssuedBook.issued_id, cursor=lambda row: row[0].issued_id, prefix='issued_')
+    return render_template('admin_requests.html', title='Requests', requests=requests_page.items, issued_books=issued_page.items,
+                           requests_page=requests_page, issued_page=issued_page, bulk_form=bulk_request_form())
 
 
-@app.route("/admin/requests/<int:request_id>/approve")
+def bulk_request_form():
+    form = BulkRequestForm()
+    form.section.choices = [(0, 'Any section')] + [(section.section_id, section.name)
+                                                   for section in Section.query.options(raiseload('*'))]
+    return form
+
+
+@bp.route("/admin/requests/bulk", methods=['POST'])
+@admin_required
+def bulk_requests():
+    form = bulk_request_form()
+    if not form.validate_on_submit() or not (form.approve.data or form.reject.data):
+        flash('Invalid bulk action', 'danger')
+        return redirect(url_for('admin.admin_requests'))
+
+    if form.scope.data == 'selected':
+        if not form.request_ids.data:
+            flash('No requests selected', 'danger')
+            return redirect(url_for('admin.admin_requests'))
+        conditions = request_filter(request_ids=form.request_ids.data)
+    else:
+        conditions = request_filter(book_id=form.book_id.data, section_id=form.section.data or None,
+                                    older_than_days=form.older_than_days.data)
+        if not conditions and not form.everything.data:
+            flash('Set a filter, or confirm that the action applies to every pending request', 'danger')
+            return redirect(url_for('admin.admin_requests'))
+
+    if form.approve.data:
+        counts = approve_requests(conditions)
+        message = f"{counts['approved']} requests approved"
+        if counts['already_issued']:
+            message += f", {counts['already_issued']} removed as the book was already issued"
+    else:
+        counts = reject_requests(conditions)
+        message = f"{counts['rejected']} requests rejected"
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(counts)
+    flash(message, 'success')
+    return redirect(url_for('admin.admin_requests'))
+
+
+@bp.route("/admin/requests/<int:request_id>/approve")
 @admin_required
 def approve_request(request_id):
-    request = BookRequest.query.get(request_id)
-    if request:
-        book = Book.query.get(request.book_id)
-        if book:
-            issued_book = IssuedBook(user_id=request.user_id, book_id=request.book_id, return_date=request.return_date)
-            db.session.add(issued_book)
-            db.session.delete(request)
-            db.session.commit()
-            flash('Request approved successfully', 'success')
-            return redirect(url_for('admin_requests'))
-        else:
-            flash('Book not found', 'danger')
-            return redirect(url_for('admin_requests'))
+    # Same path as the bulk action, so a request for a book the user already
+    # has is removed instead of failing on the unique loan index.
+    counts = approve_requests(request_filter(request_ids=[request_id]))
+    if counts['approved']:
+        flash('Request approved successfully', 'success')
+    elif counts['already_issued']:
+        flash('Request removed, the book is already issued to this user', 'warning')
     else:
         flash('Request not found', 'danger')
-        return redirect(url_for('admin_requests'))
+    return redirect(url_for('admin.admin_requests'))
 
 
-@app.route("/admin/requests/<int:request_id>/reject")
+@bp.route("/admin/requests/<int:request_id>/reject")
 @admin_required
 def reject_request(request_id):
     request = BookRequest.query.get(request_id)
     if request:
         db.session.delete(request)
+        adjust_counter('requests', -1)
+        record_event('rejections')
         db.session.commit()
         flash('Request rejected successfully', 'success')
-        return redirect(url_for('admin_requests'))
+        return redirect(url_for('admin.admin_requests'))
     else:
         flash('Request not found', 'danger')
-        return redirect(url_for('admin_requests'))
+        return redirect(url_for('admin.admin_requests'))
 
 
-@app.route("/admin/issued_books/<int:issued_id>/revoke")
+@bp.route("/admin/issued_books/<int:issued_id>/revoke")
 @admin_required
 def revoke_issued_book(issued_id):
     issued_book = IssuedBook.query.get(issued_id)
     if issued_book:
         db.session.delete(issued_book)
+        adjust_counter('issued_books', -1)
+        record_event('revocations')
         db.session.commit()
+        access_cache.invalidate()
         flash('Issued book revoked successfully', 'success')
-        return redirect(url_for('admin_books'))
+        return redirect(url_for('admin.admin_books'))
     else:
         flash('Issued book not found', 'danger')
-        return redirect(url_for('admin_books'))
+        return redirect(url_for('admin.admin_books'))
     
-@app.route("/admin/statistics")
+@bp.route("/admin/statistics/chart.png")
+@admin_required
+def latest_statistics_chart():
+    # Kept off the dashboard itself: plotting needs every rated book, while
+    # the page only reads the running counters.
+    key = average_ratings_chart()
+    if key is None:
+        return rendering_response()
+    return redirect(url_for('admin.statistics_chart', key=key))
+
+
+@bp.route("/admin/statistics/chart/<key>.png")
+@admin_required
+def statistics_chart(key):
+    return chart_response(key)
+
+
+@bp.route("/admin/statistics")
 @admin_required
 def admin_statistics():
-    total_books = Book.query.count()
-    total_sections = Section.query.count()
-    total_requests = BookRequest.query.count()
-    total_issued_books = IssuedBook.query.count()
-    total_users = User.query.count()
-    total_ratings = Rating.query.count()
-    rated_books = db.session.query(Book, Rating.rating).join(Rating, Book.book_id == Rating.book_id).all()
-    
-    
-    ratings = db.session.query(Book.name, func.avg(Rating.rating),Rating.feedback).join(Rating, Book.book_id == Rating.book_id).group_by(Book.name).all()
-    book_names = [rating[0] for rating in ratings]
-    avg_ratings = [rating[1] for rating in ratings]
-    
-    
-    plt.figure(figsize=(10, 6))
-    plt.bar(book_names, avg_ratings, color='skyblue')
-    plt.xlabel('Book Name')
-    plt.ylabel('Average Rating')
-    plt.title('Average Ratings for Books')
-    plt.xticks(rotation=45, ha='right') 
-    plt.tight_layout()  
-    plt.savefig('static/images/average_ratings_chart.png')
-    return render_template('admin_statistics.html', title='Statistics', total_books=total_books, total_sections=total_sections, total_requests=total_requests, total_issued_books=total_issued_books, total_users=total_users, total_ratings=total_ratings, rated_books=rated_books, ratings=ratings)
-
-
-@app.route("/admin/search", methods=['GET', 'POST'])
+    totals = counters()
+    return render_template('admin_statistics.html', title='Statistics', total_books=totals['books'], total_sections=totals['sections'], total_requests=totals['requests'], total_issued_books=totals['issued_books'], total_users=totals['users'], total_ratings=totals['ratings'])
+
+
+@bp.route("/admin/search", methods=['GET', 'POST'])
 @admin_required
 def admin_search():
     form = SearchForm()
 
     if form.validate_on_submit():
-        query = form.query.data
-        sections = Section.query.filter(Section.name.like('%'+query+'%')).all()
-        books = Book.query.filter(
-            or_(
-                Book.name.like('%'+query+'%'),
-                Book.description.like('%'+query+'%'),
-                Book.author.like('%'+query+'%')
-            )
-        ).all()
-        return render_template('admin_search_results.html', title='Search', sections=sections, books=books, query=query)
+        return redirect(url_for('admin.admin_search', q=form.query.data))
+
+    query = request.args.get('q', '').strip()
+    if query:
+        page = request.args.get('page', 1, type=int)
+        books, more_books = search_books(query, page)
+        sections, more_sections = search_sections(query, page)
+        return render_template('admin_search_results.html', title='Search', sections=sections, books=books, query=query,
+                               page=page, has_next=more_books or more_sections)
     return render_template('admin_search_form.html', title='Search', form=form)
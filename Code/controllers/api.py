@@ -0,0 +1,225 @@
+import hashlib
+from datetime import datetime
+import orjson
+from flask import abort, request, url_for, Blueprint, current_app
+from flask_login import login_required, current_user
+from sqlalchemy import and_, or_, select
+from werkzeug.exceptions import HTTPException
+from controllers import db, login_manager
+from controllers.pagination import keyset_paginate, page_size
+from controllers.search import search_book_ids
+from models import Book, BookRatingStats, BookRequest, IssuedBook, Section
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1', cli_group=None)
+
+
+@bp.record_once
+def configure(state):
+    # API clients get a 401 instead of a redirect to the login page.
+    login_manager.blueprint_login_views[bp.name] = None
+
+
+# Fields a client can ask for with ?fields=a,b; the first one (the id) is
+# always returned. Only the selected columns are queried.
+BOOK_FIELDS = {
+    'book_id': Book.book_id,
+    'name': Book.name,
+    'description': Book.description,
+    'author': Book.author,
+    'section_id': Book.section_id,
+    'page_count': Book.page_count,
+    'file_size': Book.file_size,
+    'thumbnail': Book.thumbnail,
+    'avg_rating': BookRatingStats.avg_rating,
+    'rating_count': BookRatingStats.rating_count,
+    'updated_at': Book.updated_at,
+}
+SECTION_FIELDS = {
+    'section_id': Section.section_id,
+    'name': Section.name,
+    'description': Section.description,
+    'date_created': Section.date_created,
+    'updated_at': Section.updated_at,
+}
+LOAN_FIELDS = {
+    'issued_id': IssuedBook.issued_id,
+    'book_id': IssuedBook.book_id,
+    'name': Book.name,
+    'request_date': IssuedBook.request_date,
+    'return_date': IssuedBook.return_date,
+}
+REQUEST_FIELDS = {
+    'request_id': BookRequest.request_id,
+    'book_id': BookRequest.book_id,
+    'name': Book.name,
+    'request_date': BookRequest.request_date,
+    'return_date': BookRequest.return_date,
+}
+
+
+def json_response(payload):
+    # The ETag is a hash of the body, so If-None-Match revalidation answers
+    # 304 whenever the client already has this exact response.
+    body = orjson.dumps(payload)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(hashlib.blake2b(body, digest_size=16).hexdigest())
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+
+@bp.errorhandler(HTTPException)
+def api_error(e):
+    return current_app.response_class(orjson.dumps({'error': e.name, 'description': e.description}),
+                                      status=e.code, mimetype='application/json')
+
+
+def selected_fields(available):
+    requested = request.args.get('fields')
+    key = next(iter(available))
+    if not requested:
+        return list(available)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return [key] + [name for name in dict.fromkeys(names) if name != key]
+
+
+def book_query(names, *extra):
+    query = db.session.query(*[BOOK_FIELDS[name] for name in names], *extra).select_from(Book)
+    if any(BOOK_FIELDS[name].class_ is BookRatingStats for name in names):
+        query = query.outerjoin(BookRatingStats, BookRatingStats.book_id == Book.book_id)
+    return query
+
+
+def to_dicts(names, rows):
+    items = [dict(zip(names, row)) for row in rows]
+    if 'thumbnail' in names:
+        for item in items:
+            if item['thumbnail']:
+                item['thumbnail'] = url_for('pdf_processing.thumbnail', name=item['thumbnail'])
+    return items
+
+
+def updated_since():
+    value = request.args.get('updated_since')
+    if value is None:
+        return None
+    try:
+        since = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description='updated_since must be an ISO 8601 timestamp.')
+    # Timestamps are stored in server local time.
+    return since.astimezone().replace(tzinfo=None) if since.tzinfo else since
+
+
+def listing(query, names, key, updated_at):
+    # Without ?updated_since= a keyset-paginated listing (?after=, ?before=,
+    # ?per_page=). With it, the rows changed since then, oldest change first;
+    # `next` resumes after the last row, so a client keeps the last `next` it
+    # got and polls it to sync. Deleted rows are not reported: compare with
+    # the /ids endpoints.
+    since = updated_since()
+    if since is None:
+        page = keyset_paginate(query, key, cursor=lambda row: row[0])
+        return {'items': to_dicts(names, page.items), 'next': page.next_url, 'prev': page.prev_url}
+
+    after = request.args.get('after', type=int)
+    if after is None:
+        query = query.filter(updated_at >= since)
+    else:
+        query = query.filter(or_(updated_at > since, and_(updated_at == since, key > after)))
+    rows = query.order_by(updated_at, key).limit(page_size()).all()
+    if rows:
+        since, after = rows[-1][-1], rows[-1][0]
+    args = dict(request.args.to_dict(), updated_since=since.isoformat())
+    if after is not None:
+        args['after'] = after
+    return {'items': to_dicts(names, [row[:-1] for row in rows]), 'next': url_for(request.endpoint, **args)}
+
+
+@bp.route('/books')
+@login_required
+def books():
+    names = selected_fields(BOOK_FIELDS)
+    query = book_query(names, Book.updated_at)
+    section_id = request.args.get('section_id', type=int)
+    if section_id is not None:
+        query = query.filter(Book.section_id == section_id)
+    return json_response(listing(query, names, Book.book_id, Book.updated_at))
+
+
+@bp.route('/books/<int:book_id>')
+@login_required
+def book(book_id):
+    names = selected_fields(BOOK_FIELDS)
+    row = book_query(names).filter(Book.book_id == book_id).first()
+    if row is None:
+        abort(404)
+    return json_response(to_dicts(names, [row])[0])
+
+
+@bp.route('/books/ids')
+@login_required
+def book_ids():
+    return json_response(db.session.scalars(select(Book.book_id).order_by(Book.book_id)).all())
+
+
+@bp.route('/sections')
+@login_required
+def sections():
+    names = selected_fields(SECTION_FIELDS)
+    query = db.session.query(*[SECTION_FIELDS[name] for name in names], Section.updated_at)
+    return json_response(listing(query, names, Section.section_id, Section.updated_at))
+
+
+@bp.route('/sections/<int:section_id>')
+@login_required
+def section(section_id):
+    names = selected_fields(SECTION_FIELDS)
+    row = db.session.query(*[SECTION_FIELDS[name] for name in names]).filter(Section.section_id == section_id).first()
+    if row is None:
+        abort(404)
+    return json_response(to_dicts(names, [row])[0])
+
+
+@bp.route('/sections/ids')
+@login_required
+def section_ids():
+    return json_response(db.session.scalars(select(Section.section_id).order_by(Section.section_id)).all())
+
+
+@bp.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        abort(400, description='Missing search query q.')
+    page = max(request.args.get('page', 1, type=int), 1)
+    ids, has_next = search_book_ids(query, page, page_size())
+    names = selected_fields(BOOK_FIELDS)
+    found = {row[0]: row for row in book_query(names).filter(Book.book_id.in_(ids))}
+    next_url = url_for(request.endpoint, **dict(request.args.to_dict(), page=page + 1)) if has_next else None
+    return json_response({'items': to_dicts(names, [found[i] for i in ids if i in found]), 'next': next_url})
+
+
+@bp.route('/me/loans')
+@login_required
+def my_loans():
+    names = selected_fields(LOAN_FIELDS)
+    rows = db.session.query(*[LOAN_FIELDS[name] for name in names])\
+        .join(Book, IssuedBook.book_id == Book.book_id)\
+        .filter(IssuedBook.user_id == current_user.user_id).order_by(IssuedBook.issued_id)
+    return json_response({'items': to_dicts(names, rows)})
+
+
+@bp.route('/me/requests')
+@login_required
+def my_requests():
+    names = selected_fields(REQUEST_FIELDS)
+    rows = db.session.query(*[REQUEST_FIELDS[name] for name in names])\
+        .join(Book, BookRequest.book_id == Book.book_id)\
+        .filter(BookRequest.user_id == current_user.user_id).order_by(BookRequest.request_id)
+    return json_response({'items': to_dicts(names, rows)})
@@ -1,43 +1,54 @@
 import click
-from flask import request, render_template, redirect, url_for, flash
+from flask import render_template, redirect, url_for, flash, Blueprint
 from flask_login import login_user, current_user, logout_user
 from controllers.forms import RegistrationForm, LoginForm
-from controllers import app, db, bcrypt
+from controllers import db
+from controllers.passwords import hash_password, verify_password, allow_login_attempt
+from controllers.identity import identity_cache
+from controllers.statistics import adjust_counter
 from models import User
 
+bp = Blueprint('auth', __name__, cli_group=None)
 
-@app.route('/register', methods=['GET', 'POST'])
+
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
 
     form = RegistrationForm()
 
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(
-            form.password.data).decode('utf-8')
+        if not allow_login_attempt(form.email.data):
+            flash('Too many attempts. Please try again later.', 'danger')
+            return render_template('user_register.html', form=form, title='Register'), 429
+        hashed_password = hash_password(form.password.data)
         user = User(username=form.username.data,
                     email=form.email.data, password=hashed_password)
         db.session.add(user)
+        adjust_counter('users')
         db.session.commit()
         flash('Your account has been created! You are now able to log in', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     return render_template('user_register.html', form=form, title='Register')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     
     form = LoginForm()
 
     if form.validate_on_submit():
+        if not allow_login_attempt(form.email.data):
+            flash('Too many login attempts. Please try again later.', 'danger')
+            return render_template('user_login.html', form=form, title='Login'), 429
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and verify_password(user, form.password.data):
             login_user(user)
-            return redirect(url_for('home'))
+            return redirect(url_for('general.home'))
         else:
             flash('Login Unsuccessful. Please check email and password', 'danger')
 
@@ -45,7 +56,7 @@ def login():
 
 
 
-@app.cli.command('create_admin')
+@bp.cli.command('create_admin')
 @click.option('--username', prompt='Enter username', help='Admin username')
 @click.option('--email', prompt='Enter email', help='Admin email')
 @click.option('--password', prompt='Enter password', help='Admin password', hide_input=True, confirmation_prompt=True)
@@ -56,40 +67,47 @@ def create_admin(username, email, password):
     elif len(password) < 8:
         click.echo("Password should be atleast 8 characters.")
     else:
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = hash_password(password)
         new_user = User(username=username, email=email, password=hashed_password, is_admin=True)
         db.session.add(new_user)
+        adjust_counter('users')
         db.session.commit()
         click.echo(f"Admin '{username}' created successfully.")
 
-@app.cli.command('delete_admin')
+@bp.cli.command('delete_admin')
 @click.option('--email', prompt=True, help='Email for the Admin.')
 @click.option('--password', prompt=True, hide_input=True, help='Password for the Admin.')
 def delete_admin(email, password):
     user = User.query.filter_by(email=email).first()
-    if user and user.is_admin and bcrypt.check_password_hash(user.password, password):
+    if user and user.is_admin and verify_password(user, password):
+        user_id, username = user.user_id, user.username
         db.session.delete(user)
+        adjust_counter('users', -1)
         db.session.commit()
-        click.echo(f"Admin '{user.username}' deleted successfully")
+        identity_cache.invalidate(user_id)
+        click.echo(f"Admin '{username}' deleted successfully")
     else:
         click.echo("Admin not found. Check your email or password.")
 
 
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@bp.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if current_user.is_authenticated:
         if current_user.is_admin:
-            return redirect(url_for('admin'))
+            return redirect(url_for('admin.admin'))
         else:
-            return redirect(url_for('home'))
+            return redirect(url_for('general.home'))
     
     form = LoginForm()
     if form.validate_on_submit():
+        if not allow_login_attempt(form.email.data):
+            flash('Too many login attempts. Please try again later.', 'danger')
+            return render_template('admin_login.html', form=form, title='Admin Login'), 429
         user = User.query.filter_by(email=form.email.data).first()
-        if user and user.is_admin and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and user.is_admin and verify_password(user, form.password.data):
             login_user(user)
-            return redirect(url_for('admin'))
+            return redirect(url_for('admin.admin'))
         else:
             flash('Login Unsuccessful. Please check email and password', 'danger')
         
@@ -97,12 +115,12 @@ def admin_login():
 
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('general.home'))
 
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
\ No newline at end of file
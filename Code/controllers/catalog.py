@@ -0,0 +1,38 @@
+from sqlalchemy import delete, or_, select
+from controllers import db
+from controllers.statistics import adjust_counter
+from models import Book, Section, Rating, IssuedBook, BookRequest, BookRatingStats, BookNeighbour
+
+
+def cascade_delete_statements(book_ids):
+    # One set-based DELETE per dependent table. `book_ids` may be a list or a
+    # SELECT of book ids, so a whole section is removed without loading it.
+    return [
+        delete(Rating).where(Rating.book_id.in_(book_ids)),
+        delete(IssuedBook).where(IssuedBook.book_id.in_(book_ids)),
+        delete(BookRequest).where(BookRequest.book_id.in_(book_ids)),
+        delete(BookRatingStats).where(BookRatingStats.book_id.in_(book_ids)),
+        delete(BookNeighbour).where(or_(BookNeighbour.book_id.in_(book_ids), BookNeighbour.neighbour_id.in_(book_ids))),
+        delete(Book).where(Book.book_id.in_(book_ids)),
+    ]
+
+
+# The running statistics counter kept for each table removed in the cascade.
+CASCADE_COUNTERS = ['ratings', 'issued_books', 'requests', None, None, 'books']
+
+
+def delete_books(book_ids):
+    for statement, counter in zip(cascade_delete_statements(book_ids), CASCADE_COUNTERS):
+        result = db.session.execute(statement, execution_options={'synchronize_session': False})
+        if counter:
+            adjust_counter(counter, -result.rowcount)
+
+
+def delete_section_books(section_id):
+    # Returns the PDF file names so they can be removed after the commit.
+    file_names = db.session.scalars(select(Book.file_name).where(Book.section_id == section_id)).all()
+    delete_books(select(Book.book_id).where(Book.section_id == section_id).scalar_subquery())
+    result = db.session.execute(delete(Section).where(Section.section_id == section_id),
+                                execution_options={'synchronize_session': False})
+    adjust_counter('sections', -result.rowcount)
+    return file_names
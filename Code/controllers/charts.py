@@ -0,0 +1,164 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from flask import abort, send_from_directory, current_app
+from controllers import db
+from controllers.metrics import timed
+from controllers.page_cache import catalog_version
+from models import Book, BookRatingStats
+
+
+def init_app(app):
+    app.config.setdefault('CHART_FOLDER', os.path.join(app.instance_path, 'charts'))
+    app.config.setdefault('CHART_WORKERS', 1)
+    # Charts kept on disk; older ones are deleted after each render.
+    app.config.setdefault('CHART_KEEP', 20)
+    app.extensions['charts'] = {'executor': None, 'pending': {}, 'lock': Lock()}
+
+
+def chart_folder():
+    folder = current_app.config['CHART_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def chart_key():
+    # Ratings and book names are part of the catalog, so its version names
+    # the chart without reading a single rated book.
+    return f'catalog-{catalog_version()}'
+
+
+def average_ratings():
+    return db.session.query(Book.name, BookRatingStats.avg_rating)\
+        .join(BookRatingStats, Book.book_id == BookRatingStats.book_id)\
+        .filter(BookRatingStats.rating_count > 0)\
+        .order_by(Book.book_id).all()
+
+
+def render_average_ratings(ratings, path):
+    # The object-oriented API keeps each render on its own figure, so this is
+    # safe off the main thread, unlike the global pyplot state machine.
+    with timed('chart_render'):
+        _render_average_ratings(ratings, path)
+
+
+def _render_in_app(app, path):
+    # The ratings are read here, in the render thread, never by a request.
+    with app.app_context():
+        try:
+            render_average_ratings(average_ratings(), path)
+        except Exception:
+            app.logger.exception('Rendering %s failed', path)
+            raise
+        prune_charts(os.path.dirname(path), app.config['CHART_KEEP'])
+
+
+def prune_charts(folder, keep):
+    # Every change to the ratings gives a new file name, so without this the
+    # folder only ever grows. A page still pointing at a pruned chart gets it
+    # rendered again by chart_response if it is still the current one.
+    charts = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith('.png'):
+            try:
+                charts.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+    charts.sort(reverse=True)
+    for _, path in charts[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _render_average_ratings(ratings, path):
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(10, 6))
+    axes = figure.subplots()
+    axes.bar([name for name, _ in ratings], [avg for _, avg in ratings], color='skyblue')
+    axes.set_xlabel('Book Name')
+    axes.set_ylabel('Average Rating')
+    axes.set_title('Average Ratings for Books')
+    axes.tick_params(axis='x', labelrotation=45)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment('right')
+    figure.tight_layout()
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.png', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as tmp:
+        figure.savefig(tmp, format='png')
+    os.replace(tmp_path, path)
+
+
+def _submit(key):
+    state = current_app.extensions['charts']
+    path = os.path.join(chart_folder(), f'{key}.png')
+    with state['lock']:
+        if key in state['pending']:
+            return state['pending'][key]
+        if state['executor'] is None:
+            state['executor'] = ThreadPoolExecutor(max_workers=current_app.config['CHART_WORKERS'],
+                                                   thread_name_prefix='chart')
+        future = state['executor'].submit(_render_in_app, current_app._get_current_object(), path)
+        state['pending'][key] = future
+
+    def forget(_):
+        with state['lock']:
+            state['pending'].pop(key, None)
+    future.add_done_callback(forget)
+    return future
+
+
+def _rendering(key):
+    state = current_app.extensions['charts']
+    with state['lock']:
+        return key in state['pending']
+
+
+def newest_chart():
+    charts = []
+    for entry in os.scandir(chart_folder()):
+        if entry.name.endswith('.png'):
+            try:
+                charts.append((entry.stat().st_mtime, entry.name[:-len('.png')]))
+            except FileNotFoundError:
+                pass
+    return max(charts)[1] if charts else None
+
+
+def average_ratings_chart():
+    # The key of the chart to show: the current one once it is on disk,
+    # otherwise the newest chart rendered so far while the current one is
+    # rendered in the background. None until the first chart exists.
+    key = chart_key()
+    if os.path.exists(os.path.join(chart_folder(), f'{key}.png')):
+        return key
+    _submit(key)
+    return newest_chart()
+
+
+def rendering_response():
+    # Requests never wait for matplotlib; the client asks again shortly.
+    return 'The chart is being rendered.', 202, {'Retry-After': '2', 'Cache-Control': 'no-store'}
+
+
+def chart_response(key):
+    filename = f'{key}.png'
+    if not os.path.exists(os.path.join(chart_folder(), filename)):
+        if _rendering(key):
+            return rendering_response()
+        # Another worker rendered the page, or the chart was pruned since;
+        # render it again if it is still the current one.
+        if key != chart_key():
+            abort(404)
+        _submit(key)
+        return rendering_response()
+
+    response = send_from_directory(chart_folder(), filename, mimetype='image/png', conditional=True, max_age=31536000)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,49 @@
+import os
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Engine settings come from the environment so the same code runs on the
+# bundled SQLite file in development and on PostgreSQL in production, e.g.
+#   DATABASE_URL=postgresql://library:secret@db/library
+
+
+def database_uri():
+    uri = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def sqlite_busy_timeout():
+    return int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+
+def engine_options(uri):
+    pool = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    }
+    if uri.startswith('sqlite'):
+        if uri in ('sqlite://', 'sqlite:///:memory:'):
+            return {}
+        # With WAL, readers don't block the writer, so a pool of connections
+        # lets concurrent requests read in parallel.
+        return dict(pool, connect_args={'timeout': sqlite_busy_timeout() / 1000, 'check_same_thread': False})
+    options = dict(pool, pool_pre_ping=True, pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)))
+    if uri.startswith('postgresql'):
+        timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    return options
+
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={sqlite_busy_timeout()}')
+    cursor.close()
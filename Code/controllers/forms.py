@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, PasswordField, SubmitField, BooleanField,DateField,DateTimeField, TextAreaField, RadioField
-from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
+from wtforms import StringField, PasswordField, SubmitField, BooleanField,DateField,DateTimeField, TextAreaField, RadioField, IntegerField, SelectField, SelectMultipleField
+from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, NumberRange, Optional
 from models import User,Section,Book
 import datetime
 
@@ -95,4 +95,19 @@ class BookRequestForm(FlaskForm):
 
 class SearchForm(FlaskForm):
     query = StringField('Search', validators=[DataRequired()],render_kw={'placeholder':'Search'})
-    submit = SubmitField('Search')
\ No newline at end of file
+    submit = SubmitField('Search')
+
+
+class BulkRequestForm(FlaskForm):
+    # Either the requests ticked on the page, or every request matching the
+    # filters. With no filter set that is every pending request, which has to
+    # be confirmed with `everything`.
+    scope = RadioField('Apply to', choices=[('selected', 'Selected requests'), ('filter', 'All requests matching')],
+                       default='selected', render_kw={'class':'no_bullets'})
+    request_ids = SelectMultipleField('Requests', coerce=int, validate_choice=False)
+    book_id = IntegerField('Book ID', validators=[Optional(), NumberRange(min=1)])
+    section = SelectField('Section', coerce=int, default=0)
+    older_than_days = IntegerField('Requested more than (days) ago', validators=[Optional(), NumberRange(min=0)])
+    everything = BooleanField('No filter: apply to every pending request')
+    approve = SubmitField('Approve')
+    reject = SubmitField('Reject')
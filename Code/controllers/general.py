@@ -1,36 +1,52 @@
-from flask import  request, render_template, redirect, url_for, flash
+from flask import request, render_template, redirect, url_for, flash, abort, make_response, send_from_directory, Blueprint, current_app
 from flask_login import login_required, current_user
-from controllers import app, db
+from controllers import db
 from models import Book, Section, BookRequest, IssuedBook, Rating
 from controllers.forms import BookRequestForm, RateBook, SearchForm
 from controllers.utils import *
-from sqlalchemy import or_
-@app.route('/')
+from controllers.search import search_books, search_sections
+from controllers.pagination import keyset_paginate
+from controllers.ratings import record_rating
+from controllers.loans import loan_status, create_book_request
+from controllers.page_cache import cached_page, bump_catalog_version
+from controllers.statistics import adjust_counter, record_event
+from controllers.access import access_cache, book_token, verify_book_token
+from controllers.recommendations import similar_books, similar_books_for
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import raiseload
+
+bp = Blueprint('general', __name__, cli_group=None)
+@bp.route('/')
+@cached_page
 def home():
     if current_user.is_authenticated and current_user.is_admin:
-        return redirect(url_for('admin'))
+        return redirect(url_for('admin.admin'))
 
     if current_user.is_authenticated:
-        books = Book.query.all()
-        return render_template('user_home.html',title='Home',books=books)
+        page = keyset_paginate(Book.query.options(raiseload('*')), Book.book_id)
+        similar = similar_books_for([book.book_id for book in page.items])
+        return render_template('user_home.html',title='Home',books=page.items, page=page, similar=similar)
     else:
         return render_template('home.html', title='Home')
 
 
-@app.route("/sections")
+@bp.route("/sections")
 @login_required
+@cached_page
 def sections():
-    sections = Section.query.all()
-    return render_template('sections_page.html', title='Sections', sections=sections)
+    page = keyset_paginate(Section.query.options(raiseload('*')), Section.section_id)
+    return render_template('sections_page.html', title='Sections', sections=page.items, page=page)
 
-@app.route("/section/<int:section_id>")
+@bp.route("/section/<int:section_id>")
 @login_required
+@cached_page
 def section(section_id):
-    books = db.session.query(Book).filter(Book.section_id == section_id).all()
-    return render_template('section.html', title='Section', books=books)
+    page = keyset_paginate(Book.query.options(raiseload('*')).filter(Book.section_id == section_id), Book.book_id)
+    similar = similar_books_for([book.book_id for book in page.items])
+    return render_template('section.html', title='Section', books=page.items, page=page, similar=similar)
 
 
-@app.route("/my_books")
+@bp.route("/my_books")
 @login_required
 def my_books():
     
@@ -43,82 +59,131 @@ def my_books():
 
 
 
-@app.route("/book/<int:book_id>")
+@bp.route("/book/<int:book_id>")
 @login_required
 def book_detail(book_id):
     book = Book.query.get_or_404(book_id)
     if not book:
         flash('Book not found', 'danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     
     if has_permission(current_user,book):
-        return render_template('book.html', title='Book Detail', book=book)
+        pdf_url = url_for('general.book_pdf', book_id=book.book_id, token=book_token(current_user.user_id, book))
+        return render_template('book.html', title='Book Detail', book=book, pdf_url=pdf_url,
+                               similar=similar_books(book.book_id))
     else:
         flash('You do not have permission to view this book Request this book', 'danger')
-        return redirect(url_for('request_book', book_id=book_id))
+        return redirect(url_for('general.request_book', book_id=book_id))
+
+
+@bp.route("/book/<int:book_id>/pdf")
+@login_required
+def book_pdf(book_id):
+    # The viewer fetches the file in many range requests; with a valid token
+    # from book_detail none of them touch the database. The token saves the
+    # book lookup, while the cached loan set still applies a revocation
+    # within CACHE_VERSION_INTERVAL seconds.
+    file_name = verify_book_token(request.args.get('token', ''), current_user.user_id, book_id)
+    if file_name is not None and not current_user.is_admin and book_id not in access_cache.books(current_user.user_id):
+        abort(403)
+    if file_name is None:
+        book = Book.query.get_or_404(book_id)
+        if not has_permission(current_user, book):
+            abort(403)
+        file_name = book.file_name
+
+    accel_prefix = current_app.config['PDF_ACCEL_REDIRECT_PREFIX']
+    if accel_prefix:
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + file_name
+        response.headers['Content-Type'] = 'application/pdf'
+    else:
+        # conditional=True gives Range/206, ETag/Last-Modified and 304 handling;
+        # USE_X_SENDFILE or the server's wsgi.file_wrapper make it zero-copy.
+        response = send_from_directory(pdf_folder(), file_name, mimetype='application/pdf', conditional=True)
+
+    # Access can be revoked, so shared caches must not keep the file and
+    # browsers revalidate (cheaply, via 304) on every open.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
-        
 
 
-@app.route('/request_book/<int:book_id>', methods=['GET', 'POST'])
+@bp.route('/request_book/<int:book_id>', methods=['GET', 'POST'])
 @login_required
 def request_book(book_id):
     
     book = Book.query.get_or_404(book_id)
+    max_books = current_app.config['MAX_ACTIVE_BOOKS']
 
-    if BookRequest.query.filter_by(book_id=book_id,user_id=current_user.user_id).first():
+    requested, issued, active_books = loan_status(current_user.user_id, book_id)
+    if requested:
         flash('Book is already requested', 'danger')
-        return redirect(url_for('home'))
-    if IssuedBook.query.filter_by(book_id=book_id,user_id=current_user.user_id).first():
+        return redirect(url_for('general.home'))
+    if issued:
         flash('Book is already issued', 'danger')
-        return redirect(url_for('home'))
-    
-    requests =len(BookRequest.query.filter_by(user_id=current_user.user_id).all()) + len(IssuedBook.query.filter_by(user_id=current_user.user_id).all())
-    if requests > 5:
-        flash('You can not request more than 5 books', 'danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
+    if active_books >= max_books:
+        flash(f'You can not request more than {max_books} books', 'danger')
+        return redirect(url_for('general.home'))
 
     form = BookRequestForm()
     if form.validate_on_submit():
         return_date = form.return_date.data
-        book_request = BookRequest(user_id=current_user.user_id, book_id=book_id, return_date=return_date)
-        db.session.add(book_request)
-        db.session.commit()
+        try:
+            created = create_book_request(current_user.user_id, book_id, return_date)
+            if created:
+                adjust_counter('requests')
+                record_event('requests')
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Book is already requested', 'danger')
+            return redirect(url_for('general.home'))
+        if not created:
+            flash(f'You can not request more than {max_books} books', 'danger')
+            return redirect(url_for('general.home'))
         flash('Book requested successfully', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     return render_template('request_book.html', title='Request Book', book=book, form=form)
 
 
-@app.route('/cancel_request/<int:book_id>', methods=['GET', 'POST'])
+@bp.route('/cancel_request/<int:book_id>', methods=['GET', 'POST'])
 @login_required
 def cancel_request(book_id):
     book_request = BookRequest.query.filter_by(book_id=book_id,user_id=current_user.user_id).first()
     if book_request:
         db.session.delete(book_request)
+        adjust_counter('requests', -1)
+        record_event('cancellations')
         db.session.commit()
         flash('Request cancelled successfully', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     else:
         flash('Request not found', 'danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
 
 
-@app.route('/return_book/<int:book_id>', methods=['GET', 'POST'])
+@bp.route('/return_book/<int:book_id>', methods=['GET', 'POST'])
 @login_required
 def return_book(book_id):
     issued_book = IssuedBook.query.filter_by(book_id=book_id,user_id=current_user.user_id).first()
     if issued_book:
         db.session.delete(issued_book)
+        adjust_counter('issued_books', -1)
+        record_event('returns')
         db.session.commit()
+        access_cache.invalidate()
         flash('Book returned successfully', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     else:
         flash('Book is not issued', 'danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     
 
 
-@app.route('/rate_book/<int:book_id>', methods=['GET', 'POST'])
+@bp.route('/rate_book/<int:book_id>', methods=['GET', 'POST'])
 @login_required
 def rate_book(book_id):
     book = Book.query.get_or_404(book_id)
@@ -129,7 +194,7 @@ def rate_book(book_id):
     if rating:
         
         flash('You have already rated this book', 'danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     
 
     form = RateBook()
@@ -138,30 +203,34 @@ def rate_book(book_id):
         feedback = form.feedback.data
         rating = Rating(user_id=current_user.user_id, book_id=book_id, rating=rating_value, feedback=feedback)
         db.session.add(rating)
-        db.session.commit()
+        try:
+            record_rating(book_id, rating_value)
+            adjust_counter('ratings')
+            record_event('ratings')
+            db.session.commit()
+            bump_catalog_version()
+        except IntegrityError:
+            db.session.rollback()
+            flash('You have already rated this book', 'danger')
+            return redirect(url_for('general.home'))
         flash('Book rated successfully', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('general.home'))
     return render_template('rate_book.html', title='Rate Book', book=book, form=form)
     
 
-@app.route('/search', methods=['GET', 'POST'])
+@bp.route('/search', methods=['GET', 'POST'])
 @login_required
 def search_result():
     form = SearchForm()
 
     if form.validate_on_submit():
-        query = form.query.data
-        sections = Section.query.filter(Section.name.like('%'+query+'%')).all()
-        books = Book.query.filter(
-            or_(
-                Book.name.like('%'+query+'%'),
-                Book.description.like('%'+query+'%'),
-                Book.author.like('%'+query+'%')
-            )
-        ).all()
-        print(sections)
-        print(books)
-        return render_template('search_results.html', title='Search', sections=sections, books=books, query=query)
+        return redirect(url_for('general.search_result', q=form.query.data))
+
+    query = request.args.get('q', '').strip()
+    if query:
+        page = request.args.get('page', 1, type=int)
+        books, more_books = search_books(query, page)
+        sections, more_sections = search_sections(query, page)
+        return render_template('search_results.html', title='Search', sections=sections, books=books, query=query,
+                               page=page, has_next=more_books or more_sections)
     return render_template('search_form.html', title='Search', form=form)
-
-
@@ -0,0 +1,28 @@
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from controllers import db
+from controllers.schema import schema_ready
+
+bp = Blueprint('health', __name__, cli_group=None)
+
+
+@bp.route('/healthz')
+def healthz():
+    # Liveness: the worker is up and answering, nothing else is checked.
+    return jsonify(status='ok')
+
+
+@bp.route('/readyz')
+def readyz():
+    # Readiness: the worker can reach the database and it has every table and
+    # column the models use, so it can take traffic.
+    try:
+        db.session.execute(text('SELECT 1'))
+        missing = schema_ready()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify(status='unavailable', error=type(e).__name__), 503
+    if missing:
+        return jsonify(status='unavailable', error='schema', missing=missing), 503
+    return jsonify(status='ok')
@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from flask import current_app
+from werkzeug.local import LocalProxy
+from collections import OrderedDict, namedtuple
+from flask_login import UserMixin
+from controllers import db, login_manager
+from controllers.versions import bump_version, cache_version
+from models import User
+
+
+def init_app(app):
+    app.config.setdefault('IDENTITY_CACHE_TTL', 60)
+    app.config.setdefault('IDENTITY_CACHE_SIZE', 10000)
+    # Optional shared cache with a redis-py style interface: get(key),
+    # set(key, value, ex=seconds) and delete(key). A redis.Redis client can be
+    # plugged in directly; MemoryBackend stands in for it locally. Either way
+    # entries are only used while the identity version in the database is the
+    # one they were cached at.
+    app.config.setdefault('IDENTITY_CACHE_BACKEND', None)
+    app.extensions['identity_cache'] = IdentityCache()
+
+
+class Identity(namedtuple('Identity', ['user_id', 'username', 'is_admin']), UserMixin):
+    # Slim, immutable stand-in for the User row used as current_user.
+    def get_id(self):
+        return self.user_id
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, 0))
+            if expires <= time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ex or float('inf')))
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class IdentityCache:
+    # Entries are tagged with the identity version, which is bumped whenever
+    # a user is deleted or changed, so every process drops them within
+    # CACHE_VERSION_INTERVAL seconds.
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _backend(self):
+        return current_app.config['IDENTITY_CACHE_BACKEND']
+
+    def _key(self, user_id, version):
+        return f'identity:{version}:{user_id}'
+
+    def get(self, user_id, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now and entry[2] == version:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return entry[0]
+        backend = self._backend()
+        if backend is not None:
+            raw = backend.get(self._key(user_id, version))
+            if raw is not None:
+                identity = Identity(*json.loads(raw))
+                self._store(user_id, identity, version)
+                with self._lock:
+                    self.stats['hits'] += 1
+                return identity
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def _store(self, user_id, identity, version):
+        with self._lock:
+            self._entries[user_id] = (identity, time.monotonic() + current_app.config['IDENTITY_CACHE_TTL'], version)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > current_app.config['IDENTITY_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def set(self, user_id, identity, version):
+        # `version` is the one get() was called with, read before the user.
+        self._store(user_id, identity, version)
+        backend = self._backend()
+        if backend is not None:
+            backend.set(self._key(user_id, version), json.dumps(list(identity)),
+                        ex=current_app.config['IDENTITY_CACHE_TTL'])
+
+    def invalidate(self, user_id):
+        # Call after committing the change. Bumping the version reaches every
+        # process, web workers included when this runs in a CLI command; users
+        # change rarely enough that dropping every entry is cheap.
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.stats['invalidations'] += 1
+        bump_version('identity')
+
+
+# The current app's cache; every app has its own, so users of one database
+# are never served to another.
+identity_cache = LocalProxy(lambda: current_app.extensions['identity_cache'])
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    user_id = int(user_id)
+    version = cache_version('identity')
+    identity = identity_cache.get(user_id, version)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = Identity(user.user_id, user.username, user.is_admin)
+        identity_cache.set(user_id, identity, version)
+    return identity
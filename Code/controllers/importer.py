@@ -0,0 +1,170 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from flask import current_app
+from flask.cli import with_appcontext
+from concurrent.futures import ThreadPoolExecutor
+import click
+from sqlalchemy import delete, insert, select
+from controllers import db
+from controllers.utils import pdf_blob_path, claim_pdf_blob, store_pdf_stream, PdfChecksumMismatch
+from controllers.page_cache import bump_catalog_version
+from controllers.statistics import adjust_counter
+from models import Book, Section, StatCounter
+
+
+class ImportRowError(Exception):
+    pass
+
+
+def read_manifest(path, manifest_format):
+    # Yields (row number, record) one line at a time, so the manifest is never
+    # held in memory.
+    with open(path, newline='', encoding='utf-8') as manifest:
+        if manifest_format == 'csv':
+            records = csv.DictReader(manifest)
+        else:
+            records = (json.loads(line) for line in manifest if line.strip())
+        for number, record in enumerate(records, start=1):
+            yield number, record
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def copy_pdf(source, expected_sha256=None):
+    # PDFs are content-addressed, so a manifest checksum that is already in the
+    # store skips the copy entirely (re-runs and duplicate files are free).
+    # Returns (file name, bytes copied).
+    if expected_sha256:
+        file_name = pdf_blob_path(expected_sha256.lower())
+        if claim_pdf_blob(file_name):
+            return file_name, 0
+    with open(source, 'rb') as src:
+        try:
+            return store_pdf_stream(src, expected_sha256)
+        except PdfChecksumMismatch:
+            raise ImportRowError(f"checksum mismatch for {source}")
+
+
+def prepare_row(manifest_path, number, record):
+    for field in ('name', 'description', 'author', 'section', 'pdf'):
+        if not record.get(field):
+            raise ImportRowError(f"row {number}: missing '{field}'")
+    source = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), record['pdf'])
+    if not os.path.isfile(source):
+        raise ImportRowError(f"row {number}: PDF not found at {source}")
+    return copy_pdf(source, record.get('sha256'))
+
+
+def _prepare_in_app(app, manifest_path, number, record):
+    # Pool threads have no app context, and the PDF store reads its folder
+    # from the app's config.
+    with app.app_context():
+        return prepare_row(manifest_path, number, record)
+
+
+class SectionIds:
+    def __init__(self):
+        self._ids = {name: section_id for section_id, name in db.session.query(Section.section_id, Section.name)}
+        self.created = 0
+
+    def get(self, record):
+        name = record['section']
+        if name not in self._ids:
+            section = Section(name=name, description=record.get('section_description') or name)
+            db.session.add(section)
+            db.session.flush()
+            self._ids[name] = section.section_id
+            adjust_counter('sections')
+            self.created += 1
+        return self._ids[name]
+
+
+def progress_counter(manifest):
+    # The last imported row of a manifest is kept in stat_counter and moved in
+    # each batch's transaction, so a batch and its checkpoint commit together
+    # and a resumed import never inserts a committed batch twice.
+    return 'import:' + hashlib.sha256(os.path.abspath(manifest).encode('utf-8')).hexdigest()[:32]
+
+
+def load_progress(counter):
+    return db.session.scalar(select(StatCounter.value).where(StatCounter.name == counter)) or 0
+
+
+@click.command('import-catalog')
+@with_appcontext
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'manifest_format', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Manifest format, guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True, help='Books inserted per transaction.')
+@click.option('--workers', default=8, show_default=True, help='Threads copying PDFs.')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and start from the first row.')
+def import_catalog(manifest, manifest_format, batch_size, workers, restart):
+    """Import books and PDFs from a CSV or JSON lines manifest.
+
+    Each row needs name, description, author, section and pdf (a path relative
+    to the manifest); section_description and sha256 are optional.
+    """
+    manifest_format = manifest_format or ('csv' if manifest.lower().endswith('.csv') else 'jsonl')
+    counter = progress_counter(manifest)
+    if restart:
+        db.session.execute(delete(StatCounter).where(StatCounter.name == counter))
+        db.session.commit()
+    rows_done = load_progress(counter)
+    if rows_done:
+        click.echo(f"Resuming after row {rows_done}.")
+
+    sections = SectionIds()
+    checkpoint = rows_done
+    imported = failed = copied_bytes = 0
+    started = time.perf_counter()
+    rows = ((number, record) for number, record in read_manifest(manifest, manifest_format) if number > rows_done)
+
+    app = current_app._get_current_object()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in batched(rows, batch_size):
+            futures = [pool.submit(_prepare_in_app, app, manifest, number, record) for number, record in batch]
+            books = []
+            for (number, record), future in zip(batch, futures):
+                try:
+                    file_name, copied = future.result()
+                except (ImportRowError, OSError) as e:
+                    failed += 1
+                    click.echo(f"Skipped: {e}", err=True)
+                    continue
+                copied_bytes += copied
+                books.append({'name': record['name'], 'description': record['description'],
+                              'author': record['author'], 'file_name': file_name,
+                              'section_id': sections.get(record)})
+            if books:
+                db.session.execute(insert(Book), books)
+                adjust_counter('books', len(books))
+            adjust_counter(counter, batch[-1][0] - checkpoint)
+            db.session.commit()
+            checkpoint = batch[-1][0]
+            imported += len(books)
+
+            elapsed = time.perf_counter() - started
+            click.echo(f"{imported} books imported, {imported / elapsed:.0f} rows/sec, "
+                       f"{copied_bytes / elapsed / 2 ** 20:.1f} MB/sec")
+
+    bump_catalog_version()
+    elapsed = time.perf_counter() - started
+    click.echo(f"Imported {imported} books ({failed} skipped, {sections.created} new sections) in {elapsed:.1f}s: "
+               f"{imported / max(elapsed, 1e-9):.0f} rows/sec, {copied_bytes / max(elapsed, 1e-9) / 2 ** 20:.1f} MB/sec.")
+    if imported:
+        click.echo("Run `flask process-pdfs` to extract their text, page counts and thumbnails.")
+
+
+def init_app(app):
+    app.cli.add_command(import_catalog)
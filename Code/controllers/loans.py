@@ -0,0 +1,154 @@
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, exists, func, insert, literal, select
+from controllers import db
+from controllers.statistics import adjust_counter, record_event
+from controllers.metrics import loans_expired, metrics_enabled, timed
+from controllers.query_guard import housekeeping_exempt, uncounted
+from controllers.access import access_cache
+from models import User, Book, IssuedBook, BookRequest
+
+
+def init_app(app):
+    app.config.setdefault('LOAN_EXPIRY_INTERVAL', 60)
+    app.config.setdefault('MAX_ACTIVE_BOOKS', 5)
+    app.extensions['loans'] = {'lock': Lock(), 'last_expiry': None}
+    app.before_request(expire_loans_periodically)
+    app.cli.add_command(expire_loans_command)
+
+
+def expire_loans(now=None):
+    # Timed as task_duration_seconds{task="expire_loans"}; the rows removed
+    # are counted in loans_expired_total.
+    with timed('expire_loans'):
+        expired = IssuedBook.query.filter(IssuedBook.return_date < (now or datetime.now())).delete(
+            synchronize_session=False)
+        adjust_counter('issued_books', -expired)
+        record_event('expirations', expired)
+        db.session.commit()
+        if expired:
+            access_cache.invalidate()
+    if metrics_enabled():
+        loans_expired.inc(amount=expired)
+    if expired:
+        current_app.logger.info('Expired %d issued books', expired)
+    return expired
+
+
+def expiry_due():
+    now = time.monotonic()
+    state = current_app.extensions['loans']
+    with state['lock']:
+        if state['last_expiry'] is not None and now - state['last_expiry'] < current_app.config['LOAN_EXPIRY_INTERVAL']:
+            return False
+        state['last_expiry'] = now
+        return True
+
+
+def expire_loans_periodically():
+    if housekeeping_exempt():
+        return
+    if expiry_due():
+        with uncounted():
+            expire_loans()
+
+
+def _active_books(user_id):
+    # Both counts are answered from the (user_id, book_id) indexes.
+    return (select(func.count()).select_from(BookRequest).where(BookRequest.user_id == user_id).scalar_subquery()
+            + select(func.count()).select_from(IssuedBook).where(IssuedBook.user_id == user_id).scalar_subquery())
+
+
+def loan_status(user_id, book_id):
+    # (already requested, already issued, active requests + loans) in one round trip.
+    return db.session.execute(select(
+        exists().where(BookRequest.user_id == user_id, BookRequest.book_id == book_id),
+        exists().where(IssuedBook.user_id == user_id, IssuedBook.book_id == book_id),
+        _active_books(user_id),
+    )).one()
+
+
+def create_book_request(user_id, book_id, return_date):
+    # The limit is checked inside the INSERT itself; the unique (user_id,
+    # book_id) index rejects duplicates with an IntegrityError. That alone is
+    # only race-free on SQLite, which runs one writer at a time. Elsewhere two
+    # transactions could count the same loans under READ COMMITTED and both
+    # insert, so the user's row is locked first and a user's concurrent
+    # requests queue behind each other.
+    if db.engine.dialect.name != 'sqlite':
+        db.session.execute(select(User.user_id).where(User.user_id == user_id).with_for_update())
+    row = select(
+        literal(user_id), literal(book_id), literal(datetime.now(), db.DateTime),
+        literal(return_date, db.DateTime), literal(True),
+    ).where(_active_books(user_id) < current_app.config['MAX_ACTIVE_BOOKS'])
+    result = db.session.execute(insert(BookRequest).from_select(
+        ['user_id', 'book_id', 'request_date', 'return_date', 'status'], row))
+    return result.rowcount == 1
+
+
+def request_filter(request_ids=None, book_id=None, section_id=None, older_than_days=None, now=None):
+    # WHERE clauses selecting the book requests a bulk action applies to.
+    conditions = []
+    if request_ids is not None:
+        conditions.append(BookRequest.request_id.in_(request_ids))
+    if book_id is not None:
+        conditions.append(BookRequest.book_id == book_id)
+    if section_id is not None:
+        conditions.append(BookRequest.book_id.in_(select(Book.book_id).where(Book.section_id == section_id)))
+    if older_than_days is not None:
+        conditions.append(BookRequest.request_date < (now or datetime.now()) - timedelta(days=older_than_days))
+    return conditions
+
+
+def _bounded(conditions):
+    # Caps the batch at the newest matching request, so requests made while
+    # it runs are left for the next one. None if nothing matches.
+    last = db.session.scalar(select(func.max(BookRequest.request_id)).where(*conditions))
+    return None if last is None else [*conditions, BookRequest.request_id <= last]
+
+
+def approve_requests(conditions, now=None):
+    # Turns every matching request into a loan with one INSERT ... SELECT and
+    # one DELETE, in a single transaction. A request for a book the user
+    # already has is removed without a second loan.
+    conditions = _bounded(conditions)
+    if conditions is None:
+        return {'approved': 0, 'already_issued': 0}
+    already_issued = exists().where(IssuedBook.user_id == BookRequest.user_id, IssuedBook.book_id == BookRequest.book_id)
+    loans = select(BookRequest.user_id, BookRequest.book_id, literal(now or datetime.now(), db.DateTime),
+                   BookRequest.return_date).where(*conditions, ~already_issued)
+    approved = db.session.execute(insert(IssuedBook).from_select(
+        ['user_id', 'book_id', 'request_date', 'return_date'], loans)).rowcount
+    removed = db.session.execute(delete(BookRequest).where(*conditions),
+                                 execution_options={'synchronize_session': False}).rowcount
+    adjust_counter('requests', -removed)
+    adjust_counter('issued_books', approved)
+    record_event('approvals', approved)
+    db.session.commit()
+    if approved:
+        access_cache.invalidate()
+    return {'approved': approved, 'already_issued': removed - approved}
+
+
+def reject_requests(conditions):
+    conditions = _bounded(conditions)
+    if conditions is None:
+        return {'rejected': 0}
+    rejected = db.session.execute(delete(BookRequest).where(*conditions),
+                                  execution_options={'synchronize_session': False}).rowcount
+    adjust_counter('requests', -rejected)
+    record_event('rejections', rejected)
+    db.session.commit()
+    return {'rejected': rejected}
+
+
+@click.command('expire-loans')
+@with_appcontext
+def expire_loans_command():
+    started = time.perf_counter()
+    expired = expire_loans()
+    click.echo(f"Expired {expired} issued books in {(time.perf_counter() - started) * 1000:.1f}ms.")
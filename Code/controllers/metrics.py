@@ -0,0 +1,313 @@
+import heapq
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from flask import Blueprint, abort, before_render_template, current_app, g, has_app_context, has_request_context, jsonify, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+bp = Blueprint('metrics', __name__, cli_group=None)
+
+
+@bp.record_once
+def configure(state):
+    state.app.config.setdefault('METRICS_ENABLED', True)
+    # /metrics answers only requests sending this bearer token; without one
+    # it is closed. Behind a local proxy every client looks like loopback, so
+    # the address alone can't tell a scraper from the public.
+    state.app.config.setdefault('METRICS_TOKEN', None)
+    state.app.config.setdefault('SLOW_QUERY_LIMIT', 20)
+    # Opt-in sampling profiler: requests slower than this many seconds have their
+    # sampled stacks written to PROFILE_FOLDER in folded (flamegraph.pl,
+    # speedscope) format.
+    state.app.config.setdefault('PROFILE_SLOW_REQUESTS', None)
+    state.app.config.setdefault('PROFILE_SAMPLE_INTERVAL', 0.005)
+    state.app.config.setdefault('PROFILE_FOLDER', os.path.join(state.app.instance_path, 'profiles'))
+    state.app.wsgi_app = MetricsMiddleware(state.app.wsgi_app, state.app)
+    before_render_template.connect(start_render_timer, state.app)
+    template_rendered.connect(record_render, state.app)
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    # Every series carries the pid: each gunicorn worker keeps its own
+    # metrics and a scrape reaches one of them, so a worker's series must not
+    # be mistaken for another's (or for a counter reset).
+    pairs = list(zip(names, values)) + list(extra) + [('pid', os.getpid())]
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_labels(self.labels, labels)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labels, self.buckets = name, documentation, labels, buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # One slot per bucket plus +Inf, then the sum.
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            values = [(labels, list(entry)) for labels, entry in self._values.items()]
+        for labels, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), entry):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labels, labels, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {entry[-1]}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {cumulative}'
+
+
+request_count = Counter('http_requests_total', 'HTTP requests by endpoint and status.', ('endpoint', 'method', 'status'))
+request_latency = Histogram('http_request_duration_seconds', 'Time spent handling a request.', ('endpoint', 'method'))
+request_statements = Histogram('http_request_sql_statements', 'SQL statements issued per request.', ('endpoint',),
+                               STATEMENT_BUCKETS)
+sql_latency = Histogram('sql_statement_duration_seconds', 'Time spent in SQL statements.', ('endpoint',))
+template_latency = Histogram('template_render_duration_seconds', 'Time spent rendering templates.', ('template',))
+task_latency = Histogram('task_duration_seconds', 'Time spent in instrumented hot paths.', ('task',))
+loans_expired = Counter('loans_expired_total', 'Issued books removed once past their return date.')
+METRICS = [request_count, request_latency, request_statements, sql_latency, template_latency, task_latency,
+           loans_expired]
+
+_slow_queries = []
+_slow_queries_lock = threading.Lock()
+_slow_query_order = itertools.count()
+_render_starts = threading.local()
+
+
+def metrics_enabled():
+    return has_app_context() and current_app.config['METRICS_ENABLED']
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'none'
+
+
+@contextmanager
+def timed(task):
+    # Times a block under task_duration_seconds{task=...}, e.g. bcrypt or
+    # chart rendering, which are invisible in per-route latency alone.
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics_enabled():
+            task_latency.observe(time.perf_counter() - started, task)
+
+
+def _record_slow_query(duration, statement, endpoint):
+    entry = (duration, next(_slow_query_order), ' '.join(statement.split())[:500], endpoint, time.time())
+    with _slow_queries_lock:
+        if len(_slow_queries) < current_app.config['SLOW_QUERY_LIMIT']:
+            heapq.heappush(_slow_queries, entry)
+        elif duration > _slow_queries[0][0]:
+            heapq.heapreplace(_slow_queries, entry)
+
+
+def slowest_queries():
+    with _slow_queries_lock:
+        entries = sorted(_slow_queries, reverse=True)
+    return [{'seconds': duration, 'statement': statement, 'endpoint': endpoint, 'at': at}
+            for duration, _, statement, endpoint, at in entries]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    if not metrics_enabled():
+        return
+    endpoint = _endpoint()
+    sql_latency.observe(duration, endpoint)
+    _record_slow_query(duration, statement, endpoint)
+
+
+def start_render_timer(sender, template, context, **extra):
+    if not hasattr(_render_starts, 'stack'):
+        _render_starts.stack = []
+    _render_starts.stack.append(time.perf_counter())
+
+
+def record_render(sender, template, context, **extra):
+    stack = getattr(_render_starts, 'stack', None)
+    if stack and metrics_enabled():
+        template_latency.observe(time.perf_counter() - stack.pop(), template.name or 'string')
+
+
+@bp.after_app_request
+def note_endpoint(response):
+    # The middleware runs outside the request context, so leave the endpoint
+    # and the statement count (kept by query_guard) where it can find them.
+    request.environ['metrics.endpoint'] = _endpoint()
+    request.environ['metrics.statements'] = g.get('query_count', 0)
+    return response
+
+
+class Sampler:
+    # Samples the stacks of threads that are serving a request, every
+    # PROFILE_SAMPLE_INTERVAL seconds, while at least one of them is.
+    def __init__(self):
+        self.interval = 0.005
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self, ident):
+        with self._lock:
+            self._active[ident] = StackCounter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, ident):
+        with self._lock:
+            return self._active.pop(ident, None)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    self._wakeup.clear()
+            if idle:
+                self._wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own:
+                        stacks[fold_stack(frame)] += 1
+
+
+def fold_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def dump_profile(app, stacks, endpoint, duration):
+    folder = app.config['PROFILE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{duration * 1000:.0f}ms.folded")
+    with open(path, 'w') as profile:
+        for stack, count in stacks.most_common():
+            profile.write(f'{stack} {count}\n')
+    app.logger.info('Slow request %s took %.3fs, profile written to %s', endpoint, duration, path)
+    return path
+
+
+sampler = Sampler()
+
+
+class MetricsMiddleware:
+    # Wraps the whole WSGI app, so request latency includes every
+    # before_request hook and the error handlers, not just the view.
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        config = self.app.config
+        if not config['METRICS_ENABLED']:
+            return self.wsgi_app(environ, start_response)
+        status = []
+
+        def capture_status(code, headers, exc_info=None):
+            status.append(code.split(' ', 1)[0])
+            return start_response(code, headers, exc_info)
+
+        profiling = config['PROFILE_SLOW_REQUESTS'] is not None
+        ident = threading.get_ident()
+        if profiling:
+            sampler.interval = config['PROFILE_SAMPLE_INTERVAL']
+            sampler.start(ident)
+        started = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, capture_status)
+        finally:
+            duration = time.perf_counter() - started
+            endpoint = environ.get('metrics.endpoint', 'unmatched')
+            method = environ.get('REQUEST_METHOD', '')
+            request_count.inc(endpoint, method, status[0] if status else '500')
+            request_latency.observe(duration, endpoint, method)
+            request_statements.observe(environ.get('metrics.statements', 0), endpoint)
+            if profiling:
+                stacks = sampler.stop(ident)
+                if stacks and duration >= config['PROFILE_SLOW_REQUESTS']:
+                    dump_profile(self.app, stacks, endpoint, duration)
+
+
+def metrics_allowed():
+    token = current_app.config['METRICS_TOKEN']
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+@bp.route('/metrics')
+def metrics():
+    if not metrics_allowed():
+        abort(403)
+    lines = [line for metric in METRICS for line in metric.collect()]
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@bp.route('/metrics/slow_queries')
+def slow_queries():
+    if not metrics_allowed():
+        abort(403)
+    return jsonify(slowest_queries())
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from controllers.versions import bump_version, cache_version
+
+
+def init_app(app):
+    app.config.setdefault('PAGE_CACHE_ENABLED', True)
+    app.config.setdefault('PAGE_CACHE_TTL', 60)
+    app.config.setdefault('PAGE_CACHE_SIZE', 1000)
+    # The catalog version is kept in the database, so a change made by any
+    # worker or CLI command invalidates the pages cached by every worker.
+    # Optionally keep it in a shared store (redis-py style get/incr) instead.
+    app.config.setdefault('PAGE_CACHE_BACKEND', None)
+    app.extensions['page_cache'] = {'pages': OrderedDict(), 'lock': threading.Lock()}
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+page_cache_stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+
+def catalog_version():
+    backend = current_app.config['PAGE_CACHE_BACKEND']
+    if backend is not None:
+        return int(backend.get(CATALOG_VERSION_KEY) or 0)
+    return cache_version('catalog')
+
+
+def bump_catalog_version():
+    # Call after committing the change.
+    backend = current_app.config['PAGE_CACHE_BACKEND']
+    if backend is not None:
+        backend.incr(CATALOG_VERSION_KEY)
+    else:
+        bump_version('catalog')
+    state = current_app.extensions['page_cache']
+    with state['lock']:
+        state['pages'].clear()
+
+
+def _role():
+    if not current_user.is_authenticated:
+        return 'anonymous'
+    return 'admin' if current_user.is_admin else 'user'
+
+
+def _lookup(key):
+    state = current_app.extensions['page_cache']
+    with state['lock']:
+        entry = state['pages'].get(key)
+        if entry and entry[0] > time.monotonic():
+            state['pages'].move_to_end(key)
+            return entry[1]
+    return None
+
+
+def _store(key, page):
+    state = current_app.extensions['page_cache']
+    with state['lock']:
+        pages = state['pages']
+        pages[key] = (time.monotonic() + current_app.config['PAGE_CACHE_TTL'], page)
+        pages.move_to_end(key)
+        while len(pages) > current_app.config['PAGE_CACHE_SIZE']:
+            pages.popitem(last=False)
+
+
+def cached_page(view):
+    # Caches the rendered page per route, arguments and role. Goes inside the
+    # login/admin decorators so access checks still run on every hit.
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        # Pages carrying flashed messages are one-off and must not be stored.
+        if not current_app.config['PAGE_CACHE_ENABLED'] or request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        key = (request.endpoint, _role(), request.full_path, catalog_version())
+        page = _lookup(key)
+        if page is None:
+            page_cache_stats['misses'] += 1
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or session.get('_flashes'):
+                return response
+            body = response.get_data()
+            page = (body, hashlib.sha1(body).hexdigest(), response.mimetype)
+            _store(key, page)
+        else:
+            page_cache_stats['hits'] += 1
+
+        body, etag, mimetype = page
+        response = make_response(body)
+        response.mimetype = mimetype
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+        if response.status_code == 304:
+            page_cache_stats['not_modified'] += 1
+        return response
+    return decorated_function
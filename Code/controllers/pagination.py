@@ -0,0 +1,57 @@
+from flask import request, url_for, current_app
+
+
+def init_app(app):
+    app.config.setdefault('PAGE_SIZE', 20)
+    app.config.setdefault('MAX_PAGE_SIZE', 100)
+
+
+class Page:
+    def __init__(self, items, prev_url=None, next_url=None):
+        self.items = items
+        self.prev_url = prev_url
+        self.next_url = next_url
+
+
+def page_size():
+    size = request.args.get('per_page', current_app.config['PAGE_SIZE'], type=int)
+    return max(1, min(size, current_app.config['MAX_PAGE_SIZE']))
+
+
+def _page_url(prefix, **cursor):
+    args = request.args.to_dict()
+    args.pop(prefix + 'after', None)
+    args.pop(prefix + 'before', None)
+    args.update({prefix + name: value for name, value in cursor.items()})
+    # A query argument named like a view argument (?section_id= on
+    # /section/<section_id>) must not be passed to url_for twice.
+    return url_for(request.endpoint, **{**args, **(request.view_args or {})})
+
+
+def keyset_paginate(query, key, cursor=None, prefix=''):
+    # Seek on the unique column `key` using ?after= / ?before= cursors, so each
+    # page is an indexed range scan rather than an OFFSET. `cursor` pulls the key
+    # out of tuple rows and `prefix` lets one view page several lists.
+    per_page = page_size()
+    cursor = cursor or (lambda row: getattr(row, key.key))
+    after = request.args.get(prefix + 'after', type=int)
+    before = request.args.get(prefix + 'before', type=int)
+
+    if before is not None:
+        rows = query.filter(key < before).order_by(key.desc()).limit(per_page + 1).all()
+        has_prev, has_next = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+    else:
+        if after is not None:
+            query = query.filter(key > after)
+        rows = query.order_by(key).limit(per_page + 1).all()
+        has_prev, has_next = after is not None, len(rows) > per_page
+        rows = rows[:per_page]
+
+    if not rows:
+        return Page(rows, prev_url=_page_url(prefix) if has_prev else None)
+    return Page(
+        rows,
+        prev_url=_page_url(prefix, before=cursor(rows[0])) if has_prev else None,
+        next_url=_page_url(prefix, after=cursor(rows[-1])) if has_next else None,
+    )
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from flask import request, current_app, has_request_context
+from controllers import db, bcrypt
+from controllers.metrics import timed
+
+
+def init_app(app):
+    # Per web worker process: gunicorn already runs about two workers per CPU,
+    # so a pool per CPU in each of them would mean ~2 * CPUs^2 bcrypt processes.
+    app.config.setdefault('PASSWORD_HASH_WORKERS', min(2, os.cpu_count() or 1))
+    app.config.setdefault('PASSWORD_HASH_QUEUE', 64)
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+    app.config.setdefault('LOGIN_ATTEMPTS', 10)
+    app.config.setdefault('LOGIN_WINDOW', 60)
+    # The pool is started on first use, so building the app starts no processes.
+    app.extensions['passwords'] = {
+        'executor': None, 'slots': None, 'lock': threading.Lock(), 'attempts': {}, 'attempts_lock': threading.Lock(),
+    }
+    app.register_error_handler(PasswordPoolBusy, password_pool_busy)
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+def _generate(password, rounds):
+    return bcrypt.generate_password_hash(password, rounds).decode('utf-8')
+
+
+def _check(password_hash, password):
+    return bcrypt.check_password_hash(password_hash, password)
+
+
+def _run(func, *args):
+    # Requests hash in a bounded process pool so web workers aren't held for
+    # the full hash cost. Outside a request (CLI commands) and with
+    # PASSWORD_HASH_WORKERS = 0 (tests) the hash runs inline: a one-off
+    # command gains nothing from starting a pool.
+    if not has_request_context() or not current_app.config['PASSWORD_HASH_WORKERS']:
+        return func(*args)
+    state = current_app.extensions['passwords']
+    with state['lock']:
+        if state['executor'] is None:
+            state['executor'] = ProcessPoolExecutor(max_workers=current_app.config['PASSWORD_HASH_WORKERS'])
+            state['slots'] = threading.BoundedSemaphore(current_app.config['PASSWORD_HASH_QUEUE'])
+    slots = state['slots']
+    if not slots.acquire(timeout=current_app.config['PASSWORD_HASH_TIMEOUT']):
+        raise PasswordPoolBusy()
+    try:
+        return state['executor'].submit(func, *args).result(timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+    except FutureTimeout:
+        # The hash is still running; answer like a full queue instead of a 500.
+        raise PasswordPoolBusy()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    with timed('bcrypt_hash'):
+        return _run(_generate, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+
+def hash_rounds(password_hash):
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def verify_password(user, password):
+    with timed('bcrypt_check'):
+        matches = _run(_check, user.password, password)
+    if not matches:
+        return False
+    # Upgrade hashes made with a lower cost factor while we have the plaintext.
+    if hash_rounds(user.password) < current_app.config['BCRYPT_LOG_ROUNDS']:
+        user.password = hash_password(password)
+        db.session.commit()
+    return True
+
+
+def allow_login_attempt(email):
+    # Fixed-window limit per client address and per account, checked before
+    # any hashing so a flood of guesses can't starve the pool.
+    now = time.monotonic()
+    window = current_app.config['LOGIN_WINDOW']
+    keys = ('ip:' + (request.remote_addr or ''), 'email:' + (email or '').lower())
+    state = current_app.extensions['passwords']
+    attempts = state['attempts']
+    with state['attempts_lock']:
+        if len(attempts) > 10000:
+            for key in [key for key, (started, _) in attempts.items() if now - started >= window]:
+                del attempts[key]
+        allowed = True
+        for key in keys:
+            started, count = attempts.get(key, (now, 0))
+            if now - started >= window:
+                started, count = now, 0
+            attempts[key] = (started, count + 1)
+            if count >= current_app.config['LOGIN_ATTEMPTS']:
+                allowed = False
+        return allowed
+
+
+def password_pool_busy(e):
+    return 'The server is busy, please try again shortly.', 503, {'Retry-After': '5'}
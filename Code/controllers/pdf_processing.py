@@ -0,0 +1,171 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+import click
+from flask import send_from_directory, Blueprint, current_app
+from flask_login import login_required
+from sqlalchemy import select, update
+from controllers import db
+from controllers.metrics import timed
+from controllers.page_cache import bump_catalog_version
+from controllers.utils import pdf_path, thumbnail_name, thumbnail_path
+from models import Book
+
+bp = Blueprint('pdf_processing', __name__, cli_group=None)
+
+
+@bp.record_once
+def configure(state):
+    # Uploads are processed in a pool of this many processes after the
+    # response; 0 processes them inline (tests, CLI).
+    state.app.config.setdefault('PDF_PROCESSING_WORKERS', 1)
+    # Files waiting for the pool. Past this, new uploads are left for
+    # `flask process-pdfs` rather than making the upload wait.
+    state.app.config.setdefault('PDF_PROCESSING_QUEUE', 32)
+    state.app.config.setdefault('PDF_TEXT_LIMIT', 1_000_000)
+    state.app.config.setdefault('THUMBNAIL_FOLDER', os.path.join(state.app.instance_path, 'thumbnails'))
+    state.app.config.setdefault('THUMBNAIL_WIDTH', 160)
+    state.app.extensions['pdf_processing'] = {'executor': None, 'pending': {}, 'lock': threading.Lock()}
+
+
+def extract_pdf(path, thumbnail_path, text_limit, width):
+    # Runs in a pool process: page count, size and text of the PDF, plus a
+    # PNG of its first page `width` pixels wide. No app or database here.
+    import pymupdf
+
+    details = {'file_size': os.path.getsize(path), 'thumbnail': False}
+    with pymupdf.open(path) as document:
+        details['page_count'] = document.page_count
+        text, length = [], 0
+        for page in document:
+            if length >= text_limit:
+                break
+            page_text = page.get_text()
+            text.append(page_text)
+            length += len(page_text)
+        details['body_text'] = ''.join(text)[:text_limit]
+        if document.page_count:
+            if not os.path.exists(thumbnail_path):
+                page = document[0]
+                pixmap = page.get_pixmap(matrix=pymupdf.Matrix(width / page.rect.width, width / page.rect.width))
+                os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(suffix='.png', dir=os.path.dirname(thumbnail_path))
+                with os.fdopen(fd, 'wb') as tmp:
+                    tmp.write(pixmap.tobytes('png'))
+                os.replace(tmp_path, thumbnail_path)
+            details['thumbnail'] = True
+    return details
+
+
+def _extract_args(file_name):
+    config = current_app.config
+    return pdf_path(file_name), thumbnail_path(file_name), config['PDF_TEXT_LIMIT'], config['THUMBNAIL_WIDTH']
+
+
+def store_pdf_details(file_name, details):
+    # Every book sharing the blob gets the same details.
+    updated = db.session.execute(update(Book).where(Book.file_name == file_name).values(
+        page_count=details['page_count'], file_size=details['file_size'], body_text=details['body_text'],
+        thumbnail=thumbnail_name(file_name) if details['thumbnail'] else None,
+    ), execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+    bump_catalog_version()
+    return updated
+
+
+def copy_known_details(file_name):
+    # An upload identical to an already processed PDF reuses its details.
+    known = db.session.execute(
+        select(Book.page_count, Book.file_size, Book.body_text, Book.thumbnail)
+        .where(Book.file_name == file_name, Book.page_count.is_not(None)).limit(1)).first()
+    if known is None:
+        return False
+    page_count, file_size, body_text, thumbnail = known
+    store_pdf_details(file_name, {'page_count': page_count, 'file_size': file_size, 'body_text': body_text,
+                                  'thumbnail': thumbnail is not None})
+    return True
+
+
+def process_pdf(file_name):
+    with timed('pdf_processing'):
+        return store_pdf_details(file_name, extract_pdf(*_extract_args(file_name)))
+
+
+def _store_result(app, file_name, future):
+    with app.app_context():
+        try:
+            store_pdf_details(file_name, future.result())
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Processing %s failed', file_name)
+        finally:
+            state = app.extensions['pdf_processing']
+            with state['lock']:
+                state['pending'].pop(file_name, None)
+
+
+def queue_pdf_processing(file_name):
+    # Called after the book is committed. Never waits for the pool: returns
+    # False if the file was left for `flask process-pdfs` instead.
+    if copy_known_details(file_name):
+        return True
+    if not current_app.config['PDF_PROCESSING_WORKERS']:
+        try:
+            process_pdf(file_name)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Processing %s failed', file_name)
+            return False
+        return True
+    state = current_app.extensions['pdf_processing']
+    with state['lock']:
+        if file_name in state['pending']:
+            return True
+        if len(state['pending']) >= current_app.config['PDF_PROCESSING_QUEUE']:
+            current_app.logger.warning('PDF processing queue full, leaving %s for process-pdfs', file_name)
+            return False
+        if state['executor'] is None:
+            state['executor'] = ProcessPoolExecutor(max_workers=current_app.config['PDF_PROCESSING_WORKERS'])
+        future = state['executor'].submit(extract_pdf, *_extract_args(file_name))
+        state['pending'][file_name] = future
+    future.add_done_callback(partial(_store_result, current_app._get_current_object(), file_name))
+    return True
+
+
+@bp.route('/thumbnails/<path:name>')
+@login_required
+def thumbnail(name):
+    # Named after the PDF's content hash, so a thumbnail never changes.
+    response = send_from_directory(current_app.config['THUMBNAIL_FOLDER'], name, mimetype='image/png',
+                                   conditional=True, max_age=31536000)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+@bp.cli.command('process-pdfs')
+@click.option('--all', 'everything', is_flag=True, help='Reprocess PDFs that already have details.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Processes extracting PDFs.')
+def process_pdfs_command(everything, workers):
+    """Extract text, page counts and thumbnails for existing PDFs."""
+    query = select(Book.file_name).distinct()
+    if not everything:
+        query = query.where(Book.page_count.is_(None))
+    file_names = db.session.scalars(query).all()
+    started = time.perf_counter()
+    processed = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_pdf, *_extract_args(file_name)): file_name for file_name in file_names}
+        for future in as_completed(futures):
+            try:
+                store_pdf_details(futures[future], future.result())
+                processed += 1
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                click.echo(f"Skipped {futures[future]}: {e}", err=True)
+    click.echo(f"Processed {processed} PDFs ({failed} failed) in {time.perf_counter() - started:.1f}s.")
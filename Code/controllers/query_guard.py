@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+from flask import g, has_request_context, request, request_started, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def init_app(app):
+    # Counts the SQL statements each request issues. Enabled in debug mode by
+    # default; a request over its budget is logged, or fails outright when
+    # QUERY_BUDGET_RAISE is set, so an N+1 shows up as soon as it is written.
+    app.config.setdefault('QUERY_GUARD_ENABLED', None)
+    app.config.setdefault('QUERY_BUDGET_DEFAULT', 10)
+    app.config.setdefault('QUERY_BUDGETS', {})
+    app.config.setdefault('QUERY_BUDGET_RAISE', False)
+    # Reset before any before_request hook runs, so their statements count too.
+    request_started.connect(reset_query_count, app)
+    app.after_request(check_query_budget)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_guard_enabled():
+    enabled = current_app.config['QUERY_GUARD_ENABLED']
+    return current_app.debug if enabled is None else enabled
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def reset_query_count(sender, **extra):
+    g.query_count = 0
+
+
+@contextmanager
+def uncounted():
+    # For housekeeping that a request merely triggers (loan expiry, the schema
+    # check), which is not the cost of the view it happens to run before.
+    count = g.get('query_count', 0)
+    try:
+        yield
+    finally:
+        g.query_count = count
+
+
+# Requests that skip the housekeeping hooks: static files, and the health
+# probes, which must answer from their own checks when the database is down.
+HOUSEKEEPING_EXEMPT = {'static', 'health.healthz', 'health.readyz'}
+
+
+def housekeeping_exempt():
+    return request.endpoint in HOUSEKEEPING_EXEMPT
+
+
+def check_query_budget(response):
+    if not query_guard_enabled():
+        return response
+    count = g.get('query_count', 0)
+    budget = current_app.config['QUERY_BUDGETS'].get(request.endpoint, current_app.config['QUERY_BUDGET_DEFAULT'])
+    response.headers['X-Query-Count'] = str(count)
+    if count > budget:
+        message = f"{request.endpoint} issued {count} SQL statements (budget {budget})"
+        if current_app.config['QUERY_BUDGET_RAISE']:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
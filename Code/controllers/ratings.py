@@ -0,0 +1,65 @@
+from datetime import datetime
+from flask.cli import with_appcontext
+import click
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from controllers import db
+from controllers.page_cache import bump_catalog_version
+from models import Book, Rating, BookRatingStats
+
+
+STAR_COLUMNS = ['stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5']
+
+
+def _update_stats(book_id, rating):
+    star = getattr(BookRatingStats, f'stars_{rating}')
+    return BookRatingStats.query.filter_by(book_id=book_id).update({
+        BookRatingStats.rating_count: BookRatingStats.rating_count + 1,
+        BookRatingStats.rating_sum: BookRatingStats.rating_sum + rating,
+        BookRatingStats.avg_rating: (BookRatingStats.rating_sum + rating) * 1.0 / (BookRatingStats.rating_count + 1),
+        star: star + 1,
+    }, synchronize_session=False)
+
+
+def record_rating(book_id, rating):
+    # Runs in the caller's transaction, so the Rating row and its aggregate
+    # commit or roll back together. The UPDATE is relative, so concurrent
+    # ratings of the same book can't lose increments; the stats row is only
+    # inserted for a book's first rating, and a concurrent first rating falls
+    # back to the UPDATE.
+    if not _update_stats(book_id, rating):
+        try:
+            with db.session.begin_nested():
+                db.session.add(BookRatingStats(book_id=book_id, rating_count=1, rating_sum=rating,
+                                               avg_rating=float(rating), **{f'stars_{rating}': 1}))
+        except IntegrityError:
+            _update_stats(book_id, rating)
+    # The rating summary is part of the book's API representation.
+    Book.query.filter_by(book_id=book_id).update({Book.updated_at: datetime.now()}, synchronize_session=False)
+
+
+def reconcile_rating_stats():
+    BookRatingStats.query.delete(synchronize_session=False)
+    aggregates = select(
+        Rating.book_id,
+        func.count(Rating.rating_id),
+        func.sum(Rating.rating),
+        func.avg(Rating.rating),
+        *[func.sum(case((Rating.rating == star, 1), else_=0)) for star in range(1, 6)],
+    ).group_by(Rating.book_id)
+    db.session.execute(insert(BookRatingStats).from_select(
+        ['book_id', 'rating_count', 'rating_sum', 'avg_rating'] + STAR_COLUMNS, aggregates))
+    db.session.commit()
+    bump_catalog_version()
+    return BookRatingStats.query.count()
+
+
+@click.command('reconcile-rating-stats')
+@with_appcontext
+def reconcile_rating_stats_command():
+    books = reconcile_rating_stats()
+    click.echo(f"Rebuilt rating statistics for {books} books.")
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_rating_stats_command)
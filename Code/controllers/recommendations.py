@@ -0,0 +1,135 @@
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select
+from controllers import db
+from controllers.metrics import timed
+from controllers.page_cache import bump_catalog_version
+from controllers.query_guard import housekeeping_exempt
+from models import Book, BookNeighbour, Rating
+
+
+def init_app(app):
+    # Neighbours stored per book; book pages show all of them, catalog lists
+    # the first RECOMMENDATION_LIST_SIZE.
+    app.config.setdefault('RECOMMENDATION_NEIGHBOURS', 10)
+    app.config.setdefault('RECOMMENDATION_LIST_SIZE', 3)
+    # Seconds between rebuilds in a background thread of the web process, or
+    # None to only rebuild through `flask refresh-recommendations` (cron).
+    app.config.setdefault('RECOMMENDATION_REFRESH_INTERVAL', None)
+    # Upper bound on the co-rating pairs expanded at once, which sizes each
+    # batch's dense similarity block and its temporary arrays.
+    app.config.setdefault('RECOMMENDATION_BATCH_PAIRS', 4_000_000)
+    app.extensions['recommendations'] = {
+        'lock': threading.Lock(), 'thread': None, 'last_refresh': None, 'built_from': None,
+    }
+    app.before_request(refresh_recommendations_periodically)
+    app.cli.add_command(refresh_recommendations_command)
+
+
+recommendation_stats = {
+    'runs': 0,
+    'last_ratings': 0,
+    'last_books': 0,
+    'last_duration': 0.0,
+    'last_run': None,
+}
+
+def ratings_fingerprint():
+    # Ratings are only ever added, or deleted with their book, so the count
+    # and the highest id change whenever the matrix would.
+    return tuple(db.session.execute(select(func.count(Rating.rating_id), func.max(Rating.rating_id))).one())
+
+
+def refresh_recommendations():
+    # Rebuilds the whole neighbour table in one transaction; readers keep
+    # seeing the previous lists until it commits. NumPy is only imported
+    # here, so it costs nothing at start-up.
+    from controllers.similarity import load_rating_matrix, top_neighbours
+
+    started = time.perf_counter()
+    fingerprint = ratings_fingerprint()
+    matrix, ratings = load_rating_matrix()
+    config = current_app.config
+    neighbours = [{'book_id': book_id, 'rank': rank, 'neighbour_id': neighbour_id, 'score': score}
+                  for book_id, rank, neighbour_id, score in
+                  top_neighbours(matrix, config['RECOMMENDATION_NEIGHBOURS'], config['RECOMMENDATION_BATCH_PAIRS'])]
+    db.session.execute(delete(BookNeighbour))
+    if neighbours:
+        db.session.execute(insert(BookNeighbour), neighbours)
+    db.session.commit()
+    bump_catalog_version()
+    current_app.extensions['recommendations']['built_from'] = fingerprint
+    duration = time.perf_counter() - started
+
+    recommendation_stats['runs'] += 1
+    recommendation_stats['last_ratings'] = ratings
+    recommendation_stats['last_books'] = len(matrix.books)
+    recommendation_stats['last_duration'] = duration
+    recommendation_stats['last_run'] = time.time()
+    current_app.logger.info('Rebuilt recommendations from %d ratings of %d books in %.3fs',
+                            ratings, len(matrix.books), duration)
+    return len(neighbours)
+
+
+def _refresh_in_app(app):
+    with app.app_context():
+        try:
+            if ratings_fingerprint() != app.extensions['recommendations']['built_from']:
+                with timed('refresh_recommendations'):
+                    refresh_recommendations()
+        except Exception:
+            app.logger.exception('Rebuilding recommendations failed')
+            db.session.rollback()
+
+
+def refresh_recommendations_periodically():
+    interval = current_app.config['RECOMMENDATION_REFRESH_INTERVAL']
+    if interval is None or housekeeping_exempt():
+        return
+    now = time.monotonic()
+    state = current_app.extensions['recommendations']
+    with state['lock']:
+        if state['last_refresh'] is not None and now - state['last_refresh'] < interval:
+            return
+        if state['thread'] is not None and state['thread'].is_alive():
+            return
+        state['last_refresh'] = now
+        state['thread'] = threading.Thread(target=_refresh_in_app, args=(current_app._get_current_object(),),
+                                           name='recommendations', daemon=True)
+        state['thread'].start()
+
+
+def similar_books(book_id, limit=None):
+    # (book_id, name) of the books most like book_id, from the precomputed table.
+    query = select(Book.book_id, Book.name).join(BookNeighbour, BookNeighbour.neighbour_id == Book.book_id)\
+        .where(BookNeighbour.book_id == book_id).order_by(BookNeighbour.rank)
+    if limit is not None:
+        query = query.where(BookNeighbour.rank < limit)
+    return db.session.execute(query).all()
+
+
+def similar_books_for(book_ids):
+    # The first RECOMMENDATION_LIST_SIZE neighbours of each listed book, in
+    # one query: {book_id: [(book_id, name), ...]}.
+    if not book_ids:
+        return {}
+    rows = db.session.execute(
+        select(BookNeighbour.book_id, Book.book_id, Book.name)
+        .join(Book, BookNeighbour.neighbour_id == Book.book_id)
+        .where(BookNeighbour.book_id.in_(book_ids), BookNeighbour.rank < current_app.config['RECOMMENDATION_LIST_SIZE'])
+        .order_by(BookNeighbour.book_id, BookNeighbour.rank))
+    similar = {}
+    for book_id, neighbour_id, name in rows:
+        similar.setdefault(book_id, []).append((neighbour_id, name))
+    return similar
+
+
+@click.command('refresh-recommendations')
+@with_appcontext
+def refresh_recommendations_command():
+    stored = refresh_recommendations()
+    click.echo(f"Stored {stored} neighbours for {recommendation_stats['last_books']} books from "
+               f"{recommendation_stats['last_ratings']} ratings in {recommendation_stats['last_duration']:.2f}s.")
@@ -0,0 +1,114 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text, update
+from sqlalchemy.schema import CreateColumn
+from controllers import db
+from controllers.query_guard import housekeeping_exempt, uncounted
+from controllers.ratings import reconcile_rating_stats
+from controllers.statistics import reconcile_statistics
+
+
+# The database is the only copy of the schema (there are no migrations), so
+# a model change needs `flask init-db` against every existing database.
+# Tables created by it start out empty; these rebuild the ones derived from
+# other tables.
+RECONCILE = {
+    'stat_counter': reconcile_statistics,
+    'book_rating_stats': reconcile_rating_stats,
+}
+
+
+def missing_schema(connection):
+    # Tables and columns the models define but the database lacks.
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            missing.append(table.name)
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        missing += [f'{table.name}.{column.name}' for column in table.columns if column.name not in columns]
+    return missing
+
+
+def upgrade_schema(connection):
+    # Creates missing tables and indexes and adds missing columns. Only
+    # additive changes are made: a new NOT NULL column without a server
+    # default can't be added to existing rows and is reported instead.
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    created = [table.name for table in db.metadata.sorted_tables if table.name not in tables]
+    db.metadata.create_all(connection)
+    added, skipped = [], []
+    preparer = connection.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        if table.name in created:
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                skipped.append(f'{table.name}.{column.name}')
+                continue
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}'))
+            # Existing rows get the column's Python-side default, if any.
+            if column.default is not None and column.default.is_scalar:
+                connection.execute(update(table).values({column.name: column.default.arg}))
+            elif column.default is not None and column.default.is_callable:
+                connection.execute(update(table).values({column.name: column.default.arg(None)}))
+            added.append(f'{table.name}.{column.name}')
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    return created, added, skipped
+
+
+def schema_ready():
+    # Checked once per app; a complete schema stays complete while it runs.
+    state = current_app.extensions['schema']
+    if not state['ready']:
+        missing = missing_schema(db.session.connection())
+        db.session.rollback()
+        if missing:
+            return missing
+        state['ready'] = True
+    return []
+
+
+def check_schema():
+    state = current_app.extensions['schema']
+    if state['ready'] or state.get('warned') or housekeeping_exempt():
+        return
+    with uncounted():
+        missing = schema_ready()
+    if missing:
+        state['warned'] = True
+        current_app.logger.error('The database is missing %s; run `flask init-db` to add them.', ', '.join(missing))
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the database, or add the tables and columns it is missing."""
+    with db.engine.begin() as connection:
+        created, added, skipped = upgrade_schema(connection)
+    for table in created:
+        if table in RECONCILE:
+            RECONCILE[table]()
+    if created:
+        click.echo(f"Created tables: {', '.join(created)}.")
+    if added:
+        click.echo(f"Added columns: {', '.join(added)}.")
+    if skipped:
+        raise click.ClickException(f"Can't add NOT NULL columns without a server default: {', '.join(skipped)}.")
+    if not created and not added:
+        click.echo("The database schema is up to date.")
+
+
+def init_app(app):
+    app.extensions['schema'] = {'ready': False}
+    app.before_request(check_schema)
+    app.cli.add_command(init_db_command)
@@ -0,0 +1,153 @@
+import re
+from flask import current_app
+from flask.cli import with_appcontext
+import click
+from sqlalchemy import or_, select, text
+from sqlalchemy.orm import raiseload
+from controllers import db
+from models import Book, Section
+
+
+def init_app(app):
+    app.config.setdefault('SEARCH_PAGE_SIZE', 20)
+    # Each app checks its own database for the index once.
+    app.extensions['search'] = {'index_ready': False}
+    app.cli.add_command(rebuild_search_index_command)
+
+
+# External-content FTS5 tables over book and section, kept in sync by triggers
+# so bulk statements and raw SQL writes are indexed too.
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "name, description, author, body_text, content='book', content_rowid='book_id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, name, description, author, body_text) "
+    "VALUES (new.book_id, new.name, new.description, new.author, new.body_text); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, name, description, author, body_text) "
+    "VALUES ('delete', old.book_id, old.name, old.description, old.author, old.body_text); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF name, description, author, body_text ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, name, description, author, body_text) "
+    "VALUES ('delete', old.book_id, old.name, old.description, old.author, old.body_text); "
+    "INSERT INTO book_fts(rowid, name, description, author, body_text) "
+    "VALUES (new.book_id, new.name, new.description, new.author, new.body_text); END",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS section_fts USING fts5("
+    "name, description, content='section', content_rowid='section_id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS section_fts_ai AFTER INSERT ON section BEGIN "
+    "INSERT INTO section_fts(rowid, name, description) "
+    "VALUES (new.section_id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS section_fts_ad AFTER DELETE ON section BEGIN "
+    "INSERT INTO section_fts(section_fts, rowid, name, description) "
+    "VALUES ('delete', old.section_id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS section_fts_au AFTER UPDATE OF name, description ON section BEGIN "
+    "INSERT INTO section_fts(section_fts, rowid, name, description) "
+    "VALUES ('delete', old.section_id, old.name, old.description); "
+    "INSERT INTO section_fts(rowid, name, description) "
+    "VALUES (new.section_id, new.name, new.description); END",
+]
+
+# bm25 column weights: a hit in the title outranks one in the description,
+# which outranks one somewhere in the book's text.
+BOOK_SEARCH_SQL = text(
+    "SELECT rowid FROM book_fts WHERE book_fts MATCH :match "
+    "ORDER BY bm25(book_fts, 10.0, 1.0, 5.0, 0.2) LIMIT :limit OFFSET :offset")
+SECTION_SEARCH_SQL = text(
+    "SELECT rowid FROM section_fts WHERE section_fts MATCH :match "
+    "ORDER BY bm25(section_fts, 10.0, 1.0) LIMIT :limit OFFSET :offset")
+
+def fts_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def create_search_index(connection):
+    # An index made before book text was indexed is dropped and recreated.
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info(book_fts)"))]
+    outdated = bool(columns) and 'body_text' not in columns
+    if outdated:
+        for trigger in ('book_fts_ai', 'book_fts_ad', 'book_fts_au'):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        connection.execute(text("DROP TABLE book_fts"))
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+    return outdated
+
+
+def rebuild_search_index(connection):
+    connection.execute(text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"))
+    connection.execute(text("INSERT INTO section_fts(section_fts) VALUES ('rebuild')"))
+
+
+def ensure_search_index():
+    state = current_app.extensions['search']
+    if state['index_ready'] or not fts_enabled():
+        return
+    connection = db.session.connection()
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'book_fts'")).first()
+    if create_search_index(connection) or not exists:
+        rebuild_search_index(connection)
+    db.session.commit()
+    state['index_ready'] = True
+
+
+def match_expression(query):
+    # Quote every term so user input can't inject FTS operators, and
+    # prefix-match each one so partial words still find results.
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _search_ids(key, sql, like_columns, query, page, per_page):
+    # The ids of one page of matches, best first, and whether there are more.
+    per_page = per_page or current_app.config['SEARCH_PAGE_SIZE']
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+
+    if not fts_enabled():
+        pattern = '%' + query + '%'
+        ids = db.session.scalars(select(key).where(or_(*[column.ilike(pattern) for column in like_columns]))
+                                 .order_by(key).limit(per_page + 1).offset(offset)).all()
+        return ids[:per_page], len(ids) > per_page
+
+    expression = match_expression(query)
+    if not expression:
+        return [], False
+    ensure_search_index()
+    ids = db.session.execute(sql, {'match': expression, 'limit': per_page + 1, 'offset': offset}).scalars().all()
+    return ids[:per_page], len(ids) > per_page
+
+
+def _search(model, key, sql, like_columns, query, page, per_page):
+    ids, has_next = _search_ids(key, sql, like_columns, query, page, per_page)
+    found = {getattr(row, key.key): row for row in model.query.options(raiseload('*')).filter(key.in_(ids))}
+    return [found[i] for i in ids if i in found], has_next
+
+
+BOOK_LIKE_COLUMNS = [Book.name, Book.description, Book.author, Book.body_text]
+
+
+def search_book_ids(query, page=1, per_page=None):
+    return _search_ids(Book.book_id, BOOK_SEARCH_SQL, BOOK_LIKE_COLUMNS, query, page, per_page)
+
+
+def search_books(query, page=1, per_page=None):
+    return _search(Book, Book.book_id, BOOK_SEARCH_SQL, BOOK_LIKE_COLUMNS, query, page, per_page)
+
+
+def search_sections(query, page=1, per_page=None):
+    return _search(Section, Section.section_id, SECTION_SEARCH_SQL,
+                   [Section.name, Section.description], query, page, per_page)
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    if not fts_enabled():
+        click.echo("Full-text index is only used with SQLite, nothing to rebuild.")
+        return
+    connection = db.session.connection()
+    create_search_index(connection)
+    rebuild_search_index(connection)
+    db.session.commit()
+    click.echo("Search index rebuilt.")
@@ -0,0 +1,93 @@
+from itertools import chain
+import numpy as np
+from sqlalchemy import select
+from controllers import db
+from models import Rating
+
+
+class RatingMatrix:
+    # Sparse user x book matrix of ratings centred on each user's mean, kept
+    # both by user (CSR) and by book (CSC) as parallel NumPy arrays.
+    def __init__(self, user_ids, book_ids, ratings):
+        self.users, user_index = np.unique(user_ids, return_inverse=True)
+        self.books, book_index = np.unique(book_ids, return_inverse=True)
+        user_counts = np.bincount(user_index)
+        values = ratings - (np.bincount(user_index, ratings) / user_counts)[user_index]
+        self.norms = np.sqrt(np.bincount(book_index, values * values, minlength=len(self.books)))
+
+        by_user = np.argsort(user_index, kind='stable')
+        self.user_ptr = np.concatenate(([0], np.cumsum(user_counts)))
+        self.user_books = book_index[by_user]
+        self.user_values = values[by_user]
+
+        by_book = np.argsort(book_index, kind='stable')
+        self.book_ptr = np.concatenate(([0], np.cumsum(np.bincount(book_index, minlength=len(self.books)))))
+        self.book_users = user_index[by_book]
+        self.book_values = values[by_book]
+        # Co-rating pairs each book expands to: the sum of its raters' counts.
+        self.book_pairs = np.bincount(book_index, user_counts[user_index], minlength=len(self.books))
+
+    def batches(self, max_pairs):
+        # Splits the books into consecutive ranges of at most max_pairs
+        # co-rating pairs and max_pairs similarity cells.
+        n_books = len(self.books)
+        cumulative = np.cumsum(self.book_pairs)
+        max_rows = max(1, max_pairs // max(n_books, 1))
+        start = 0
+        while start < n_books:
+            done = cumulative[start - 1] if start else 0
+            stop = int(np.searchsorted(cumulative, done + max_pairs, side='right'))
+            stop = min(max(stop, start + 1), start + max_rows, n_books)
+            yield start, stop
+            start = stop
+
+    def similarities(self, start, stop):
+        # Adjusted cosine similarity of books start..stop against every book,
+        # as a dense (stop - start) x n_books block. Each rating of a book in
+        # the range is paired with every other rating by the same user, and
+        # the products are summed with one bincount.
+        n_books = len(self.books)
+        entries = slice(self.book_ptr[start], self.book_ptr[stop])
+        rows = np.repeat(np.arange(stop - start), np.diff(self.book_ptr[start:stop + 1]))
+        users = self.book_users[entries]
+        lengths = self.user_ptr[users + 1] - self.user_ptr[users]
+        owner = np.repeat(np.arange(len(users)), lengths)
+        offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.repeat(self.user_ptr[users], lengths) + offsets
+
+        dots = np.bincount(rows[owner] * n_books + self.user_books[positions],
+                           self.book_values[entries][owner] * self.user_values[positions],
+                           minlength=(stop - start) * n_books).reshape(stop - start, n_books)
+        scale = self.norms[start:stop, None] * self.norms[None, :]
+        block = np.divide(dots, scale, out=np.zeros_like(dots), where=scale > 0)
+        block[np.arange(stop - start), np.arange(start, stop)] = 0
+        return block
+
+
+def top_neighbours(matrix, k, max_pairs):
+    # Yields (book_id, rank, neighbour_id, score) for each book's k most
+    # similar books with a positive score.
+    n_books = len(matrix.books)
+    k = min(k, n_books - 1)
+    if k <= 0:
+        return
+    for start, stop in matrix.batches(max_pairs):
+        block = matrix.similarities(start, stop)
+        best = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(block, best, axis=1)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        for row in range(stop - start):
+            book_id = int(matrix.books[start + row])
+            for rank in range(k):
+                if scores[row, rank] <= 0:
+                    break
+                yield book_id, rank, int(matrix.books[best[row, rank]]), float(scores[row, rank])
+
+
+def load_rating_matrix():
+    rows = db.session.execute(select(Rating.user_id, Rating.book_id, Rating.rating)).all()
+    # fromiter over the flattened rows; np.array() on Row objects is ~100x slower.
+    data = np.fromiter(chain.from_iterable(rows), np.int64, count=3 * len(rows)).reshape(-1, 3)
+    return RatingMatrix(data[:, 0], data[:, 1], data[:, 2].astype(np.float64)), len(rows)
@@ -0,0 +1,100 @@
+from datetime import date, timedelta
+import click
+from flask import jsonify, request, Blueprint, current_app
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from controllers import db
+from controllers.utils import admin_required
+from models import User, Section, Book, IssuedBook, BookRequest, Rating, StatCounter, StatBucket
+
+bp = Blueprint('statistics', __name__, cli_group=None)
+
+
+@bp.record_once
+def configure(state):
+    state.app.config.setdefault('STATISTICS_DAYS', 30)
+    state.app.config.setdefault('STATISTICS_MAX_DAYS', 366)
+
+
+# Running totals shown on the dashboard, and the table each one counts.
+COUNTERS = {
+    'books': Book,
+    'sections': Section,
+    'users': User,
+    'issued_books': IssuedBook,
+    'requests': BookRequest,
+    'ratings': Rating,
+}
+# Per-day event counts.
+EVENTS = ('requests', 'approvals', 'rejections', 'cancellations', 'returns', 'revocations', 'expirations', 'ratings')
+
+
+def _increment(model, key, delta):
+    # Relative UPDATE first; the row is only inserted the first time a key is
+    # seen, and a concurrent insert of the same key falls back to the UPDATE.
+    def update():
+        return model.query.filter_by(**key).update({model.value: model.value + delta}, synchronize_session=False)
+
+    if update():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(value=delta, **key))
+    except IntegrityError:
+        update()
+
+
+def adjust_counter(name, delta=1):
+    # Runs in the caller's transaction, so a counter moves together with the
+    # rows it counts.
+    if delta:
+        _increment(StatCounter, {'name': name}, delta)
+
+
+def record_event(name, count=1, day=None):
+    if count:
+        _increment(StatBucket, {'name': name, 'day': day or date.today()}, count)
+
+
+def counters():
+    values = dict.fromkeys(COUNTERS, 0)
+    values.update(db.session.query(StatCounter.name, StatCounter.value).filter(StatCounter.name.in_(COUNTERS)))
+    return values
+
+
+def daily_rollups(days, today=None):
+    # {event: [{'day': ..., 'count': ...}, ...]} for the last `days` days,
+    # oldest first, with the days without events filled in as 0.
+    today = today or date.today()
+    first = today - timedelta(days=days - 1)
+    counts = {(name, day): value for name, day, value in db.session.query(
+        StatBucket.name, StatBucket.day, StatBucket.value).filter(StatBucket.day >= first)}
+    return {name: [{'day': (first + timedelta(days=i)).isoformat(), 'count': counts.get((name, first + timedelta(days=i)), 0)}
+                   for i in range(days)]
+            for name in EVENTS}
+
+
+def reconcile_statistics():
+    # Recounts the running totals from the tables. Daily rollups only exist
+    # for events recorded since they were introduced and are left alone, as
+    # are the other stat_counter rows (cache versions).
+    StatCounter.query.filter(StatCounter.name.in_(COUNTERS)).delete(synchronize_session=False)
+    for name, model in COUNTERS.items():
+        db.session.execute(insert(StatCounter).from_select(
+            ['name', 'value'], select(literal(name), func.count()).select_from(model)))
+    db.session.commit()
+    return counters()
+
+
+@bp.route('/admin/statistics.json')
+@admin_required
+def statistics_json():
+    days = min(max(request.args.get('days', current_app.config['STATISTICS_DAYS'], type=int), 1),
+               current_app.config['STATISTICS_MAX_DAYS'])
+    return jsonify({'counters': counters(), 'days': days, 'daily': daily_rollups(days)})
+
+
+@bp.cli.command('reconcile-statistics')
+def reconcile_statistics_command():
+    totals = reconcile_statistics()
+    click.echo(', '.join(f"{name}: {value}" for name, value in totals.items()))
@@ -1,9 +1,43 @@
+import hashlib
 import os
-import uuid
+import queue
+import tempfile
+import threading
+import time
 from functools import wraps
+import click
+from sqlalchemy import update
 from flask_login import current_user
-from flask import flash, redirect, url_for
-from models import IssuedBook
+from flask import flash, redirect, url_for, current_app
+from flask.cli import with_appcontext
+from controllers import db
+from controllers.access import access_cache
+from models import Book
+
+
+def init_app(app):
+    # PDFs live outside the static folder so they are only reachable through
+    # the permission-checked book_pdf view.
+    app.config.setdefault('PDF_FOLDER', os.path.join(app.instance_path, 'pdfs'))
+    # When set (e.g. '/protected-pdfs/'), book_pdf answers with X-Accel-Redirect
+    # and lets the front proxy stream the file.
+    app.config.setdefault('PDF_ACCEL_REDIRECT_PREFIX', None)
+    app.config.setdefault('PDF_DELETE_RETRIES', 5)
+    app.config.setdefault('PDF_DELETE_RETRY_DELAY', 2)
+    app.cli.add_command(migrate_pdf_storage)
+
+
+PDF_CHUNK_SIZE = 1024 * 1024
+
+_pdf_deletions = queue.Queue()
+_pdf_worker = None
+_pdf_worker_lock = threading.Lock()
+
+
+class PdfChecksumMismatch(ValueError):
+    pass
+
+
 def user_required(func):
     @wraps(func)
     def decorated_function(*args, **kwargs):
@@ -11,7 +45,7 @@ def user_required(func):
             return func(*args, **kwargs)
         else:
             flash('You need to be logged in to view this page', 'danger')
-            return redirect(url_for('login'))
+            return redirect(url_for('auth.login'))
     return decorated_function
 
 def admin_required(func):
@@ -21,7 +55,7 @@ def admin_required(func):
             return func(*args, **kwargs)
         else:
             flash('You need to be an admin to view this page', 'danger')
-            return redirect(url_for('admin_login'))
+            return redirect(url_for('auth.admin_login'))
     return decorated_function
 
 
@@ -32,28 +66,157 @@ def has_permission(user, book):
         return has_issued_book(user, book)
 
 def has_issued_book(user, book):
-    return IssuedBook.query.filter_by(user_id=user.user_id, book_id=book.book_id).first() is not None
+    return book.book_id in access_cache.books(user.user_id)
+
+def pdf_folder():
+    folder = current_app.config['PDF_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def pdf_blob_path(digest):
+    # Content-addressed and sharded two levels deep: ab/cd/abcd....pdf
+    return '/'.join((digest[:2], digest[2:4], digest + '.pdf'))
+
+
+def pdf_path(file_name):
+    return os.path.join(current_app.config['PDF_FOLDER'], *file_name.split('/'))
+
+
+def thumbnail_name(file_name):
+    # A PDF's first-page thumbnail sits at the same relative path, as .png.
+    return os.path.splitext(file_name)[0] + '.png'
+
+
+def thumbnail_path(file_name):
+    return os.path.join(current_app.config['THUMBNAIL_FOLDER'], *thumbnail_name(file_name).split('/'))
+
+
+def claim_pdf_blob(file_name):
+    # Marks an existing blob as freshly used, so a queued deletion that raced
+    # with a new reference leaves it alone.
+    path = pdf_path(file_name)
+    if not os.path.exists(path):
+        return False
+    os.utime(path)
+    return True
+
+
+def store_pdf_stream(stream, expected_sha256=None):
+    # Hashes the upload while writing it to a temporary file, then moves it to
+    # its content address. Identical PDFs end up as one blob.
+    # Returns (file name, bytes written).
+    folder = pdf_folder()
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: stream.read(PDF_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+            raise PdfChecksumMismatch(f"expected sha256 {expected_sha256}, got {digest.hexdigest()}")
+        file_name = pdf_blob_path(digest.hexdigest())
+        if claim_pdf_blob(file_name):
+            os.remove(tmp_path)
+            return file_name, 0
+        os.makedirs(os.path.dirname(pdf_path(file_name)), exist_ok=True)
+        os.replace(tmp_path, pdf_path(file_name))
+        return file_name, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 
 def save_pdf_file(pdf_file):
-    random_string = str(uuid.uuid4().hex[:10])
-    _, extension = os.path.splitext(pdf_file.filename)
-    pdf_fn = f"{random_string}{extension}"
-    current_file_path = os.path.abspath(__file__)
-    root_path = os.path.abspath(os.path.join(current_file_path, '..', '..'))
-    pdf_path = os.path.join(root_path, 'static', 'pdfs', pdf_fn)
-    pdf_file.save(pdf_path)
+    file_name, _ = store_pdf_stream(pdf_file.stream)
+    return file_name
 
-    return pdf_fn
 
+def pdf_file_referenced(pdf_file):
+    return db.session.query(Book.book_id).filter_by(file_name=pdf_file).first() is not None
 
-def delete_pdf_file(pdf_file):
+
+def delete_pdf_file(pdf_file, queued_at=None):
+    # Blobs are shared by every book with the same content, so a file is only
+    # removed once no book references it any more.
     try:
-        current_file_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), '..','static', 'pdfs', pdf_file)
-        os.remove(current_file_path)
+        if pdf_file_referenced(pdf_file):
+            return True
+        path = pdf_path(pdf_file)
+        if queued_at is not None and os.path.getmtime(path) > queued_at:
+            return True
+        os.remove(path)
+        if os.path.exists(thumbnail_path(pdf_file)):
+            os.remove(thumbnail_path(pdf_file))
         return True
     except FileNotFoundError:
-        return False
+        return True
     except Exception as e:
         return False
 
 
+def queue_pdf_deletion(file_names):
+    # Files are removed by a background worker after the rows are committed,
+    # so a request never waits on the filesystem and a failed delete is retried.
+    global _pdf_worker
+    with _pdf_worker_lock:
+        if _pdf_worker is None:
+            _pdf_worker = threading.Thread(target=_pdf_deletion_worker, name='pdf-deletion', daemon=True)
+            _pdf_worker.start()
+    app = current_app._get_current_object()
+    queued_at = time.time()
+    for file_name in set(file_names):
+        _pdf_deletions.put((app, file_name, 0, queued_at))
+
+
+def _pdf_deletion_worker():
+    while True:
+        app, file_name, attempts, queued_at = _pdf_deletions.get()
+        try:
+            with app.app_context():
+                if delete_pdf_file(file_name, queued_at):
+                    continue
+            attempts += 1
+            if attempts < app.config['PDF_DELETE_RETRIES']:
+                delay = app.config['PDF_DELETE_RETRY_DELAY'] * 2 ** (attempts - 1)
+                retry = threading.Timer(delay, _pdf_deletions.put, args=((app, file_name, attempts, queued_at),))
+                retry.daemon = True
+                retry.start()
+            else:
+                app.logger.warning('Giving up deleting %s after %d attempts', file_name, attempts)
+        finally:
+            _pdf_deletions.task_done()
+
+
+@click.command('migrate-pdf-storage')
+@with_appcontext
+@click.option('--source', type=click.Path(file_okay=False), default=None,
+              help='Folder holding the old flat PDF files, PDF_FOLDER by default.')
+def migrate_pdf_storage(source):
+    """Move flat PDF files into the content-addressed, sharded layout."""
+    source = source or pdf_folder()
+    file_names = [name for name, in db.session.query(Book.file_name).distinct() if '/' not in name]
+    moved = deduplicated = missing = 0
+    for old_name in file_names:
+        old_path = os.path.join(source, old_name)
+        if not os.path.isfile(old_path):
+            missing += 1
+            click.echo(f"Missing: {old_path}", err=True)
+            continue
+        with open(old_path, 'rb') as old_file:
+            new_name, written = store_pdf_stream(old_file)
+        db.session.execute(update(Book).where(Book.file_name == old_name).values(file_name=new_name))
+        db.session.commit()
+        os.remove(old_path)
+        if written:
+            moved += 1
+        else:
+            deduplicated += 1
+    # Cached book pages link the old file names.
+    from controllers.page_cache import bump_catalog_version
+    bump_catalog_version()
+    click.echo(f"Moved {moved} PDFs, {deduplicated} were duplicates, {missing} missing.")
@@ -0,0 +1,70 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import select
+from controllers import db
+from controllers.query_guard import uncounted
+from models import StatCounter
+
+# Versions of cached data, kept as stat_counter rows so that a change made in
+# any process (a web worker, a CLI command, a background thread) reaches the
+# caches of every other one. A cache tags its entries with the version they
+# were built at and ignores them once the version has moved on.
+VERSIONS = ('catalog', 'identity', 'access')
+
+
+def init_app(app):
+    # Each process re-reads the versions at most this often, so a cache hit
+    # costs no query. A change made in another process is seen within this
+    # many seconds; the process making it sees it at once.
+    app.config.setdefault('CACHE_VERSION_INTERVAL', 1)
+    app.extensions['versions'] = {'values': None, 'loaded_at': 0.0, 'lock': threading.Lock()}
+
+
+def _counter(name):
+    return f'{name}_version'
+
+
+def load_versions():
+    names = {_counter(name): name for name in VERSIONS}
+    versions = dict.fromkeys(VERSIONS, 0)
+    for counter, value in db.session.execute(
+            select(StatCounter.name, StatCounter.value).where(StatCounter.name.in_(names))):
+        versions[names[counter]] = value
+    return versions
+
+
+def _remember(versions, loaded_at):
+    # Versions only go up, so a thread finishing a slower read can't move
+    # them back.
+    state = current_app.extensions['versions']
+    with state['lock']:
+        if state['values'] is not None:
+            versions = {name: max(value, state['values'][name]) for name, value in versions.items()}
+        state['values'], state['loaded_at'] = versions, max(loaded_at, state['loaded_at'])
+    return versions
+
+
+def cache_version(name):
+    # Read the version before the data it will tag: data read before a change
+    # must never be cached under the version that follows the change.
+    state = current_app.extensions['versions']
+    now = time.monotonic()
+    with state['lock']:
+        if state['values'] is not None and now - state['loaded_at'] < current_app.config['CACHE_VERSION_INTERVAL']:
+            return state['values'][name]
+    # Shared by every request of the process, so not charged to this one.
+    with uncounted():
+        versions = load_versions()
+    return _remember(versions, now)[name]
+
+
+def bump_version(name):
+    # Commits on its own. Call it once the change it announces is committed,
+    # so nothing read before the change can be cached under the new version.
+    # Imported here: statistics depends on utils, which uses the caches.
+    from controllers.statistics import adjust_counter
+
+    adjust_counter(_counter(name))
+    db.session.commit()
+    _remember(load_versions(), time.monotonic())
@@ -0,0 +1,28 @@
+import os
+
+# Settings for  gunicorn -c gunicorn.conf.py wsgi:app
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Restart workers now and then so a slow leak can't build up.
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Build the app once in the master; workers share the loaded code
+# copy-on-write instead of each importing it again. `kill -HUP <master>`
+# replaces the workers gracefully; pick up new code with USR2 (new master)
+# followed by TERM to the old one.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Pooled connections the master may have opened must not be shared
+    # across processes: each worker starts with an empty pool.
+    from wsgi import app
+    from controllers import db
+    with app.app_context():
+        db.engine.dispose(close=False)
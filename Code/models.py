@@ -1,13 +1,8 @@
 from datetime import datetime
 from flask_login import UserMixin
-from controllers import db, login_manager
+from controllers import db
 from datetime import timedelta, datetime
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-
 class User(db.Model, UserMixin):
     __tablename__ = "user"
     user_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -29,6 +24,8 @@ class Section(db.Model):
     name = db.Column(db.String(100), nullable=False)
     date_created = db.Column(db.DateTime, nullable=False, default=datetime.now)
     description = db.Column(db.Text)
+    # Set on every ORM or Core insert/update, so API clients can sync changes.
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
 class Book(db.Model):
     __tablename__ = "book"
@@ -37,20 +34,29 @@ class Book(db.Model):
     description = db.Column(db.Text, nullable=False)
     # publish_date = db.Column(db.DateTime, nullable=False, default=datetime.now)
     author = db.Column(db.String(100), nullable=False)
-    file_name = db.Column(db.String(100), nullable=False)
-    section_id = db.Column(db.Integer, db.ForeignKey('section.section_id'), nullable=False)
+    file_name = db.Column(db.String(100), nullable=False, index=True)
+    section_id = db.Column(db.Integer, db.ForeignKey('section.section_id'), nullable=False, index=True)
     section = db.relationship('Section', backref=db.backref('books', lazy=True))
+    # Filled in by the PDF processing pipeline; NULL until the file is processed.
+    page_count = db.Column(db.Integer)
+    file_size = db.Column(db.Integer)
+    thumbnail = db.Column(db.String(100))
+    # Extracted text, only read by the search index.
+    body_text = db.deferred(db.Column(db.Text))
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
 class IssuedBook(db.Model):
     __tablename__ = "issued_book"
+    __table_args__ = (db.Index('ix_issued_book_user_book', 'user_id', 'book_id', unique=True),)
     issued_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
     request_date = db.Column(db.DateTime, nullable=False, default=datetime.now())
-    return_date = db.Column(db.DateTime)
+    return_date = db.Column(db.DateTime, index=True)
 
 
 class BookRequest(db.Model):
+    __table_args__ = (db.Index('ix_book_request_user_book', 'user_id', 'book_id', unique=True),)
     request_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
@@ -60,9 +66,49 @@ class BookRequest(db.Model):
 
 
 class Rating(db.Model):
+    __table_args__ = (db.Index('ix_rating_user_book', 'user_id', 'book_id', unique=True),)
     rating_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     feedback = db.Column(db.Text)
     date_rated = db.Column(db.DateTime, nullable=False,default=datetime.now())
+
+
+class BookRatingStats(db.Model):
+    __tablename__ = "book_rating_stats"
+    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), primary_key=True)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    avg_rating = db.Column(db.Float)
+    stars_1 = db.Column(db.Integer, nullable=False, default=0)
+    stars_2 = db.Column(db.Integer, nullable=False, default=0)
+    stars_3 = db.Column(db.Integer, nullable=False, default=0)
+    stars_4 = db.Column(db.Integer, nullable=False, default=0)
+    stars_5 = db.Column(db.Integer, nullable=False, default=0)
+
+    def histogram(self):
+        return [self.stars_1, self.stars_2, self.stars_3, self.stars_4, self.stars_5]
+
+
+class StatCounter(db.Model):
+    __tablename__ = "stat_counter"
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StatBucket(db.Model):
+    __tablename__ = "stat_bucket"
+    name = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class BookNeighbour(db.Model):
+    # Precomputed "readers also liked" list: the books most similar to
+    # book_id by their ratings, best first.
+    __tablename__ = "book_neighbour"
+    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
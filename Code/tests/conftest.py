@@ -0,0 +1,98 @@
+import os
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from controllers import create_app, db, bcrypt
+from controllers.schema import upgrade_schema
+from models import User
+
+
+def app_config(tmp_path, database_uri):
+    return {
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'WTF_CSRF_ENABLED': False,
+        'PASSWORD_HASH_WORKERS': 0,
+        'PDF_PROCESSING_WORKERS': 0,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'LOAN_EXPIRY_INTERVAL': 10 ** 9,
+        'CHART_FOLDER': str(tmp_path / 'charts'),
+        'PDF_FOLDER': str(tmp_path / 'pdfs'),
+        'THUMBNAIL_FOLDER': str(tmp_path / 'thumbnails'),
+    }
+
+
+@pytest.fixture
+def app(tmp_path):
+    # An empty database built from the models, as `flask init-db` builds one.
+    # The search index is created by the first search, as in production.
+    app = create_app(app_config(tmp_path, f"sqlite:///{tmp_path / 'site.db'}"))
+    with app.app_context(), db.engine.begin() as connection:
+        upgrade_schema(connection)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture(params=[
+    'sqlite',
+    pytest.param('postgresql', marks=pytest.mark.skipif(
+        not os.environ.get('TEST_POSTGRES_URL'), reason='set TEST_POSTGRES_URL to run against PostgreSQL')),
+])
+def backend_app(request, tmp_path):
+    # The app on each supported database. TEST_POSTGRES_URL must point at a
+    # scratch database: its tables are dropped afterwards.
+    if request.param == 'sqlite':
+        yield request.getfixturevalue('app')
+        return
+    pytest.importorskip('psycopg2')
+    app = create_app(app_config(tmp_path, os.environ['TEST_POSTGRES_URL']))
+    with app.app_context():
+        db.drop_all()
+        with db.engine.begin() as connection:
+            upgrade_schema(connection)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def make_user(app, username, is_admin=False, password='password1'):
+    with app.app_context():
+        user = User(username=username, email=f'{username}@example.com', is_admin=is_admin,
+                    password=bcrypt.generate_password_hash(password, 4).decode('utf-8'))
+        db.session.add(user)
+        db.session.commit()
+        return user.user_id
+
+
+def login(client, username, admin=False, password='password1'):
+    response = client.post('/admin/login' if admin else '/login',
+                           data={'email': f'{username}@example.com', 'password': password})
+    assert response.status_code == 302
+    return client
+
+
+def same_database(app, **config):
+    # A second app on the test database, standing in for another worker
+    # process or a CLI command.
+    return create_app({**app.config, **config})
+
+
+@contextmanager
+def recorded_statements(app):
+    # Every statement sent to the database, whether query_guard counts it or not.
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
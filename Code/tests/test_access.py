@@ -0,0 +1,108 @@
+import io
+from datetime import datetime, timedelta
+import pytest
+from controllers import db
+from controllers.access import book_token
+from controllers.utils import store_pdf_stream
+from models import Book, IssuedBook, Section
+from tests.conftest import login, make_user, recorded_statements, same_database
+
+PDF = b'%PDF-1.4 ' + bytes(range(256)) * 64
+
+
+@pytest.fixture
+def loan(app):
+    # A reader with one issued book, and the signed PDF URL its page links.
+    app.config['CACHE_VERSION_INTERVAL'] = 60
+    reader_id = make_user(app, 'reader')
+    make_user(app, 'stranger')
+    with app.test_request_context():
+        file_name, _ = store_pdf_stream(io.BytesIO(PDF))
+        section = Section(name='Access', description='Issued books')
+        db.session.add(section)
+        db.session.flush()
+        book = Book(name='Issued', description='d', author='a', file_name=file_name, section_id=section.section_id)
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(IssuedBook(user_id=reader_id, book_id=book.book_id,
+                                  return_date=datetime.now() + timedelta(days=7)))
+        db.session.commit()
+        url = f'/book/{book.book_id}/pdf?token={book_token(reader_id, book)}'
+    return url, book.book_id
+
+
+def test_warm_range_request_makes_no_queries(app, loan):
+    url, _ = loan
+    client = login(app.test_client(), 'reader')
+    client.get(url, headers={'Range': 'bytes=0-99'})
+    with recorded_statements(app) as statements:
+        response = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == PDF[100:200]
+    assert statements == []
+
+
+def test_revocation_takes_effect_within_the_version_interval(app, loan):
+    url, book_id = loan
+    client = login(app.test_client(), 'reader')
+    assert client.get(url).status_code == 200
+    other = same_database(app)
+    with other.app_context():
+        IssuedBook.query.filter_by(book_id=book_id).delete()
+        db.session.commit()
+        other.extensions['access_cache'].invalidate()
+    assert client.get(url).status_code == 200
+    app.config['CACHE_VERSION_INTERVAL'] = 0
+    assert client.get(url).status_code == 403
+
+
+def test_revocation_in_the_same_process_is_immediate(app, loan):
+    url, book_id = loan
+    client = login(app.test_client(), 'reader')
+    assert client.get(url).status_code == 200
+    with app.app_context():
+        IssuedBook.query.filter_by(book_id=book_id).delete()
+        db.session.commit()
+        app.extensions['access_cache'].invalidate()
+    assert client.get(url).status_code == 403
+
+
+def test_token_of_another_reader_is_refused(app, loan):
+    url, _ = loan
+    client = login(app.test_client(), 'stranger')
+    assert client.get(url).status_code == 403
+
+
+def test_range_and_conditional_requests(app, loan):
+    url, _ = loan
+    client = login(app.test_client(), 'reader')
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert response.mimetype == 'application/pdf'
+    assert {'private', 'no-cache'} <= set(response.headers['Cache-Control'].replace(' ', '').split(','))
+    etag = response.headers['ETag']
+
+    response = client.get(url, headers={'Range': f'bytes={len(PDF) - 10}-'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes {len(PDF) - 10}-{len(PDF) - 1}/{len(PDF)}'
+    assert response.data == PDF[-10:]
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_without_a_token_the_loan_is_checked_in_the_database(app, loan):
+    _, book_id = loan
+    response = login(app.test_client(), 'reader').get(f'/book/{book_id}/pdf')
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert login(app.test_client(), 'stranger').get(f'/book/{book_id}/pdf').status_code == 403
+
+
+def test_accel_redirect_hands_the_file_to_the_proxy(app, loan):
+    url, _ = loan
+    app.config['PDF_ACCEL_REDIRECT_PREFIX'] = '/protected/pdfs/'
+    response = login(app.test_client(), 'reader').get(url)
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'].startswith('/protected/pdfs/')
+    assert response.headers['Content-Type'] == 'application/pdf'
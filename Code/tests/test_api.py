@@ -0,0 +1,77 @@
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+import pytest
+from controllers import db
+from models import Book, BookRatingStats, Section
+from tests.conftest import login, make_user
+
+T1, T2 = datetime(2026, 1, 1, 9, 0), datetime(2026, 1, 2, 9, 0)
+
+
+@pytest.fixture
+def client(app):
+    # Four books: one changed at T1, two sharing T2, one at T2 without stats.
+    make_user(app, 'reader')
+    with app.app_context():
+        section = Section(name='API', description='d')
+        db.session.add(section)
+        db.session.flush()
+        for number, updated_at in enumerate((T1, T2, T2, T2)):
+            book = Book(name=f'Book {number}', description='d', author=f'Author {number}',
+                        file_name=f'{number}.pdf', section_id=section.section_id, updated_at=updated_at)
+            db.session.add(book)
+            db.session.flush()
+            if number < 3:
+                db.session.add(BookRatingStats(book_id=book.book_id, rating_count=1, rating_sum=number + 1,
+                                               avg_rating=float(number + 1)))
+        db.session.commit()
+    return login(app.test_client(), 'reader')
+
+
+def test_api_needs_a_login(app):
+    response = app.test_client().get('/api/v1/books')
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Unauthorized'
+
+
+def test_selected_fields_only(client):
+    items = client.get('/api/v1/books?fields=author,name,author').get_json()['items']
+    assert items[0] == {'book_id': items[0]['book_id'], 'author': 'Author 0', 'name': 'Book 0'}
+    items = client.get('/api/v1/books?fields=avg_rating').get_json()['items']
+    assert [item['avg_rating'] for item in items] == [1.0, 2.0, 3.0, None]
+    response = client.get('/api/v1/books?fields=name,secret')
+    assert response.status_code == 400
+    assert 'Unknown fields: secret' in response.get_json()['description']
+
+
+def test_updated_since_pages_through_changes(client):
+    response = client.get(f'/api/v1/books?fields=name&updated_since={T2.isoformat()}&per_page=2')
+    page = response.get_json()
+    assert [item['name'] for item in page['items']] == ['Book 1', 'Book 2']
+    # The next page resumes inside the run of books changed at the same time.
+    page = client.get(page['next']).get_json()
+    assert [item['name'] for item in page['items']] == ['Book 3']
+    page = client.get(page['next']).get_json()
+    assert page['items'] == []
+    assert parse_qs(urlsplit(page['next']).query)['updated_since'] == [T2.isoformat()]
+
+
+def test_changed_book_shows_up_in_the_next_poll(app, client):
+    next_url = client.get(f'/api/v1/books?updated_since={T2.isoformat()}').get_json()['next']
+    assert client.get(next_url).get_json()['items'] == []
+    with app.app_context():
+        book = db.session.execute(db.select(Book).filter_by(name='Book 0')).scalar_one()
+        book.description = 'Revised'
+        db.session.commit()
+    assert [item['name'] for item in client.get(next_url).get_json()['items']] == ['Book 0']
+
+
+def test_updated_since_is_validated(client):
+    response = client.get('/api/v1/books?updated_since=yesterday')
+    assert response.status_code == 400
+    assert 'ISO 8601' in response.get_json()['description']
+
+
+def test_unchanged_listing_answers_304(client):
+    etag = client.get('/api/v1/books').headers['ETag']
+    assert client.get('/api/v1/books', headers={'If-None-Match': etag}).status_code == 304
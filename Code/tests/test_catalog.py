@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+import pytest
+from controllers import db
+from controllers.statistics import counters, reconcile_statistics
+from models import Book, BookNeighbour, BookRatingStats, BookRequest, IssuedBook, Rating, Section
+from tests.conftest import login, make_user
+
+DEPENDENTS = (Rating, IssuedBook, BookRequest, BookRatingStats)
+
+
+@pytest.fixture
+def library(app):
+    # Two sections of two books, each book rated, issued and requested, and
+    # every book listed as a neighbour of every other.
+    make_user(app, 'admin', is_admin=True)
+    readers = [make_user(app, f'reader{number}') for number in range(2)]
+    sections = {}
+    with app.app_context():
+        books = []
+        for section_name in ('Doomed', 'Kept'):
+            section = Section(name=section_name, description='d')
+            db.session.add(section)
+            db.session.flush()
+            sections[section_name] = section.section_id
+            for number in range(2):
+                book = Book(name=f'{section_name} {number}', description='d', author='a',
+                            file_name=f'{section_name}-{number}.pdf', section_id=section.section_id)
+                db.session.add(book)
+                db.session.flush()
+                books.append(book.book_id)
+        due = datetime.now() + timedelta(days=7)
+        for book_id in books:
+            db.session.add_all([
+                Rating(user_id=readers[0], book_id=book_id, rating=4),
+                BookRatingStats(book_id=book_id, rating_count=1, rating_sum=4, avg_rating=4.0, stars_4=1),
+                IssuedBook(user_id=readers[0], book_id=book_id, return_date=due),
+                BookRequest(user_id=readers[1], book_id=book_id, return_date=due),
+            ])
+            db.session.add_all(BookNeighbour(book_id=book_id, rank=rank, neighbour_id=other, score=1.0)
+                               for rank, other in enumerate(other for other in books if other != book_id))
+        db.session.commit()
+        reconcile_statistics()
+    return login(app.test_client(), 'admin', admin=True), sections
+
+
+def row_counts():
+    return {model.__name__: model.query.count() for model in (Book, Section, BookNeighbour, *DEPENDENTS)}
+
+
+def test_deleting_a_section_removes_its_books_and_their_rows(app, library):
+    admin, sections = library
+    assert admin.post(f"/sections/{sections['Doomed']}/delete").status_code == 302
+    with app.app_context():
+        assert row_counts() == {'Book': 2, 'Section': 1, 'BookNeighbour': 2, 'Rating': 2, 'IssuedBook': 2,
+                                'BookRequest': 2, 'BookRatingStats': 2}
+        assert all(neighbour.neighbour_id in {book.book_id for book in Book.query}
+                   for neighbour in BookNeighbour.query)
+        assert counters() == {'books': 2, 'sections': 1, 'users': 3, 'issued_books': 2, 'requests': 2, 'ratings': 2}
+
+
+def test_deleting_a_book_keeps_the_counters_in_step(app, library):
+    admin, sections = library
+    with app.app_context():
+        book_id = db.session.scalar(db.select(Book.book_id).filter_by(section_id=sections['Kept']).limit(1))
+    assert admin.post(f'/book/{book_id}/delete').status_code == 302
+    with app.app_context():
+        assert row_counts() == {'Book': 3, 'Section': 2, 'BookNeighbour': 6, 'Rating': 3, 'IssuedBook': 3,
+                                'BookRequest': 3, 'BookRatingStats': 3}
+        totals = counters()
+        assert reconcile_statistics() == totals
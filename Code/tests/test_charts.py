@@ -0,0 +1,85 @@
+import os
+import pytest
+from controllers import db
+from controllers.page_cache import bump_catalog_version
+from models import Book, BookRatingStats, Section
+from tests.conftest import login, make_user, recorded_statements
+
+
+@pytest.fixture
+def admin(app):
+    make_user(app, 'admin', is_admin=True)
+    with app.app_context():
+        section = Section(name='Charts', description='Rated books')
+        db.session.add(section)
+        db.session.flush()
+        for number, rating in enumerate((4.5, 2.0)):
+            book = Book(name=f'Rated {number}', description='d', author='a', file_name=f'{number}.pdf',
+                        section_id=section.section_id)
+            db.session.add(book)
+            db.session.flush()
+            db.session.add(BookRatingStats(book_id=book.book_id, rating_count=2, rating_sum=rating * 2,
+                                           avg_rating=rating))
+        db.session.commit()
+    return login(app.test_client(), 'admin', admin=True)
+
+
+def finish_rendering(app):
+    with app.app_context():
+        pending = list(app.extensions['charts']['pending'].values())
+    for future in pending:
+        future.result(timeout=30)
+
+
+def chart_files(app):
+    return sorted(os.listdir(app.config['CHART_FOLDER']))
+
+
+def test_first_request_does_not_wait_for_the_render(app, admin):
+    response = admin.get('/admin/statistics/chart.png')
+    assert response.status_code == 202
+    assert response.headers['Retry-After']
+    finish_rendering(app)
+    response = admin.get('/admin/statistics/chart.png')
+    assert response.status_code == 302
+    chart = admin.get(response.headers['Location'])
+    assert chart.status_code == 200
+    assert chart.mimetype == 'image/png'
+    assert chart.data.startswith(b'\x89PNG')
+
+
+def test_chart_key_reads_no_ratings(app, admin):
+    admin.get('/admin/statistics/chart.png')
+    finish_rendering(app)
+    with recorded_statements(app) as statements:
+        assert admin.get('/admin/statistics/chart.png').status_code == 302
+    assert not any('book_rating_stats' in statement for statement in statements)
+
+
+def test_previous_chart_is_served_while_the_new_one_renders(app, admin):
+    admin.get('/admin/statistics/chart.png')
+    finish_rendering(app)
+    first = admin.get('/admin/statistics/chart.png').headers['Location']
+    with app.app_context():
+        bump_catalog_version()
+    assert admin.get('/admin/statistics/chart.png').headers['Location'] == first
+    finish_rendering(app)
+    second = admin.get('/admin/statistics/chart.png').headers['Location']
+    assert second != first
+    assert len(chart_files(app)) == 2
+
+
+def test_outdated_chart_that_was_pruned_is_not_rendered_again(app, admin):
+    admin.get('/admin/statistics/chart.png')
+    finish_rendering(app)
+    location = admin.get('/admin/statistics/chart.png').headers['Location']
+    for name in chart_files(app):
+        os.remove(os.path.join(app.config['CHART_FOLDER'], name))
+    assert admin.get(location).status_code == 202
+    finish_rendering(app)
+    assert admin.get(location).status_code == 200
+    with app.app_context():
+        bump_catalog_version()
+    for name in chart_files(app):
+        os.remove(os.path.join(app.config['CHART_FOLDER'], name))
+    assert admin.get(location).status_code == 404
@@ -0,0 +1,49 @@
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from controllers import create_app
+from tests.conftest import app_config
+
+
+def test_healthz(app):
+    response = app.test_client().get('/healthz')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'ok'}
+
+
+def test_readyz(app):
+    response = app.test_client().get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'ok'}
+
+
+def test_readyz_reports_a_missing_schema(tmp_path):
+    app = create_app(app_config(tmp_path, f"sqlite:///{tmp_path / 'empty.db'}"))
+    response = app.test_client().get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'schema'
+    assert 'book' in response.get_json()['missing']
+
+
+def test_readyz_reports_an_unreachable_database(tmp_path):
+    app = create_app(app_config(tmp_path, f"sqlite:///{tmp_path / 'missing' / 'site.db'}"))
+    response = app.test_client().get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json() == {'status': 'unavailable', 'error': 'OperationalError'}
+    assert app.test_client().get('/healthz').status_code == 200
+
+
+def test_create_app_opens_no_connections_and_starts_no_threads(tmp_path):
+    connections = []
+
+    def record(dbapi_connection, connection_record):
+        connections.append(dbapi_connection)
+
+    event.listen(Engine, 'connect', record)
+    threads = threading.active_count()
+    try:
+        create_app(app_config(tmp_path, f"sqlite:///{tmp_path / 'site.db'}"))
+    finally:
+        event.remove(Engine, 'connect', record)
+    assert connections == []
+    assert threading.active_count() == threads
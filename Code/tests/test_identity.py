@@ -0,0 +1,63 @@
+import pytest
+from controllers import db
+from models import User
+from tests.conftest import login, make_user, recorded_statements, same_database
+
+
+@pytest.fixture
+def admin_client(app):
+    # Versions are re-read only when a test lets the interval run out.
+    app.config['CACHE_VERSION_INTERVAL'] = 60
+    make_user(app, 'boss', is_admin=True)
+    return login(app.test_client(), 'boss', admin=True)
+
+
+def test_cached_page_makes_no_queries(app, admin_client):
+    admin_client.get('/admin')
+    with recorded_statements(app) as statements:
+        assert admin_client.get('/admin').status_code == 200
+    assert statements == []
+
+
+def test_miss_then_hit(app, admin_client):
+    stats = app.extensions['identity_cache'].stats
+    before = dict(stats)
+    admin_client.get('/admin')
+    admin_client.get('/admin')
+    assert stats['misses'] - before['misses'] <= 1
+    assert stats['hits'] - before['hits'] >= 1
+
+
+def test_role_change_in_another_process(app, admin_client):
+    admin_client.get('/admin')
+    other = same_database(app)
+    with other.app_context():
+        user = User.query.filter_by(username='boss').one()
+        user.is_admin = False
+        db.session.commit()
+        other.extensions['identity_cache'].invalidate(user.user_id)
+    # Until this worker re-reads the versions it keeps the cached identity.
+    assert admin_client.get('/admin').status_code == 200
+    app.config['CACHE_VERSION_INTERVAL'] = 0
+    response = admin_client.get('/admin')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin/login')
+
+
+def test_delete_admin_command_logs_the_admin_out(app, admin_client):
+    result = same_database(app).test_cli_runner().invoke(
+        args=['delete_admin', '--email', 'boss@example.com', '--password', 'password1'])
+    assert "Admin 'boss' deleted successfully" in result.output
+    app.config['CACHE_VERSION_INTERVAL'] = 0
+    response = admin_client.get('/admin')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin/login')
+
+
+def test_invalidation_in_the_same_process_is_immediate(app, admin_client):
+    with app.app_context():
+        user = User.query.filter_by(username='boss').one()
+        user.is_admin = False
+        db.session.commit()
+        app.extensions['identity_cache'].invalidate(user.user_id)
+    assert admin_client.get('/admin').status_code == 302
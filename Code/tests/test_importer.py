@@ -0,0 +1,91 @@
+import json
+from controllers import db, importer
+from controllers.statistics import counters
+from controllers.utils import pdf_path
+from models import Book, Section
+
+
+def write_manifest(folder, rows):
+    # One PDF per row, named after the book, next to a JSON lines manifest.
+    folder.mkdir(exist_ok=True)
+    with open(folder / 'books.jsonl', 'w') as manifest:
+        for name in rows:
+            (folder / f'{name}.pdf').write_bytes(b'%PDF-1.4 ' + name.encode())
+            manifest.write(json.dumps({'name': name, 'description': f'About {name}', 'author': 'Author',
+                                       'section': 'Imported', 'pdf': f'{name}.pdf'}) + '\n')
+    return str(folder / 'books.jsonl')
+
+
+def import_catalog(app, manifest, *args):
+    result = app.test_cli_runner().invoke(args=['import-catalog', manifest, *args])
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_import_catalog_copies_pdfs(app, tmp_path):
+    manifest = write_manifest(tmp_path / 'manifest', ['alpha', 'beta'])
+    result = import_catalog(app, manifest, '--workers', '2')
+    assert 'Imported 2 books (0 skipped, 1 new sections)' in result.output
+    with app.app_context():
+        books = Book.query.order_by(Book.name).all()
+        assert [book.name for book in books] == ['alpha', 'beta']
+        assert Section.query.one().name == 'Imported'
+        for book in books:
+            with open(pdf_path(book.file_name), 'rb') as pdf:
+                assert pdf.read() == b'%PDF-1.4 ' + book.name.encode()
+        assert counters()['books'] == 2
+        assert counters()['sections'] == 1
+
+
+def test_interrupted_import_resumes_after_the_last_committed_batch(app, tmp_path, monkeypatch):
+    manifest = write_manifest(tmp_path / 'manifest', ['a', 'b', 'c', 'd', 'e'])
+    prepare_row = importer.prepare_row
+
+    def crash_on_row_3(manifest_path, number, record):
+        if number == 3:
+            raise RuntimeError('disk unplugged')
+        return prepare_row(manifest_path, number, record)
+
+    monkeypatch.setattr(importer, 'prepare_row', crash_on_row_3)
+    result = app.test_cli_runner().invoke(args=['import-catalog', manifest, '--batch-size', '2'])
+    assert isinstance(result.exception, RuntimeError)
+    monkeypatch.setattr(importer, 'prepare_row', prepare_row)
+
+    result = import_catalog(app, manifest, '--batch-size', '2')
+    assert 'Resuming after row 2.' in result.output
+    with app.app_context():
+        assert [name for name, in db.session.query(Book.name).order_by(Book.name)] == ['a', 'b', 'c', 'd', 'e']
+        assert counters()['books'] == 5
+
+
+def test_crash_after_a_commit_does_not_import_the_batch_twice(app, tmp_path, monkeypatch):
+    # The checkpoint is part of the batch's transaction, so there is no
+    # window between committing the books and recording them as done.
+    manifest = write_manifest(tmp_path / 'manifest', ['a', 'b', 'c', 'd', 'e'])
+    with app.app_context():
+        commit = db.session.commit
+        commits = []
+
+        def crash_after_second_batch():
+            commit()
+            commits.append(1)
+            if len(commits) == 2:
+                raise RuntimeError('killed')
+
+        monkeypatch.setattr(db.session, 'commit', crash_after_second_batch)
+        result = app.test_cli_runner().invoke(args=['import-catalog', manifest, '--batch-size', '2'])
+        assert isinstance(result.exception, RuntimeError)
+        monkeypatch.undo()
+
+    assert 'Resuming after row 4.' in import_catalog(app, manifest, '--batch-size', '2').output
+    with app.app_context():
+        assert [name for name, in db.session.query(Book.name).order_by(Book.name)] == ['a', 'b', 'c', 'd', 'e']
+
+
+def test_finished_import_is_not_repeated_unless_restarted(app, tmp_path):
+    manifest = write_manifest(tmp_path / 'manifest', ['a', 'b'])
+    import_catalog(app, manifest)
+    assert 'Imported 0 books' in import_catalog(app, manifest).output
+    assert 'Imported 2 books' in import_catalog(app, manifest, '--restart').output
+    with app.app_context():
+        assert Book.query.count() == 4
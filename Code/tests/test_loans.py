@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from controllers import db
+from models import Book, BookRequest, IssuedBook, Section
+from tests.conftest import login, make_user
+
+EXPIRY_RUNS = 'task_duration_seconds_count{task="expire_loans"'
+
+
+def add_loans(app):
+    # Two loans past their return date and one still running.
+    reader_id = make_user(app, 'reader')
+    with app.app_context():
+        section = Section(name='Loans', description='Issued books')
+        db.session.add(section)
+        db.session.flush()
+        for days in (-2, -1, 3):
+            book = Book(name=f'Due {days}', description='d', author='a', file_name=f'{days}.pdf',
+                        section_id=section.section_id)
+            db.session.add(book)
+            db.session.flush()
+            db.session.add(IssuedBook(user_id=reader_id, book_id=book.book_id,
+                                      return_date=datetime.now() + timedelta(days=days)))
+        db.session.commit()
+
+
+def scrape(app, series):
+    response = app.test_client().get('/metrics', headers={'Authorization': 'Bearer scraper'})
+    assert response.status_code == 200
+    values = [float(line.rsplit(' ', 1)[1]) for line in response.text.splitlines() if line.startswith(series)]
+    return sum(values)
+
+
+def test_expired_loans_are_exported_as_metrics(app):
+    app.config['METRICS_TOKEN'] = 'scraper'
+    # The first request runs the periodic expiry, before the loans exist.
+    expired, runs = scrape(app, 'loans_expired_total{'), scrape(app, EXPIRY_RUNS)
+    add_loans(app)
+    result = app.test_cli_runner().invoke(args=['expire-loans'])
+    assert result.output.startswith('Expired 2 issued books in ')
+    assert scrape(app, 'loans_expired_total{') == expired + 2
+    assert scrape(app, EXPIRY_RUNS) == runs + 1
+    with app.app_context():
+        assert IssuedBook.query.count() == 1
+
+
+def test_approving_a_request_for_an_issued_book_removes_it(app):
+    make_user(app, 'admin', is_admin=True)
+    reader_id = make_user(app, 'reader')
+    with app.app_context():
+        section = Section(name='Loans', description='Issued books')
+        db.session.add(section)
+        db.session.flush()
+        book = Book(name='Issued', description='d', author='a', file_name='issued.pdf', section_id=section.section_id)
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(IssuedBook(user_id=reader_id, book_id=book.book_id,
+                                  return_date=datetime.now() + timedelta(days=7)))
+        request = BookRequest(user_id=reader_id, book_id=book.book_id, return_date=datetime.now() + timedelta(days=7))
+        db.session.add(request)
+        db.session.commit()
+        request_id = request.request_id
+
+    admin = login(app.test_client(), 'admin', admin=True)
+    response = admin.get(f'/admin/requests/{request_id}/approve', follow_redirects=True)
+    assert response.status_code == 200
+    assert b'the book is already issued to this user' in response.data
+    with app.app_context():
+        assert db.session.get(BookRequest, request_id) is None
+        assert IssuedBook.query.filter_by(user_id=reader_id).count() == 1
+    response = admin.get(f'/admin/requests/{request_id}/approve', follow_redirects=True)
+    assert b'Request not found' in response.data
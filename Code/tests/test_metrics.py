@@ -0,0 +1,32 @@
+import pytest
+
+TOKEN = {'Authorization': 'Bearer scraper'}
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/metrics/slow_queries'])
+def test_metrics_are_closed_without_a_token(app, path):
+    client = app.test_client()
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={'Authorization': 'Bearer '}).status_code == 403
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/metrics/slow_queries'])
+def test_metrics_need_the_configured_token(app, path):
+    app.config['METRICS_TOKEN'] = 'scraper'
+    client = app.test_client()
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={'Authorization': 'Bearer guess'}).status_code == 403
+    assert client.get(path, headers={'Authorization': 'scraper'}).status_code == 403
+    assert client.get(path, headers=TOKEN).status_code == 200
+
+
+def test_metrics_exposition(app):
+    app.config['METRICS_TOKEN'] = 'scraper'
+    client = app.test_client()
+    client.get('/login')
+    response = client.get('/metrics', headers=TOKEN)
+    assert response.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    assert '# TYPE http_request_duration_seconds histogram' in response.text
+    assert any(line.startswith('http_requests_total{endpoint="auth.login",method="GET",status="200",pid=')
+               for line in response.text.splitlines())
+    assert isinstance(client.get('/metrics/slow_queries', headers=TOKEN).get_json(), list)
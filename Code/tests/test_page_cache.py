@@ -0,0 +1,62 @@
+import pytest
+from controllers import db
+from controllers.page_cache import bump_catalog_version, page_cache_stats
+from models import Section
+from tests.conftest import login, make_user, same_database
+
+
+@pytest.fixture
+def reader(app):
+    app.config['CACHE_VERSION_INTERVAL'] = 60
+    make_user(app, 'reader')
+    with app.app_context():
+        db.session.add(Section(name='Poetry', description='Verse'))
+        db.session.commit()
+    return login(app.test_client(), 'reader')
+
+
+def test_repeat_visits_are_served_from_the_cache(reader):
+    hits, misses = page_cache_stats['hits'], page_cache_stats['misses']
+    first = reader.get('/sections')
+    second = reader.get('/sections')
+    assert (page_cache_stats['hits'], page_cache_stats['misses']) == (hits + 1, misses + 1)
+    assert second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert 'private' in second.headers['Cache-Control']
+
+
+def test_unchanged_page_answers_304(reader):
+    etag = reader.get('/sections').headers['ETag']
+    response = reader.get('/sections', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_catalog_change_invalidates_the_page(app, reader):
+    make_user(app, 'admin', is_admin=True)
+    etag = reader.get('/sections').headers['ETag']
+    admin = login(app.test_client(), 'admin', admin=True)
+    admin.post('/sections/new', data={'section_name': 'Drama', 'description': 'Plays'})
+    response = reader.get('/sections', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Drama' in response.data
+
+
+def test_change_in_another_process_is_seen_within_the_interval(app, reader):
+    assert b'Drama' not in reader.get('/sections').data
+    other = same_database(app)
+    with other.app_context():
+        db.session.add(Section(name='Drama', description='Plays'))
+        db.session.commit()
+        bump_catalog_version()
+    assert b'Drama' not in reader.get('/sections').data
+    app.config['CACHE_VERSION_INTERVAL'] = 0
+    assert b'Drama' in reader.get('/sections').data
+
+
+def test_pages_with_flashed_messages_are_not_cached(app, reader):
+    make_user(app, 'admin', is_admin=True)
+    admin = login(app.test_client(), 'admin', admin=True)
+    admin.post('/sections/new', data={'section_name': 'Drama', 'description': 'Plays'})
+    assert b'Section created successfully' in admin.get('/admin').data
+    assert b'Section created successfully' not in admin.get('/admin').data
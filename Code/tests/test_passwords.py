@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import Future
+import pytest
+from controllers import db
+from controllers.passwords import hash_rounds
+from models import User
+from tests.conftest import make_user
+
+
+class StalledPool:
+    # Stands in for the bcrypt process pool; no hash ever finishes.
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, func, *args):
+        self.submitted += 1
+        return Future()
+
+
+@pytest.fixture
+def pool(app):
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=1, PASSWORD_HASH_TIMEOUT=0.01)
+    state = app.extensions['passwords']
+    state['executor'], state['slots'] = StalledPool(), threading.BoundedSemaphore(1)
+    return state
+
+
+def post_login(client, email, password='password1', address='10.0.0.1'):
+    return client.post('/login', data={'email': email, 'password': password}, environ_base={'REMOTE_ADDR': address})
+
+
+def test_hash_timeout_answers_503(app, pool):
+    make_user(app, 'reader')
+    response = post_login(app.test_client(), 'reader@example.com')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert pool['executor'].submitted == 1
+    # The slot is given back once the request stops waiting.
+    assert pool['slots'].acquire(blocking=False)
+
+
+def test_full_queue_answers_503_without_submitting(app, pool):
+    make_user(app, 'reader')
+    pool['slots'].acquire()
+    response = post_login(app.test_client(), 'reader@example.com')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert pool['executor'].submitted == 0
+
+
+def test_cli_hashes_inline(app, pool):
+    result = app.test_cli_runner().invoke(args=['create_admin', '--username', 'admin', '--email', 'admin@example.com',
+                                                '--password', 'password1'], input='password1\n')
+    assert "Admin 'admin' created successfully." in result.output
+    assert pool['executor'].submitted == 0
+
+
+def test_login_upgrades_weaker_hashes(app):
+    make_user(app, 'reader')
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+    assert post_login(app.test_client(), 'reader@example.com').status_code == 302
+    with app.app_context():
+        user = db.session.execute(db.select(User).filter_by(username='reader')).scalar_one()
+        assert hash_rounds(user.password) == 5
+    assert post_login(app.test_client(), 'reader@example.com').status_code == 302
+
+
+def test_login_attempts_are_limited_per_account(app):
+    app.config['LOGIN_ATTEMPTS'] = 2
+    make_user(app, 'reader')
+    client = app.test_client()
+    for address in ('10.0.0.1', '10.0.0.2'):
+        assert post_login(client, 'reader@example.com', 'wrong', address).status_code == 200
+    assert post_login(client, 'READER@example.com', address='10.0.0.3').status_code == 429
+    assert post_login(client, 'other@example.com', address='10.0.0.3').status_code == 200
+
+
+def test_login_attempts_are_limited_per_address(app):
+    app.config['LOGIN_ATTEMPTS'] = 2
+    make_user(app, 'reader')
+    client = app.test_client()
+    for email in ('first@example.com', 'second@example.com'):
+        assert post_login(client, email).status_code == 200
+    assert post_login(client, 'reader@example.com').status_code == 429
+    assert post_login(client, 'reader@example.com', address='10.0.0.2').status_code == 302
@@ -0,0 +1,90 @@
+import io
+import logging
+import os
+from concurrent.futures import Future
+import pytest
+from controllers import db
+from controllers.pdf_processing import queue_pdf_processing
+from controllers.utils import store_pdf_stream, thumbnail_path
+from models import Book, Section
+
+
+class HeldPool:
+    # Stands in for the processing pool; results arrive when the test says.
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, func, *args):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+
+def make_pdf(text):
+    import pymupdf
+
+    document = pymupdf.open()
+    document.new_page().insert_text((72, 72), text)
+    return document.tobytes()
+
+
+def add_book(app, content):
+    # Stores the PDF and a book using it, as the upload form does.
+    with app.test_request_context():
+        file_name, _ = store_pdf_stream(io.BytesIO(content))
+        section = Section.query.first()
+        if section is None:
+            section = Section(name='Uploads', description='d')
+            db.session.add(section)
+            db.session.flush()
+        db.session.add(Book(name='Upload', description='d', author='a', file_name=file_name,
+                            section_id=section.section_id))
+        db.session.commit()
+    return file_name
+
+
+def test_upload_is_processed_inline_without_workers(app):
+    file_name = add_book(app, make_pdf('Call me Ishmael.'))
+    with app.test_request_context():
+        assert queue_pdf_processing(file_name)
+        book = Book.query.filter_by(file_name=file_name).one()
+        assert book.page_count == 1
+        assert 'Ishmael' in book.body_text
+        assert os.path.exists(thumbnail_path(file_name))
+
+
+@pytest.fixture
+def pool(app):
+    app.config.update(PDF_PROCESSING_WORKERS=1, PDF_PROCESSING_QUEUE=2)
+    state = app.extensions['pdf_processing']
+    state['executor'] = HeldPool()
+    return state
+
+
+def test_full_queue_leaves_uploads_for_the_command(app, pool, caplog):
+    first, second, third = (add_book(app, f'%PDF-1.4 {number}'.encode()) for number in range(3))
+    with app.test_request_context():
+        assert queue_pdf_processing(first)
+        assert queue_pdf_processing(second)
+        assert queue_pdf_processing(first)
+        with caplog.at_level(logging.WARNING):
+            assert not queue_pdf_processing(third)
+        assert 'PDF processing queue full' in caplog.text
+    assert list(pool['pending']) == [first, second]
+    assert len(pool['executor'].futures) == 2
+
+    pool['executor'].futures[0].set_result({'page_count': 7, 'file_size': 10, 'body_text': 'text', 'thumbnail': False})
+    assert list(pool['pending']) == [second]
+    with app.test_request_context():
+        assert Book.query.filter_by(file_name=first).one().page_count == 7
+        assert queue_pdf_processing(third)
+    assert list(pool['pending']) == [second, third]
+
+
+def test_failed_extraction_frees_its_slot(app, pool):
+    file_name = add_book(app, b'%PDF-1.4 broken')
+    with app.test_request_context():
+        assert queue_pdf_processing(file_name)
+    pool['executor'].futures[0].set_exception(RuntimeError('not a PDF'))
+    assert pool['pending'] == {}
+    with app.app_context():
+        assert Book.query.filter_by(file_name=file_name).one().page_count is None
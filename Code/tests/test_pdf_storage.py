@@ -0,0 +1,56 @@
+import hashlib
+import io
+import os
+import time
+import pytest
+from controllers import db
+from controllers.utils import PdfChecksumMismatch, delete_pdf_file, pdf_path, store_pdf_stream
+from models import Book, Section
+
+PDF = b'%PDF-1.4 shared content'
+DIGEST = hashlib.sha256(PDF).hexdigest()
+
+
+def pdf_files(app):
+    return sorted(os.path.relpath(os.path.join(folder, name), app.config['PDF_FOLDER'])
+                  for folder, _, names in os.walk(app.config['PDF_FOLDER']) for name in names)
+
+
+def test_identical_uploads_share_one_blob(app):
+    with app.app_context():
+        first = store_pdf_stream(io.BytesIO(PDF))
+        second = store_pdf_stream(io.BytesIO(PDF), expected_sha256=DIGEST.upper())
+    assert first == (f'{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}.pdf', len(PDF))
+    assert second == (first[0], 0)
+    assert pdf_files(app) == [os.path.join(DIGEST[:2], DIGEST[2:4], f'{DIGEST}.pdf')]
+
+
+def test_checksum_mismatch_keeps_nothing(app):
+    with app.app_context(), pytest.raises(PdfChecksumMismatch):
+        store_pdf_stream(io.BytesIO(PDF), expected_sha256='0' * 64)
+    assert pdf_files(app) == []
+
+
+def test_blob_is_deleted_once_no_book_uses_it(app):
+    with app.app_context():
+        file_name, _ = store_pdf_stream(io.BytesIO(PDF))
+        section = Section(name='Shared', description='d')
+        db.session.add(section)
+        db.session.flush()
+        book = Book(name='Copy', description='d', author='a', file_name=file_name, section_id=section.section_id)
+        db.session.add(book)
+        db.session.commit()
+        assert delete_pdf_file(file_name)
+        assert os.path.exists(pdf_path(file_name))
+        db.session.delete(book)
+        db.session.commit()
+        assert delete_pdf_file(file_name)
+        assert not os.path.exists(pdf_path(file_name))
+
+
+def test_blob_reused_after_the_deletion_was_queued_is_kept(app):
+    with app.app_context():
+        queued_at = time.time() - 60
+        file_name, _ = store_pdf_stream(io.BytesIO(PDF))
+        assert delete_pdf_file(file_name, queued_at)
+        assert os.path.exists(pdf_path(file_name))
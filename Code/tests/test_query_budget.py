@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import g
+from controllers import db
+from controllers.query_guard import QueryBudgetExceeded
+from models import Book, BookRequest, IssuedBook, Rating, Section, User
+from tests.conftest import login, make_user
+
+# The statements each page may issue, whatever the number of rows it lists.
+# Going over means a lazy load or a per-row query crept into the view.
+BUDGETS = {
+    'general.home': 4,
+    'general.section': 4,
+    'general.book_detail': 5,
+    'admin.admin_requests': 5,
+}
+
+
+@pytest.fixture
+def guarded(app):
+    app.config.update(QUERY_GUARD_ENABLED=True, QUERY_BUDGETS=BUDGETS, QUERY_BUDGET_RAISE=True,
+                      PAGE_CACHE_ENABLED=False)
+    return app
+
+
+def seed(app, books):
+    # `books` books in one section, each requested by one reader, issued to
+    # another and rated by both.
+    with app.app_context():
+        section = Section(name='Budget', description='Seeded by the query budget tests')
+        db.session.add(section)
+        db.session.flush()
+        readers = [User.query.filter_by(username=name).one() for name in ('reader', 'borrower')]
+        for i in range(books):
+            book = Book(name=f'Book {i}', description='A seeded book', author='Author', file_name='seed.pdf',
+                        section_id=section.section_id)
+            db.session.add(book)
+            db.session.flush()
+            db.session.add(BookRequest(user_id=readers[0].user_id, book_id=book.book_id,
+                                       return_date=datetime.now() + timedelta(days=7)))
+            db.session.add(IssuedBook(user_id=readers[1].user_id, book_id=book.book_id,
+                                      return_date=datetime.now() + timedelta(days=7)))
+            db.session.add_all([Rating(user_id=reader.user_id, book_id=book.book_id, rating=4) for reader in readers])
+        db.session.commit()
+        return section.section_id, book.book_id
+
+
+def statements(client, url, warm=False):
+    # With warm=True the page is loaded once first, so the identity and
+    # access caches are filled and only the view's own statements remain.
+    if warm:
+        client.get(url)
+    with client:
+        response = client.get(url)
+        assert response.status_code == 200
+        return g.query_count
+
+
+@pytest.fixture
+def clients(guarded):
+    make_user(guarded, 'reader')
+    make_user(guarded, 'borrower')
+    make_user(guarded, 'librarian', is_admin=True)
+    return {
+        'reader': login(guarded.test_client(), 'reader'),
+        'borrower': login(guarded.test_client(), 'borrower'),
+        'admin': login(guarded.test_client(), 'librarian', admin=True),
+    }
+
+
+PAGES = [
+    ('general.home', 'reader', lambda section_id, book_id: '/'),
+    ('general.section', 'reader', lambda section_id, book_id: f'/section/{section_id}'),
+    ('general.book_detail', 'borrower', lambda section_id, book_id: f'/book/{book_id}'),
+    ('admin.admin_requests', 'admin', lambda section_id, book_id: '/admin/requests'),
+]
+
+
+@pytest.mark.parametrize('endpoint, user, url', PAGES, ids=[page[0] for page in PAGES])
+def test_page_stays_within_budget(guarded, clients, endpoint, user, url):
+    # Cold caches: the worst case a page has to fit in.
+    section_id, book_id = seed(guarded, 3)
+    count = statements(clients[user], url(section_id, book_id))
+    assert 0 < count <= BUDGETS[endpoint]
+
+
+@pytest.mark.parametrize('endpoint, user, url', PAGES, ids=[page[0] for page in PAGES])
+def test_statements_do_not_grow_with_rows(guarded, clients, endpoint, user, url):
+    section_id, book_id = seed(guarded, 2)
+    few = statements(clients[user], url(section_id, book_id), warm=True)
+    with guarded.app_context():
+        # Move the extra books into the same section, so every page lists more rows.
+        extra_section, _ = seed(guarded, 15)
+        Book.query.filter_by(section_id=extra_section).update({Book.section_id: section_id})
+        db.session.commit()
+    many = statements(clients[user], url(section_id, book_id), warm=True)
+    assert many == few
+
+
+def test_header_reports_the_count(guarded, clients):
+    with clients['reader'] as client:
+        response = client.get('/')
+        assert response.headers['X-Query-Count'] == str(g.query_count)
+
+
+def test_over_budget_raises(guarded, clients):
+    guarded.config['QUERY_BUDGETS'] = {'general.home': 0}
+    with pytest.raises(QueryBudgetExceeded, match='general.home issued'):
+        clients['reader'].get('/')
+
+
+def test_over_budget_only_logs_without_raise(guarded, clients, caplog):
+    guarded.config.update(QUERY_BUDGETS={'general.home': 0}, QUERY_BUDGET_RAISE=False)
+    assert clients['reader'].get('/').status_code == 200
+    assert 'general.home issued' in caplog.text
+
+
+def test_guard_disabled_outside_debug(guarded, clients):
+    guarded.config.update(QUERY_GUARD_ENABLED=None, QUERY_BUDGETS={'general.home': 0})
+    response = clients['reader'].get('/')
+    assert response.status_code == 200
+    assert 'X-Query-Count' not in response.headers
+
+
+def test_loan_expiry_is_not_charged_to_the_page(guarded, clients):
+    section_id, _ = seed(guarded, 3)
+    url = f'/section/{section_id}'
+    count = statements(clients['reader'], url, warm=True)
+    guarded.config['LOAN_EXPIRY_INTERVAL'] = 0
+    assert statements(clients['reader'], url, warm=True) == count
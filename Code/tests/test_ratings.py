@@ -0,0 +1,51 @@
+import pytest
+from controllers import db, ratings
+from models import Book, BookRatingStats, Rating, Section
+from tests.conftest import login, make_user
+
+
+@pytest.fixture
+def book_id(app):
+    with app.app_context():
+        section = Section(name='Poetry', description='Verse')
+        db.session.add(section)
+        db.session.flush()
+        book = Book(name='Odes', description='d', author='a', file_name='odes.pdf', section_id=section.section_id)
+        db.session.add(book)
+        db.session.commit()
+        return book.book_id
+
+
+def rate(app, username, book_id, rating):
+    make_user(app, username)
+    client = login(app.test_client(), username)
+    return client.post(f'/rate_book/{book_id}', data={'rating': rating, 'feedback': 'fine'}, follow_redirects=True)
+
+
+def test_ratings_update_the_book_stats(app, book_id):
+    assert b'Book rated successfully' in rate(app, 'first', book_id, 5).data
+    assert b'Book rated successfully' in rate(app, 'second', book_id, 2).data
+    with app.app_context():
+        stats = db.session.get(BookRatingStats, book_id)
+        assert (stats.rating_count, stats.rating_sum, stats.avg_rating) == (2, 7, 3.5)
+        assert (stats.stars_2, stats.stars_5) == (1, 1)
+
+
+def test_concurrent_first_rating_falls_back_to_the_update(app, book_id, monkeypatch):
+    # Another reader's first rating commits the stats row after this request
+    # found none: the insert conflicts and the rating is added to that row.
+    rate(app, 'first', book_id, 4)
+    update_stats = ratings._update_stats
+    calls = []
+
+    def stale_update(*args):
+        calls.append(args)
+        return 0 if len(calls) == 1 else update_stats(*args)
+
+    monkeypatch.setattr(ratings, '_update_stats', stale_update)
+    assert b'Book rated successfully' in rate(app, 'second', book_id, 2).data
+    assert len(calls) == 2
+    with app.app_context():
+        assert Rating.query.filter_by(book_id=book_id).count() == 2
+        stats = db.session.get(BookRatingStats, book_id)
+        assert (stats.rating_count, stats.rating_sum, stats.stars_2, stats.stars_4) == (2, 6, 1, 1)
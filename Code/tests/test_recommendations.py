@@ -0,0 +1,67 @@
+import pytest
+from controllers import db
+from controllers.recommendations import similar_books
+from models import Book, BookNeighbour, Rating, Section
+from tests.conftest import make_user
+
+# Readers who like A like B, and none of them likes C as much.
+RATINGS = {'u1': (5, 5, 1), 'u2': (4, 4, 2), 'u3': (1, 2, 5)}
+
+
+@pytest.fixture
+def books(app):
+    readers = {name: make_user(app, name) for name in RATINGS}
+    with app.app_context():
+        section = Section(name='Rated', description='d')
+        db.session.add(section)
+        db.session.flush()
+        books = []
+        for name in 'ABC':
+            book = Book(name=name, description='d', author='a', file_name=f'{name}.pdf', section_id=section.section_id)
+            db.session.add(book)
+            db.session.flush()
+            books.append(book.book_id)
+        for reader, ratings in RATINGS.items():
+            db.session.add_all(Rating(user_id=readers[reader], book_id=book_id, rating=rating)
+                               for book_id, rating in zip(books, ratings))
+        db.session.commit()
+    return books
+
+
+def test_refresh_command_stores_the_neighbours(app, books):
+    a, b, c = books
+    result = app.test_cli_runner().invoke(args=['refresh-recommendations'])
+    assert result.output.startswith('Stored 2 neighbours for 3 books from 9 ratings')
+    with app.app_context():
+        assert [book_id for book_id, _ in similar_books(a)] == [b]
+        assert [book_id for book_id, _ in similar_books(b)] == [a]
+        assert similar_books(c) == []
+        assert BookNeighbour.query.count() == 2
+
+
+def test_periodic_refresh_runs_in_the_background_only_when_ratings_change(app, books):
+    a, b, _ = books
+    app.config['RECOMMENDATION_REFRESH_INTERVAL'] = 0
+    state = app.extensions['recommendations']
+
+    def refresh():
+        with app.test_request_context('/'):
+            app.preprocess_request()
+        state['thread'].join(timeout=30)
+
+    refresh()
+    assert state['built_from'] == (9, 9)
+    with app.app_context():
+        db.session.execute(db.delete(BookNeighbour))
+        db.session.commit()
+    refresh()
+    with app.app_context():
+        # Nothing was rated since, so the table was left alone.
+        assert BookNeighbour.query.count() == 0
+        reader = make_user(app, 'u4')
+        db.session.add(Rating(user_id=reader, book_id=a, rating=5))
+        db.session.commit()
+    refresh()
+    assert state['built_from'] == (10, 10)
+    with app.app_context():
+        assert [book_id for book_id, _ in similar_books(a)] == [b]
@@ -0,0 +1,74 @@
+import pytest
+from controllers import db, search
+from controllers.search import search_books, search_sections
+from models import Book, Section
+
+
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        section = Section(name='Astronomy', description='Stars and planets')
+        db.session.add(section)
+        db.session.flush()
+        for name, description, author in [
+            ('Cosmos', 'A tour of the universe', 'Carl Sagan'),
+            ('Pale Blue Dot', 'Cosmos seen from afar', 'Carl Sagan'),
+            ('Café Society', 'Evenings in Paris', 'Anaïs Leroy'),
+        ]:
+            db.session.add(Book(name=name, description=description, author=author, file_name=f'{name}.pdf',
+                                section_id=section.section_id))
+        db.session.commit()
+
+
+def names(books):
+    return [book.name for book in books]
+
+
+def test_title_matches_rank_first(app, catalog):
+    with app.test_request_context():
+        books, has_next = search_books('cosmos')
+        assert names(books) == ['Cosmos', 'Pale Blue Dot']
+        assert not has_next
+
+
+def test_prefixes_and_accents_match(app, catalog):
+    with app.test_request_context():
+        assert names(search_books('sag')[0]) == ['Cosmos', 'Pale Blue Dot']
+        assert names(search_books('cafe')[0]) == ['Café Society']
+        assert names(search_books('anais')[0]) == ['Café Society']
+        assert [section.name for section in search_sections('planet')[0]] == ['Astronomy']
+
+
+def test_query_syntax_is_not_interpreted(app, catalog):
+    with app.test_request_context():
+        assert search_books('cosmos NOT "tour')[0] == []
+        assert search_books('*')[0] == []
+
+
+def test_index_follows_changes(app, catalog):
+    with app.test_request_context():
+        search_books('cosmos')
+        book = db.session.execute(db.select(Book).filter_by(name='Cosmos')).scalar_one()
+        book.name = 'Contact'
+        db.session.commit()
+        assert names(search_books('contact')[0]) == ['Contact']
+        db.session.delete(book)
+        db.session.commit()
+        assert names(search_books('cosmos')[0]) == ['Pale Blue Dot']
+
+
+def test_pages(app, catalog):
+    with app.test_request_context():
+        books, has_next = search_books('carl', per_page=1)
+        assert len(books) == 1 and has_next
+        books, has_next = search_books('carl', page=2, per_page=1)
+        assert len(books) == 1 and not has_next
+
+
+def test_other_databases_fall_back_to_substring_matching(app, catalog, monkeypatch):
+    monkeypatch.setattr(search, 'fts_enabled', lambda: False)
+    with app.test_request_context():
+        assert names(search_books('blue do')[0]) == ['Pale Blue Dot']
+        assert names(search_books('COSMOS')[0]) == ['Cosmos', 'Pale Blue Dot']
+        with db.engine.connect() as connection:
+            assert connection.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = 'book_fts'")).first() is None
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+import pytest
+from controllers import db
+from controllers.statistics import adjust_counter, counters, reconcile_statistics, record_event
+from models import Section, StatCounter
+from tests.conftest import login, make_user
+
+
+@pytest.fixture
+def admin(app):
+    make_user(app, 'admin', is_admin=True)
+    return login(app.test_client(), 'admin', admin=True)
+
+
+def test_counters_follow_the_routes(app, admin):
+    admin.post('/sections/new', data={'section_name': 'Drama', 'description': 'Plays'})
+    with app.app_context():
+        assert counters()['sections'] == 1
+
+
+def test_reconcile_recounts_the_tables(app, admin):
+    with app.app_context():
+        db.session.add(Section(name='Unrecorded', description='Added without a counter'))
+        adjust_counter('requests', 5)
+        adjust_counter('import:manifest', 7)
+        db.session.commit()
+        assert reconcile_statistics() == {'books': 0, 'sections': 1, 'users': 1, 'issued_books': 0, 'requests': 0,
+                                          'ratings': 0}
+        # Rows other than the running totals are not counters of a table.
+        assert db.session.get(StatCounter, 'import:manifest').value == 7
+    result = app.test_cli_runner().invoke(args=['reconcile-statistics'])
+    assert 'sections: 1' in result.output
+
+
+def test_statistics_json(app, admin):
+    today = date.today()
+    with app.app_context():
+        record_event('approvals', 2)
+        record_event('approvals', 1, day=today - timedelta(days=2))
+        record_event('returns', 4, day=today - timedelta(days=10))
+        db.session.commit()
+    data = admin.get('/admin/statistics.json?days=3').get_json()
+    assert data['days'] == 3
+    assert data['daily']['approvals'] == [
+        {'day': (today - timedelta(days=2)).isoformat(), 'count': 1},
+        {'day': (today - timedelta(days=1)).isoformat(), 'count': 0},
+        {'day': today.isoformat(), 'count': 2},
+    ]
+    assert [day['count'] for day in data['daily']['returns']] == [0, 0, 0]
+    assert set(data['counters']) == {'books', 'sections', 'users', 'issued_books', 'requests', 'ratings'}
+    assert admin.get('/admin/statistics.json?days=100000').get_json()['days'] == app.config['STATISTICS_MAX_DAYS']
+
+
+def test_statistics_json_is_for_admins(app):
+    make_user(app, 'reader')
+    assert login(app.test_client(), 'reader').get('/admin/statistics.json').status_code == 302